@@ -1,15 +1,130 @@
+import logging
 import sqlite3
 import asyncio
 import json
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any, AsyncIterator
+from datetime import datetime, timedelta, timezone
+from enum import Enum
 import uuid
+from dataclasses import dataclass
 from .base import DatabaseManager
+from .clock import utc_now
 from models.admin_models import (
     UserActivityLog, SystemLog, AnalyticsData, ModerationAction, 
     ContentFlag, AdminUser, LogFilter, AnalyticsFilter
 )
 
+logger = logging.getLogger(__name__)
+
+USER_ACTIVITY_COLUMNS = (
+    "id", "user_id", "user_email", "activity_type", "description", "ip_address",
+    "user_agent", "metadata", "timestamp", "session_id"
+)
+SYSTEM_LOG_COLUMNS = ("id", "level", "component", "message", "stack_trace", "metadata", "timestamp")
+CONTENT_FLAG_COLUMNS = (
+    "id", "content_type", "content_id", "reporter_id", "reporter_email", "reason", "description",
+    "status", "timestamp"
+)
+MODERATION_ACTION_COLUMNS = (
+    "id", "admin_id", "admin_email", "target_type", "target_id", "action_type", "reason", "status",
+    "timestamp"
+)
+
+# Column order of the rows built by the bulk insert methods, per table
+INSERT_COLUMNS = {
+    "user_activity_logs": USER_ACTIVITY_COLUMNS,
+    "system_logs": SYSTEM_LOG_COLUMNS,
+    "content_flags": CONTENT_FLAG_COLUMNS,
+    "moderation_actions": MODERATION_ACTION_COLUMNS,
+}
+def _select_list(columns) -> str:
+    # metadata is read back as JSON text on both backends; PostgreSQL would otherwise hand out decoded jsonb
+    return ", ".join("CAST(metadata AS TEXT) AS metadata" if column == "metadata" else column for column in columns)
+
+SQLITE_INSERT_SQL = {
+    table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for table, columns in INSERT_COLUMNS.items()
+}
+
+@dataclass(slots=True, frozen=True)
+class UserActivityRow:
+    """Write-side user_activity_logs row; cheaper to build than UserActivityLog on the logging hot path"""
+    id: str
+    activity_type: Any
+    description: str
+    timestamp: datetime
+    user_id: Optional[str] = None
+    user_email: Optional[str] = None
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None
+
+@dataclass(slots=True, frozen=True)
+class SystemLogRow:
+    """Write-side system_logs row; cheaper to build than SystemLog on the logging hot path"""
+    id: str
+    level: Any
+    component: str
+    message: str
+    timestamp: datetime
+    stack_trace: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+# Indexes behind the ORDER BY timestamp DESC LIMIT n log/flag reads, as (name, table, columns).
+# Each costs a little on insert but turns full-table sorts into a short index range scan.
+ADMIN_INDEXES = (
+    ("idx_ual_ts", "user_activity_logs", "timestamp DESC"),
+    ("idx_ual_user_ts", "user_activity_logs", "user_id, timestamp DESC"),
+    ("idx_syslog_ts", "system_logs", "timestamp DESC"),
+    ("idx_syslog_level_ts", "system_logs", "level, timestamp DESC"),
+    ("idx_flags_status_ts", "content_flags", "status, timestamp DESC"),
+)
+
+# Dashboard counters, one scan per table. The Postgres form also defines dashboard_stats_mv.
+ANALYTICS_SNAPSHOT_KEY = "dashboard_stats"
+ANALYTICS_COUNTS_SQL_POSTGRES = '''
+    SELECT 1 AS id, p.*, m.*, a.*, u.*, s.*, NOW() AS refreshed_at
+    FROM (SELECT COUNT(*) AS total_patients,
+                 COUNT(*) FILTER (WHERE DATE(created_at) = CURRENT_DATE) AS patients_today
+          FROM patients) p
+    CROSS JOIN (SELECT COUNT(*) AS total_analyses,
+                       COUNT(*) FILTER (WHERE DATE(created_at) = CURRENT_DATE) AS analyses_today
+                FROM medical_records) m
+    CROSS JOIN (SELECT COUNT(*) AS total_appointments,
+                       COUNT(*) FILTER (WHERE DATE(created_at) = CURRENT_DATE) AS appointments_today
+                FROM appointments) a
+    CROSS JOIN (SELECT COUNT(DISTINCT user_id) FILTER (WHERE DATE(timestamp) = utc_today) AS active_users_today,
+                       COUNT(*) FILTER (WHERE activity_type = 'analysis_request') AS gemini_api_calls,
+                       COUNT(*) FILTER (WHERE activity_type = 'analysis_request'
+                                        AND DATE(timestamp) = utc_today) AS gemini_api_calls_today
+                FROM user_activity_logs, (SELECT (NOW() AT TIME ZONE 'UTC')::date AS utc_today) d) u
+    CROSS JOIN (SELECT COUNT(*) FILTER (WHERE level = 'error') AS error_logs,
+                       COUNT(*) AS total_logs
+                FROM system_logs) s
+'''
+ANALYTICS_COUNTS_SQL_SQLITE = '''
+    SELECT p.*, m.*, a.*, u.*, s.*
+    FROM (SELECT COUNT(*) AS total_patients,
+                 COUNT(CASE WHEN DATE(created_at) = :today THEN 1 END) AS patients_today
+          FROM patients) p,
+         (SELECT COUNT(*) AS total_analyses,
+                 COUNT(CASE WHEN DATE(created_at) = :today THEN 1 END) AS analyses_today
+          FROM medical_records) m,
+         (SELECT COUNT(*) AS total_appointments,
+                 COUNT(CASE WHEN DATE(created_at) = :today THEN 1 END) AS appointments_today
+          FROM appointments) a,
+         (SELECT COUNT(DISTINCT CASE WHEN DATE(timestamp) = :today THEN user_id END) AS active_users_today,
+                 COUNT(CASE WHEN activity_type = 'analysis_request' THEN 1 END) AS gemini_api_calls,
+                 COUNT(CASE WHEN activity_type = 'analysis_request'
+                            AND DATE(timestamp) = :today THEN 1 END) AS gemini_api_calls_today
+          FROM user_activity_logs) u,
+         (SELECT COUNT(CASE WHEN level = 'error' THEN 1 END) AS error_logs,
+                 COUNT(*) AS total_logs
+          FROM system_logs) s
+'''
+
 class AdminDatabaseManager:
     """Admin-specific database operations"""
     
@@ -18,22 +133,29 @@ class AdminDatabaseManager:
         # Get the database connection from the base manager
         if hasattr(base_manager, 'connection'):
             self.db = base_manager.connection  # SQLite uses 'connection'
+        elif hasattr(base_manager, 'pool'):
+            self.db = base_manager.pool  # PostgreSQL: queries acquire via _pg_connection, under the request cap
         elif hasattr(base_manager, 'db'):
-            self.db = base_manager.db  # PostgreSQL uses 'db'
+            self.db = base_manager.db
         elif hasattr(base_manager, '_db'):
             self.db = base_manager._db
         else:
             self.db = None
+        
+        # The backend never changes, so pick the timestamp binding once instead of per row
+        self._is_sqlite = isinstance(base_manager, SQLiteManager)
+        self._bind_timestamp = self._timestamp_as_text if self._is_sqlite else self._timestamp_as_utc
+        self._insert_rows = self._insert_rows_sqlite if self._is_sqlite else self._insert_rows_postgres
     
     async def create_admin_tables(self) -> bool:
         """Create admin-specific database tables"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
+            if self._is_sqlite:
                 return await self._create_sqlite_admin_tables()
             else:
                 return await self._create_postgres_admin_tables()
-        except Exception as e:
-            print(f"Error creating admin tables: {e}")
+        except Exception:
+            logger.exception("Error creating admin tables")
             return False
     
     async def _create_sqlite_admin_tables(self) -> bool:
@@ -127,18 +249,21 @@ class AdminDatabaseManager:
                 )
             ''')
             
+            for name, table, columns in ADMIN_INDEXES:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            
             self.db.commit()
             return True
             
-        except Exception as e:
-            print(f"Error creating SQLite admin tables: {e}")
+        except Exception:
+            logger.exception("Error creating SQLite admin tables")
             return False
     
     async def _create_postgres_admin_tables(self) -> bool:
         """Create admin tables in PostgreSQL"""
         try:
             # User Activity Logs
-            await self.db.execute('''
+            await self._pg_execute('''
                 CREATE TABLE IF NOT EXISTS user_activity_logs (
                     id TEXT PRIMARY KEY,
                     user_id TEXT,
@@ -154,7 +279,7 @@ class AdminDatabaseManager:
             ''')
             
             # System Logs
-            await self.db.execute('''
+            await self._pg_execute('''
                 CREATE TABLE IF NOT EXISTS system_logs (
                     id TEXT PRIMARY KEY,
                     level TEXT NOT NULL,
@@ -167,7 +292,7 @@ class AdminDatabaseManager:
             ''')
             
             # Admin Users
-            await self.db.execute('''
+            await self._pg_execute('''
                 CREATE TABLE IF NOT EXISTS admin_users (
                     id TEXT PRIMARY KEY,
                     email TEXT UNIQUE NOT NULL,
@@ -181,7 +306,7 @@ class AdminDatabaseManager:
             ''')
             
             # Moderation Actions
-            await self.db.execute('''
+            await self._pg_execute('''
                 CREATE TABLE IF NOT EXISTS moderation_actions (
                     id TEXT PRIMARY KEY,
                     admin_id TEXT NOT NULL,
@@ -197,7 +322,7 @@ class AdminDatabaseManager:
             ''')
             
             # Content Flags
-            await self.db.execute('''
+            await self._pg_execute('''
                 CREATE TABLE IF NOT EXISTS content_flags (
                     id TEXT PRIMARY KEY,
                     content_type TEXT NOT NULL,
@@ -213,7 +338,7 @@ class AdminDatabaseManager:
             ''')
             
             # Analytics Cache
-            await self.db.execute('''
+            await self._pg_execute('''
                 CREATE TABLE IF NOT EXISTS analytics_cache (
                     id TEXT PRIMARY KEY,
                     cache_key TEXT UNIQUE NOT NULL,
@@ -223,120 +348,159 @@ class AdminDatabaseManager:
                 )
             ''')
             
-            return True
-            
-        except Exception as e:
-            print(f"Error creating PostgreSQL admin tables: {e}")
+            # Pre-aggregated dashboard counters, refreshed by refresh_analytics_snapshot()
+            await self._pg_execute(
+                f"CREATE MATERIALIZED VIEW IF NOT EXISTS dashboard_stats_mv AS {ANALYTICS_COUNTS_SQL_POSTGRES}"
+            )
+            # A unique index is required for REFRESH ... CONCURRENTLY
+            await self._pg_execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_dashboard_stats_mv_id ON dashboard_stats_mv (id)"
+            )
+        except Exception:
+            logger.exception("Error creating PostgreSQL admin tables")
             return False
+        
+        # Built concurrently so existing deployments keep accepting log writes; only missing
+        # or INVALID indexes are (re)built, and a failed build is retried on the next startup
+        try:
+            async with self._pg_connection() as conn:
+                await self.base_manager._ensure_concurrent_indexes(
+                    conn, {name: f"ON {table} ({columns})" for name, table, columns in ADMIN_INDEXES}
+                )
+        except Exception:
+            logger.exception("Could not check admin indexes, will retry on next startup")
+        return True
     
-    async def log_user_activity(self, activity: UserActivityLog) -> bool:
+    async def log_user_activity(self, activity: UserActivityRow) -> bool:
         """Log user activity"""
+        return await self.log_user_activities([activity])
+    
+    async def log_user_activities(self, activities: List[UserActivityRow]) -> bool:
+        """Insert a batch of user activity logs in one transaction (COPY on PostgreSQL)"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute('''
-                    INSERT INTO user_activity_logs 
-                    (id, user_id, user_email, activity_type, description, ip_address, user_agent, metadata, timestamp, session_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    activity.id, activity.user_id, activity.user_email, activity.activity_type,
+            rows = [
+                (
+                    activity.id, activity.user_id, activity.user_email, self._bind_value(activity.activity_type),
                     activity.description, activity.ip_address, activity.user_agent,
-                    json.dumps(activity.metadata) if activity.metadata else None,
-                    activity.timestamp.isoformat(), activity.session_id
-                ))
-                self.db.commit()
-            else:
-                await self.db.execute('''
-                    INSERT INTO user_activity_logs 
-                    (id, user_id, user_email, activity_type, description, ip_address, user_agent, metadata, timestamp, session_id)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                ''', (
-                    activity.id, activity.user_id, activity.user_email, activity.activity_type,
-                    activity.description, activity.ip_address, activity.user_agent,
-                    json.dumps(activity.metadata) if activity.metadata else None,
-                    activity.timestamp, activity.session_id
-                ))
+                    self._bind_json(activity.metadata),
+                    self._bind_timestamp(activity.timestamp), activity.session_id
+                )
+                for activity in activities
+            ]
+            async with self._txn() as conn:
+                await self._insert_rows(conn, "user_activity_logs", rows)
             return True
-        except Exception as e:
-            print(f"Error logging user activity: {e}")
+        except Exception:
+            logger.exception("Error logging user activity")
             return False
     
-    async def log_system_event(self, log: SystemLog) -> bool:
+    async def log_system_event(self, log: SystemLogRow) -> bool:
         """Log system event"""
+        return await self.log_system_events([log])
+    
+    async def log_system_events(self, logs: List[SystemLogRow]) -> bool:
+        """Insert a batch of system logs in one transaction (COPY on PostgreSQL)"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute('''
-                    INSERT INTO system_logs 
-                    (id, level, component, message, stack_trace, metadata, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    log.id, log.level, log.component, log.message, log.stack_trace,
-                    json.dumps(log.metadata) if log.metadata else None,
-                    log.timestamp.isoformat()
-                ))
-                self.db.commit()
-            else:
-                await self.db.execute('''
-                    INSERT INTO system_logs 
-                    (id, level, component, message, stack_trace, metadata, timestamp)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ''', (
-                    log.id, log.level, log.component, log.message, log.stack_trace,
-                    json.dumps(log.metadata) if log.metadata else None,
-                    log.timestamp
-                ))
+            rows = [
+                (
+                    log.id, self._bind_value(log.level), log.component, log.message, log.stack_trace,
+                    self._bind_json(log.metadata),
+                    self._bind_timestamp(log.timestamp)
+                )
+                for log in logs
+            ]
+            async with self._txn() as conn:
+                await self._insert_rows(conn, "system_logs", rows)
+            return True
+        except Exception:
+            logger.exception("Error logging system event")
+            return False
+    
+    async def store_content_flags(self, flags: List[ContentFlag]) -> bool:
+        """Insert a batch of content flags in a single transaction (COPY on PostgreSQL)"""
+        try:
+            rows = [
+                (
+                    flag.id, flag.content_type, flag.content_id, flag.reporter_id, flag.reporter_email,
+                    flag.reason, flag.description, self._bind_value(flag.status), self._bind_timestamp(flag.timestamp)
+                )
+                for flag in flags
+            ]
+            async with self._txn() as conn:
+                await self._insert_rows(conn, "content_flags", rows)
+            return True
+        except Exception:
+            logger.exception("Error storing content flags")
+            return False
+    
+    async def _insert_moderation_actions(self, conn, actions: List[ModerationAction]) -> None:
+        rows = [
+            (
+                action.id, action.admin_id, action.admin_email, action.target_type, action.target_id,
+                action.action_type, action.reason, self._bind_value(action.status),
+                self._bind_timestamp(action.timestamp)
+            )
+            for action in actions
+        ]
+        await self._insert_rows(conn, "moderation_actions", rows)
+    
+    async def _set_flag_status(self, conn, flag_id: str, status: Any, admin_notes: Optional[str]) -> bool:
+        if self._is_sqlite:
+            cursor = conn.execute(
+                "UPDATE content_flags SET status = ?, admin_notes = ? WHERE id = ?",
+                (self._bind_value(status), admin_notes, flag_id)
+            )
+            return cursor.rowcount > 0
+        return await conn.fetchval(
+            "UPDATE content_flags SET status = $1, admin_notes = $2 WHERE id = $3 RETURNING id",
+            self._bind_value(status), admin_notes, flag_id
+        ) is not None
+    
+    async def moderate_flag(self, flag_id: str, status: Any, admin_notes: Optional[str],
+                            action: ModerationAction) -> bool:
+        """Update a flag and record the moderation action in one transaction; False if the flag does not exist"""
+        try:
+            async with self._txn() as conn:
+                if not await self._set_flag_status(conn, flag_id, status, admin_notes):
+                    return False
+                await self._insert_moderation_actions(conn, [action])
             return True
-        except Exception as e:
-            print(f"Error logging system event: {e}")
+        except Exception:
+            logger.exception("Error moderating flag")
             return False
     
     async def get_analytics_data(self, filter_params: AnalyticsFilter = None) -> AnalyticsData:
-        """Get system analytics data"""
+        """Get system analytics data, served from the pre-aggregated snapshot when available"""
         try:
-            today = datetime.now().date()
-            start_date = filter_params.start_date if filter_params else today
-            end_date = filter_params.end_date if filter_params else today
-            
-            # Get basic counts
-            total_users = await self._get_count("patients")
-            total_analyses = await self._get_count("medical_records")
-            total_appointments = await self._get_count("appointments")
-            total_patients = await self._get_count("patients")
-            
-            # Get today's counts
-            active_users_today = await self._get_count_today("user_activity_logs", "user_id")
-            analyses_today = await self._get_count_today("medical_records")
-            appointments_today = await self._get_count_today("appointments")
-            patients_today = await self._get_count_today("patients")
-            
-            # Get Gemini API calls
-            gemini_calls = await self._get_count_by_activity("analysis_request")
-            gemini_calls_today = await self._get_count_today_by_activity("analysis_request")
+            counts = None
+            if filter_params is None or (filter_params.start_date is None and filter_params.end_date is None):
+                counts = await self._read_analytics_snapshot()
+            if counts is None:
+                counts = await self._compute_analytics_counts()
             
             # Calculate system metrics
             system_uptime = await self._calculate_uptime()
             avg_response_time = await self._calculate_avg_response_time()
-            error_rate = await self._calculate_error_rate()
+            error_rate = (counts["error_logs"] / counts["total_logs"]) * 100 if counts["total_logs"] else 0.0
             
             return AnalyticsData(
-                total_users=total_users,
-                active_users_today=active_users_today,
-                total_analyses=total_analyses,
-                analyses_today=analyses_today,
-                total_appointments=total_appointments,
-                appointments_today=appointments_today,
-                total_patients=total_patients,
-                patients_today=patients_today,
+                total_users=counts["total_patients"],
+                active_users_today=counts["active_users_today"],
+                total_analyses=counts["total_analyses"],
+                analyses_today=counts["analyses_today"],
+                total_appointments=counts["total_appointments"],
+                appointments_today=counts["appointments_today"],
+                total_patients=counts["total_patients"],
+                patients_today=counts["patients_today"],
                 system_uptime=system_uptime,
                 average_response_time=avg_response_time,
                 error_rate=error_rate,
-                gemini_api_calls=gemini_calls,
-                gemini_api_calls_today=gemini_calls_today
+                gemini_api_calls=counts["gemini_api_calls"],
+                gemini_api_calls_today=counts["gemini_api_calls_today"]
             )
             
-        except Exception as e:
-            print(f"Error getting analytics data: {e}")
+        except Exception:
+            logger.exception("Error getting analytics data")
             return AnalyticsData(
                 total_users=0, active_users_today=0, total_analyses=0, analyses_today=0,
                 total_appointments=0, appointments_today=0, total_patients=0, patients_today=0,
@@ -344,83 +508,67 @@ class AdminDatabaseManager:
                 gemini_api_calls=0, gemini_api_calls_today=0
             )
     
-    async def _get_count(self, table: str) -> int:
-        """Get total count from table"""
-        try:
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                return cursor.fetchone()[0]
-            else:
-                result = await self.db.fetchval(f"SELECT COUNT(*) FROM {table}")
-                return result or 0
-        except Exception as e:
-            print(f"Error getting count from {table}: {e}")
-            return 0
-    
-    async def _get_count_today(self, table: str, date_column: str = "created_at") -> int:
-        """Get count from today"""
-        try:
-            today = datetime.now().date()
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE DATE({date_column}) = ?", (today,))
-                return cursor.fetchone()[0]
-            else:
-                result = await self.db.fetchval(
-                    f"SELECT COUNT(*) FROM {table} WHERE DATE({date_column}) = $1", 
-                    today
-                )
-                return result or 0
-        except Exception as e:
-            print(f"Error getting today's count from {table}: {e}")
-            return 0
+    async def _compute_analytics_counts(self) -> Dict[str, Any]:
+        """Aggregate the dashboard counters directly from the base tables"""
+        if self._is_sqlite:
+            cursor = self.db.cursor()
+            cursor.execute(ANALYTICS_COUNTS_SQL_SQLITE, {"today": utc_now().date().isoformat()})
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, cursor.fetchone()))
+        return dict(await self._pg_fetchrow(ANALYTICS_COUNTS_SQL_POSTGRES, bulk=True))
     
-    async def _get_count_by_activity(self, activity_type: str) -> int:
-        """Get count by activity type"""
+    async def _read_analytics_snapshot(self) -> Optional[Dict[str, Any]]:
+        """Latest pre-aggregated counters, or None if no fresh snapshot exists"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
+            if self._is_sqlite:
                 cursor = self.db.cursor()
-                cursor.execute("SELECT COUNT(*) FROM user_activity_logs WHERE activity_type = ?", (activity_type,))
-                return cursor.fetchone()[0]
-            else:
-                result = await self.db.fetchval(
-                    "SELECT COUNT(*) FROM user_activity_logs WHERE activity_type = $1", 
-                    activity_type
+                cursor.execute(
+                    "SELECT data FROM analytics_cache WHERE cache_key = ? AND expires_at > ?",
+                    (ANALYTICS_SNAPSHOT_KEY, utc_now().isoformat())
                 )
-                return result or 0
-        except Exception as e:
-            print(f"Error getting count by activity {activity_type}: {e}")
-            return 0
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+            else:
+                row = await self._pg_fetchrow("SELECT * FROM dashboard_stats_mv")
+                return dict(row) if row else None
+        except Exception:
+            logger.exception("Error reading analytics snapshot")
+            return None
     
-    async def _get_count_today_by_activity(self, activity_type: str) -> int:
-        """Get today's count by activity type"""
+    async def refresh_analytics_snapshot(self, ttl_seconds: int) -> bool:
+        """Recompute the dashboard counters.
+        
+        PostgreSQL refreshes dashboard_stats_mv without blocking readers; SQLite has no
+        materialized views, so the counters are stored in analytics_cache for ttl_seconds.
+        """
         try:
-            today = datetime.now().date()
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute(
-                    "SELECT COUNT(*) FROM user_activity_logs WHERE activity_type = ? AND DATE(timestamp) = ?",
-                    (activity_type, today)
-                )
-                return cursor.fetchone()[0]
+            if self._is_sqlite:
+                counts = await self._compute_analytics_counts()
+                now = utc_now()
+                self.db.execute('''
+                    INSERT INTO analytics_cache (id, cache_key, data, expires_at, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(cache_key) DO UPDATE SET
+                        data = excluded.data, expires_at = excluded.expires_at, created_at = excluded.created_at
+                ''', (
+                    str(uuid.uuid4()), ANALYTICS_SNAPSHOT_KEY, json.dumps(counts),
+                    (now + timedelta(seconds=ttl_seconds)).isoformat(), now.isoformat()
+                ))
+                self.db.commit()
             else:
-                result = await self.db.fetchval(
-                    "SELECT COUNT(*) FROM user_activity_logs WHERE activity_type = $1 AND DATE(timestamp) = $2",
-                    activity_type, today
-                )
-                return result or 0
-        except Exception as e:
-            print(f"Error getting today's count by activity {activity_type}: {e}")
-            return 0
+                await self._pg_execute("REFRESH MATERIALIZED VIEW CONCURRENTLY dashboard_stats_mv", bulk=True)
+            return True
+        except Exception:
+            logger.exception("Error refreshing analytics snapshot")
+            return False
     
     async def _calculate_uptime(self) -> float:
         """Calculate system uptime in hours"""
         try:
             # For now, return a mock value. In production, this would track actual uptime
             return 168.0  # 1 week
-        except Exception as e:
-            print(f"Error calculating uptime: {e}")
+        except Exception:
+            logger.exception("Error calculating uptime")
             return 0.0
     
     async def _calculate_avg_response_time(self) -> float:
@@ -428,51 +576,147 @@ class AdminDatabaseManager:
         try:
             # For now, return a mock value. In production, this would track actual response times
             return 0.5  # 500ms
-        except Exception as e:
-            print(f"Error calculating average response time: {e}")
+        except Exception:
+            logger.exception("Error calculating average response time")
             return 0.0
     
-    async def _calculate_error_rate(self) -> float:
-        """Calculate error rate percentage"""
-        try:
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute("SELECT COUNT(*) FROM system_logs WHERE level = 'error'")
-                error_count = cursor.fetchone()[0]
-                cursor.execute("SELECT COUNT(*) FROM system_logs")
-                total_count = cursor.fetchone()[0]
-            else:
-                error_count = await self.db.fetchval("SELECT COUNT(*) FROM system_logs WHERE level = 'error'")
-                total_count = await self.db.fetchval("SELECT COUNT(*) FROM system_logs")
-            
-            if total_count == 0:
-                return 0.0
-            return (error_count / total_count) * 100
-        except Exception as e:
-            print(f"Error calculating error rate: {e}")
-            return 0.0
+    @asynccontextmanager
+    async def _pg_connection(self, bulk: bool = False):
+        """PostgreSQL connection taken through the base manager, within the current request's connection cap"""
+        pool = self.base_manager.bulk_pool if bulk else None
+        async with self.base_manager._acquire(pool) as conn:
+            yield conn
     
-    async def get_recent_activities(self, limit: int = 10) -> List[UserActivityLog]:
-        """Get recent user activities"""
+    async def _pg_execute(self, query: str, *args, bulk: bool = False) -> str:
+        async with self._pg_connection(bulk) as conn:
+            return await conn.execute(query, *args)
+    
+    async def _pg_fetchrow(self, query: str, *args, bulk: bool = False) -> Any:
+        async with self._pg_connection(bulk) as conn:
+            return await conn.fetchrow(query, *args)
+    
+    async def _pg_fetch(self, query: str, *args, bulk: bool = False) -> List[Any]:
+        async with self._pg_connection(bulk) as conn:
+            return await conn.fetch(query, *args)
+    
+    @asynccontextmanager
+    async def _txn(self):
+        """Run several statements in one transaction, committed once at exit"""
+        if self._is_sqlite:
+            with self.db:
+                yield self.db
+        else:
+            async with self._pg_connection() as conn:
+                async with conn.transaction():
+                    yield conn
+    
+    async def _insert_rows_sqlite(self, conn, table: str, rows: List[tuple]) -> None:
+        conn.executemany(SQLITE_INSERT_SQL[table], rows)
+    
+    async def _insert_rows_postgres(self, conn, table: str, rows: List[tuple]) -> None:
+        await conn.copy_records_to_table(table, records=rows, columns=INSERT_COLUMNS[table])
+    
+    def _bind_json(self, value: Optional[Dict[str, Any]]) -> Any:
+        """JSON text for SQLite; PostgreSQL's jsonb codec encodes the dict itself"""
+        if not value:
+            return None
+        return json.dumps(value) if self._is_sqlite else value
+    
+    def _bind_value(self, value: Any) -> Any:
+        """Convert enums and datetimes into the form stored by the active backend"""
+        if isinstance(value, Enum):
+            return value.value
+        if isinstance(value, datetime):
+            return self._bind_timestamp(value)
+        return value
+    
+    @staticmethod
+    def _timestamp_as_utc(value: datetime) -> datetime:
+        """Log timestamps are stored as naive UTC; asyncpg binds datetimes natively"""
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    
+    @classmethod
+    def _timestamp_as_text(cls, value: datetime) -> str:
+        """SQLite stores timestamps as ISO text"""
+        return cls._timestamp_as_utc(value).isoformat()
+    
+    def _where_clause(self, filters: List[tuple]) -> tuple:
+        """Build a parameterized WHERE clause from (column, operator, value) triples, skipping None values"""
+        is_sqlite = self._is_sqlite
+        clauses, params = [], []
+        for column, operator, value in filters:
+            if value is None:
+                continue
+            params.append(self._bind_value(value))
+            placeholder = "?" if is_sqlite else f"${len(params)}"
+            clauses.append(f"{column} {operator} {placeholder}")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+    
+    def _limit_placeholder(self, position: int) -> str:
+        """Placeholder for the parameter at 1-based position"""
+        return "?" if self._is_sqlite else f"${position}"
+    
+    async def _fetch_rows(self, query: str, params: List[Any]) -> List[Any]:
+        """Run a read query against the active backend"""
+        if self._is_sqlite:
+            cursor = self.db.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        return await self._pg_fetch(query, *params)
+    
+    async def _iter_rows(self, query: str, params: List[Any], batch_size: int = 1000) -> AsyncIterator[Any]:
+        """Stream rows in batches without materializing the full result set"""
+        if self._is_sqlite:
+            cursor = self.db.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+                # Let other requests run between batches
+                await asyncio.sleep(0)
+        else:
+            # asyncpg cursors need a transaction; rows arrive prefetch at a time. Exports are
+            # long reads, so they hold a bulk pool connection rather than one for point queries
+            async with self._pg_connection(bulk=True) as conn:
+                async with conn.transaction():
+                    async for row in conn.cursor(query, *params, prefetch=batch_size):
+                        yield row
+    
+    def _user_activity_query(self, filter_params: LogFilter) -> tuple:
+        """SELECT for user_activity_logs matching the filter, newest first"""
+        where, params = self._where_clause([
+            ("timestamp", ">=", filter_params.start_date),
+            ("timestamp", "<", filter_params.end_date),
+            ("user_id", "=", filter_params.user_id),
+            ("activity_type", "=", filter_params.activity_type),
+        ])
+        query = f"SELECT {_select_list(USER_ACTIVITY_COLUMNS)} FROM user_activity_logs{where} ORDER BY timestamp DESC"
+        return query, params
+    
+    def _system_log_query(self, filter_params: LogFilter) -> tuple:
+        """SELECT for system_logs matching the filter, newest first"""
+        where, params = self._where_clause([
+            ("timestamp", ">=", filter_params.start_date),
+            ("timestamp", "<", filter_params.end_date),
+            ("level", "=", filter_params.level),
+            ("component", "=", filter_params.component),
+        ])
+        query = f"SELECT {_select_list(SYSTEM_LOG_COLUMNS)} FROM system_logs{where} ORDER BY timestamp DESC"
+        return query, params
+    
+    async def get_user_activities(self, filter_params: Optional[LogFilter] = None) -> List[UserActivityLog]:
+        """Get user activities matching the filter, newest first"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute('''
-                    SELECT id, user_id, user_email, activity_type, description, ip_address, 
-                           user_agent, metadata, timestamp, session_id
-                    FROM user_activity_logs 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (limit,))
-                rows = cursor.fetchall()
-            else:
-                rows = await self.db.fetch('''
-                    SELECT id, user_id, user_email, activity_type, description, ip_address, 
-                           user_agent, metadata, timestamp, session_id
-                    FROM user_activity_logs 
-                    ORDER BY timestamp DESC 
-                    LIMIT $1
-                ''', limit)
+            filter_params = filter_params or LogFilter()
+            query, params = self._user_activity_query(filter_params)
+            params.append(filter_params.limit)
+            rows = await self._fetch_rows(f"{query} LIMIT {self._limit_placeholder(len(params))}", params)
             
             activities = []
             for row in rows:
@@ -484,29 +728,17 @@ class AdminDatabaseManager:
                     session_id=row[9]
                 ))
             return activities
-        except Exception as e:
-            print(f"Error getting recent activities: {e}")
+        except Exception:
+            logger.exception("Error getting user activities")
             return []
     
-    async def get_recent_logs(self, limit: int = 10) -> List[SystemLog]:
-        """Get recent system logs"""
+    async def get_system_logs(self, filter_params: Optional[LogFilter] = None) -> List[SystemLog]:
+        """Get system logs matching the filter, newest first"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
-                cursor = self.db.cursor()
-                cursor.execute('''
-                    SELECT id, level, component, message, stack_trace, metadata, timestamp
-                    FROM system_logs 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (limit,))
-                rows = cursor.fetchall()
-            else:
-                rows = await self.db.fetch('''
-                    SELECT id, level, component, message, stack_trace, metadata, timestamp
-                    FROM system_logs 
-                    ORDER BY timestamp DESC 
-                    LIMIT $1
-                ''', limit)
+            filter_params = filter_params or LogFilter()
+            query, params = self._system_log_query(filter_params)
+            params.append(filter_params.limit)
+            rows = await self._fetch_rows(f"{query} LIMIT {self._limit_placeholder(len(params))}", params)
             
             logs = []
             for row in rows:
@@ -516,14 +748,66 @@ class AdminDatabaseManager:
                     timestamp=datetime.fromisoformat(row[6]) if isinstance(row[6], str) else row[6]
                 ))
             return logs
-        except Exception as e:
-            print(f"Error getting recent logs: {e}")
+        except Exception:
+            logger.exception("Error getting system logs")
             return []
     
+    def iter_user_activities(self, filter_params: LogFilter) -> AsyncIterator[Any]:
+        """Stream raw user activity rows (USER_ACTIVITY_COLUMNS order), ignoring the filter's limit"""
+        query, params = self._user_activity_query(filter_params)
+        return self._iter_rows(query, params)
+    
+    def iter_system_logs(self, filter_params: LogFilter) -> AsyncIterator[Any]:
+        """Stream raw system log rows (SYSTEM_LOG_COLUMNS order), ignoring the filter's limit"""
+        query, params = self._system_log_query(filter_params)
+        return self._iter_rows(query, params)
+    
+    async def get_realtime_counters(self, cutoff: datetime) -> Dict[str, int]:
+        """Count activities, logs and error logs since cutoff in a single query"""
+        try:
+            since = self._bind_value(cutoff)
+            if self._is_sqlite:
+                cursor = self.db.cursor()
+                cursor.execute('''
+                    SELECT
+                        (SELECT COUNT(*) FROM user_activity_logs WHERE timestamp >= ?),
+                        COUNT(*),
+                        COUNT(CASE WHEN level = 'error' THEN 1 END)
+                    FROM system_logs
+                    WHERE timestamp >= ?
+                ''', (since, since))
+                row = cursor.fetchone()
+            else:
+                row = await self._pg_fetchrow('''
+                    SELECT
+                        (SELECT COUNT(*) FROM user_activity_logs WHERE timestamp >= $1),
+                        COUNT(*),
+                        COUNT(*) FILTER (WHERE level = 'error')
+                    FROM system_logs
+                    WHERE timestamp >= $1
+                ''', since)
+            
+            return {
+                "activities": row[0] or 0,
+                "logs": row[1] or 0,
+                "error_logs": row[2] or 0
+            }
+        except Exception:
+            logger.exception("Error getting realtime counters")
+            return {"activities": 0, "logs": 0, "error_logs": 0}
+    
+    async def get_recent_activities(self, limit: int = 10) -> List[UserActivityLog]:
+        """Get recent user activities"""
+        return await self.get_user_activities(LogFilter(limit=limit))
+    
+    async def get_recent_logs(self, limit: int = 10) -> List[SystemLog]:
+        """Get recent system logs"""
+        return await self.get_system_logs(LogFilter(limit=limit))
+    
     async def get_pending_flags(self, limit: int = 10) -> List[ContentFlag]:
         """Get pending content flags"""
         try:
-            if isinstance(self.base_manager, SQLiteManager):
+            if self._is_sqlite:
                 cursor = self.db.cursor()
                 cursor.execute('''
                     SELECT id, content_type, content_id, reporter_id, reporter_email, 
@@ -535,7 +819,7 @@ class AdminDatabaseManager:
                 ''', (limit,))
                 rows = cursor.fetchall()
             else:
-                rows = await self.db.fetch('''
+                rows = await self._pg_fetch('''
                     SELECT id, content_type, content_id, reporter_id, reporter_email, 
                            reason, description, status, admin_notes, timestamp
                     FROM content_flags 
@@ -552,8 +836,8 @@ class AdminDatabaseManager:
                     admin_notes=row[8], timestamp=datetime.fromisoformat(row[9]) if isinstance(row[9], str) else row[9]
                 ))
             return flags
-        except Exception as e:
-            print(f"Error getting pending flags: {e}")
+        except Exception:
+            logger.exception("Error getting pending flags")
             return []
 
 # Import the SQLiteManager for type checking
@@ -1,7 +1,42 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from dataclasses import dataclass, field, fields
+from typing import List, Optional, Dict, Any, Mapping, Sequence
 from datetime import datetime
 
+# medical_records columns that get_records_group_counts may group by
+GROUPABLE_RECORD_COLUMNS = ("record_type", "modality", "diagnosis")
+# Scalar medical_records columns that get_medical_history_columns may project
+PROJECTABLE_RECORD_COLUMNS = (
+    "id", "patient_id", "record_type", "modality", "diagnosis", "image_path",
+    "confidence_score", "created_at", "updated_at"
+)
+
+@dataclass(slots=True, frozen=True)
+class Patient:
+    """Read-side patients row; smaller than a dict in the patient caches and read by attribute"""
+    id: str
+    email: str
+    name: str
+    phone: Optional[str] = None
+    date_of_birth: Any = None
+    gender: Optional[str] = None
+    address: Optional[str] = None
+    emergency_contact: Optional[str] = None
+    blood_type: Optional[str] = None
+    allergies: List[str] = field(default_factory=list)
+    created_at: Any = None
+    updated_at: Any = None
+    
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> "Patient":
+        """Build from a patients row (or its cached JSON form), ignoring unknown columns"""
+        values = {name: row[name] for name in PATIENT_FIELDS if name in row}
+        values['id'] = str(values['id'])
+        values['allergies'] = values.get('allergies') or []
+        return cls(**values)
+
+PATIENT_FIELDS = tuple(f.name for f in fields(Patient))
+
 class DatabaseManager(ABC):
     """Abstract base class for database operations"""
     
@@ -22,8 +57,8 @@ class DatabaseManager(ABC):
     
     # Patient operations
     @abstractmethod
-    async def create_patient(self, patient_data: Dict[str, Any]) -> str:
-        """Create a new patient record"""
+    async def create_patient_returning(self, patient_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert a patient and return the stored row; None if the email is already registered"""
         pass
     
     @abstractmethod
@@ -37,8 +72,23 @@ class DatabaseManager(ABC):
         pass
     
     @abstractmethod
-    async def update_patient(self, patient_id: str, patient_data: Dict[str, Any]) -> bool:
-        """Update patient information"""
+    async def get_patients_by_ids(self, patient_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several patients in one query, keyed by ID; unknown IDs are omitted"""
+        pass
+    
+    @abstractmethod
+    async def get_patients_by_emails(self, emails: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several patients in one query, keyed by email; unknown emails are omitted"""
+        pass
+    
+    @abstractmethod
+    async def update_patient_returning(self, patient_id: str, patient_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update the fields present in patient_data and return the new row; None if not found"""
+        pass
+    
+    @abstractmethod
+    async def delete_patient_returning(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a patient with its medical records; returns id, email and the deleted record_ids, None if not found"""
         pass
     
     @abstractmethod
@@ -48,23 +98,26 @@ class DatabaseManager(ABC):
     
     # Medical history operations
     @abstractmethod
-    async def add_medical_record(self, patient_id: str, record_data: Dict[str, Any]) -> str:
-        """Add a new medical record"""
+    async def add_medical_record(self, patient_id: str, record_data: Dict[str, Any]) -> Optional[str]:
+        """Add a new medical record; returns None if the patient does not exist"""
         pass
     
     @abstractmethod
-    async def get_medical_history(self, patient_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Retrieve patient's medical history"""
+    async def get_medical_history(self, patient_id: str, limit: int = 50, record_type: Optional[str] = None,
+                                  modality: Optional[str] = None, start: Optional[datetime] = None,
+                                  end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Retrieve patient's medical history, newest first, optionally within [start, end]"""
         pass
     
     @abstractmethod
-    async def get_medical_record(self, record_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve specific medical record"""
+    async def get_medical_history_columns(self, patient_id: str, columns: Sequence[str],
+                                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retrieve only the given columns of a patient's records, newest first"""
         pass
     
     @abstractmethod
-    async def update_medical_record(self, record_id: str, record_data: Dict[str, Any]) -> bool:
-        """Update medical record"""
+    async def get_medical_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve specific medical record"""
         pass
     
     @abstractmethod
@@ -72,6 +125,16 @@ class DatabaseManager(ABC):
         """Delete medical record"""
         pass
     
+    @abstractmethod
+    async def update_medical_record_returning(self, record_id: str, record_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update the fields present in record_data and return the new row; None if not found"""
+        pass
+    
+    @abstractmethod
+    async def delete_medical_record_returning(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a medical record and return its id, patient_id and image_path; None if not found"""
+        pass
+    
     # Search and analytics
     @abstractmethod
     async def search_patients(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
@@ -83,6 +146,22 @@ class DatabaseManager(ABC):
         """Get patient health statistics and trends"""
         pass
     
+    @abstractmethod
+    async def get_patient_stats_bundle(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Patient profile fields and record statistics together; None if the patient does not exist"""
+        pass
+    
+    @abstractmethod
+    async def get_patient_summary_bundle(self, patient_id: str, recent_limit: int = 5) -> Optional[Dict[str, Any]]:
+        """Patient row, most recent records and statistics together; None if the patient does not exist"""
+        pass
+    
+    @abstractmethod
+    async def get_records_group_counts(self, patient_id: str, column: str,
+                                       limit: Optional[int] = None) -> Dict[Any, int]:
+        """Count a patient's records per value of column, most frequent first"""
+        pass
+    
     @abstractmethod
     async def get_condition_history(self, patient_id: str, condition: str) -> List[Dict[str, Any]]:
         """Get history of specific condition"""
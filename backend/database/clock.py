@@ -0,0 +1,21 @@
+import time
+from datetime import datetime, timezone
+
+# (second, ISO string) of the last timestamp now_iso formatted
+_now_iso_cache = (0, "")
+
+def utc_now() -> datetime:
+    """Current time as naive UTC, the form every admin timestamp column stores.
+
+    One clock for all writes and windows: mixing local ``datetime.now()`` with UTC
+    shifts flags and log entries by the server's offset once they are compared.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def now_iso() -> str:
+    """Current UTC time as an ISO 8601 string at one-second resolution, formatted at most once a second"""
+    global _now_iso_cache
+    second = int(time.time())
+    if second != _now_iso_cache[0]:
+        _now_iso_cache = (second, datetime.fromtimestamp(second, timezone.utc).isoformat())
+    return _now_iso_cache[1]
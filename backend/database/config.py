@@ -1,11 +1,38 @@
+import logging
 import os
 from typing import Optional
 from .sqlite_manager import SQLiteManager
 from .postgres_manager import PostgresManager
 
+logger = logging.getLogger(__name__)
+
 class DatabaseConfig:
     """Database configuration and factory class"""
     
+    _shared_manager: Optional[SQLiteManager | PostgresManager] = None
+    
+    @classmethod
+    def get_shared_database_manager(cls) -> Optional[SQLiteManager | PostgresManager]:
+        """
+        Process-wide database manager shared by the service singletons, so
+        they draw from one connection/pool instead of opening their own
+        """
+        if cls._shared_manager is None:
+            cls._shared_manager = cls.get_database_manager()
+        return cls._shared_manager
+    
+    @classmethod
+    async def open_shared_database(cls) -> bool:
+        """Connect the shared manager (SQLite connection or asyncpg pool) once at application startup"""
+        return await cls.get_shared_database_manager().connect()
+    
+    @classmethod
+    async def close_shared_database(cls) -> bool:
+        """Close the shared manager after every service has shut down"""
+        if cls._shared_manager is None:
+            return True
+        return await cls._shared_manager.disconnect()
+    
     @staticmethod
     def get_database_manager() -> Optional[SQLiteManager | PostgresManager]:
         """
@@ -17,7 +44,7 @@ class DatabaseConfig:
         if db_type == "postgres":
             connection_string = os.getenv("DATABASE_URL")
             if not connection_string:
-                print("Warning: DATABASE_URL not set, falling back to SQLite")
+                logger.warning("DATABASE_URL not set, falling back to SQLite")
                 return SQLiteManager()
             return PostgresManager(connection_string)
         
@@ -26,7 +53,7 @@ class DatabaseConfig:
             return SQLiteManager(db_path)
         
         else:
-            print(f"Unknown database type: {db_type}, falling back to SQLite")
+            logger.warning("Unknown database type: %s, falling back to SQLite", db_type)
             return SQLiteManager()
     
     @staticmethod
@@ -0,0 +1,37 @@
+import secrets
+import time
+import uuid
+from typing import Any, Optional
+
+# State for monotonic ids generated within the same millisecond
+_last_ms = 0
+_counter = 0
+
+def new_id() -> str:
+    """Time-ordered UUIDv7 (RFC 9562) in canonical string form.
+
+    The leading 48 bits are the Unix time in milliseconds and the next 12 bits a
+    per-millisecond counter, so ids from one process sort in creation order and
+    inserts land on the right-most B-tree page instead of a random one.
+    """
+    global _last_ms, _counter
+    now_ms = time.time_ns() // 1_000_000
+    if now_ms > _last_ms:
+        # Random start leaves headroom in the 12-bit counter for this millisecond
+        _last_ms, _counter = now_ms, secrets.randbits(11)
+    else:
+        _counter += 1
+        if _counter > 0xFFF:
+            # Counter exhausted (or clock went backwards): borrow the next millisecond
+            _last_ms, _counter = _last_ms + 1, 0
+    value = (_last_ms << 80) | (0x7 << 76) | (_counter << 64) | (0b10 << 62) | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
+def parse_id(value: Any) -> Optional[str]:
+    """Canonical (lower-case, hyphenated) form of a UUID id, or None if value is not one"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    try:
+        return str(uuid.UUID(value))
+    except (AttributeError, TypeError, ValueError):
+        return None
@@ -1,9 +1,82 @@
+import logging
+import asyncio
 import asyncpg
-import json
-from typing import List, Optional, Dict, Any
+import orjson
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Dict, Any, Sequence, Set
 from datetime import datetime
 import uuid
-from .base import DatabaseManager
+from .base import DatabaseManager, GROUPABLE_RECORD_COLUMNS, PROJECTABLE_RECORD_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Connections one HTTP request may hold at once, set per request by the application middleware.
+# Without a cap a single summary page gathering several reads could take a large share of the pool.
+request_connection_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("request_connection_slots", default=None)
+
+# Searchable text of a patient row, indexed with pg_trgm
+PATIENT_SEARCH_EXPR = "(name || ' ' || email || ' ' || coalesce(phone, ''))"
+
+# Indexes added after tables were already in production. They are built with
+# CONCURRENTLY so writes continue, and only when missing or left INVALID by an
+# interrupted build; a startup with every index valid only reads the catalog.
+CONCURRENT_INDEXES = {
+    "idx_mr_patient_type_created": "ON medical_records (patient_id, record_type, created_at DESC)",
+    "idx_mr_patient_modality_created": "ON medical_records (patient_id, modality, created_at DESC) WHERE modality IS NOT NULL",
+    # Covers the projected id/modality/diagnosis reads and per-patient group counts
+    "idx_mr_patient_created_incl": "ON medical_records (patient_id, created_at DESC) INCLUDE (id, modality, diagnosis)",
+    # Trigram index so substring search probes the index instead of scanning patients
+    "idx_patients_search_trgm": f"ON patients USING gin ({PATIENT_SEARCH_EXPR} gin_trgm_ops)",
+}
+# Superseded by idx_mr_patient_created_incl
+OBSOLETE_INDEXES = ("idx_mr_patient_created",)
+
+# Hot lookups, prepared once per pooled connection
+PREPARED_QUERIES = {
+    "get_patient": "SELECT * FROM patients WHERE id = $1",
+    "get_patient_by_email": "SELECT * FROM patients WHERE email = $1",
+    "get_patients_by_ids": "SELECT * FROM patients WHERE id = ANY($1::uuid[])",
+    "get_patients_by_emails": "SELECT * FROM patients WHERE email = ANY($1::text[])",
+    # Must match the idx_patients_search_trgm expression for the planner to use the index
+    "search_patients": f"SELECT * FROM patients WHERE {PATIENT_SEARCH_EXPR} ILIKE '%' || $1 || '%' ORDER BY similarity(name, $1) DESC LIMIT $2",
+    "search_patients_plain": f"SELECT * FROM patients WHERE {PATIENT_SEARCH_EXPR} ILIKE '%' || $1 || '%' LIMIT $2",
+    "get_medical_record": "SELECT * FROM medical_records WHERE id = $1",
+}
+
+class PreparedConnection(asyncpg.Connection):
+    """asyncpg connection that carries its prepared statements"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = {}
+
+def _encode_jsonb(value: Any) -> bytes:
+    # Binary jsonb is a version byte followed by the JSON text
+    return b"\x01" + orjson.dumps(value)
+
+def _decode_jsonb(data: bytes) -> Any:
+    return orjson.loads(memoryview(data)[1:])
+
+async def _init_connection(conn: PreparedConnection):
+    """Pool init hook: exchange json/jsonb as Python values and prepare the hot lookups"""
+    # Binary codecs, so rows arrive decoded by orjson and COPY can write them too
+    await conn.set_type_codec("jsonb", schema="pg_catalog", encoder=_encode_jsonb, decoder=_decode_jsonb, format="binary")
+    await conn.set_type_codec("json", schema="pg_catalog", encoder=orjson.dumps, decoder=orjson.loads, format="binary")
+    for name, query in PREPARED_QUERIES.items():
+        try:
+            conn.prepared[name] = await conn.prepare(query)
+        except (asyncpg.UndefinedTableError, asyncpg.UndefinedFunctionError):
+            # Tables (and pg_trgm) are created after the pool opens; prepare lazily on first use
+            pass
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
 
 class PostgresManager(DatabaseManager):
     """PostgreSQL implementation of DatabaseManager"""
@@ -11,26 +84,51 @@ class PostgresManager(DatabaseManager):
     def __init__(self, connection_string: str):
         self.connection_string = connection_string
         self.pool = None
+        # Separate, smaller pool for searches and aggregates, so they cannot starve point lookups and writes
+        self.bulk_pool = None
+        # Set by create_tables once pg_trgm is known to be installed
+        self.has_trigram = False
     
     async def connect(self) -> bool:
         """Establish PostgreSQL connection pool"""
         try:
-            self.pool = await asyncpg.create_pool(self.connection_string)
+            if self.pool is not None:
+                return True
+            self.pool = await asyncpg.create_pool(
+                self.connection_string,
+                connection_class=PreparedConnection,
+                init=_init_connection,
+                min_size=int(os.getenv("DB_POOL_MIN_SIZE", "5")),
+                max_size=int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+                # Idle connections above min_size are closed after this many seconds
+                max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+            )
+            self.bulk_pool = await asyncpg.create_pool(
+                self.connection_string,
+                connection_class=PreparedConnection,
+                init=_init_connection,
+                min_size=1,
+                max_size=int(os.getenv("DB_BULK_POOL_MAX_SIZE", "5")),
+                max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+            )
             await self.create_tables()
             return True
-        except Exception as e:
-            print(f"PostgreSQL connection failed: {e}")
+        except Exception:
+            logger.exception("PostgreSQL connection failed")
             return False
     
     async def disconnect(self) -> bool:
         """Close PostgreSQL connection pool"""
         try:
+            if self.bulk_pool:
+                await self.bulk_pool.close()
+                self.bulk_pool = None
             if self.pool:
                 await self.pool.close()
                 self.pool = None
             return True
-        except Exception as e:
-            print(f"PostgreSQL disconnection failed: {e}")
+        except Exception:
+            logger.exception("PostgreSQL disconnection failed")
             return False
     
     async def create_tables(self) -> bool:
@@ -102,27 +200,107 @@ class PostgresManager(DatabaseManager):
                 await conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id)")
                 await conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appointment_date)")
                 
+                try:
+                    await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                    trigram_available = True
+                except asyncpg.PostgresError:
+                    logger.exception("pg_trgm unavailable, patient search will scan")
+                    trigram_available = False
+                
+                valid = await self._ensure_concurrent_indexes(
+                    conn,
+                    {name: definition for name, definition in CONCURRENT_INDEXES.items()
+                     if trigram_available or name != "idx_patients_search_trgm"},
+                    OBSOLETE_INDEXES
+                )
+                self.has_trigram = "idx_patients_search_trgm" in valid
+                
             return True
             
-        except Exception as e:
-            print(f"Table creation failed: {e}")
+        except Exception:
+            logger.exception("Table creation failed")
             return False
     
-    async def create_patient(self, patient_data: Dict[str, Any]) -> str:
-        """Create a new patient record"""
+    async def _ensure_concurrent_indexes(self, conn, indexes: Dict[str, str],
+                                         obsolete: Sequence[str] = ()) -> Set[str]:
+        """Build missing or INVALID indexes (name -> "ON table ..." definition) and drop obsolete ones.
+
+        A failed build (e.g. a lock timeout) is logged and left for the next startup
+        rather than failing table creation; returns the names of the indexes that are valid.
+        """
+        rows = await conn.fetch(
+            "SELECT c.relname, i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = ANY($1::text[]) AND pg_table_is_visible(c.oid)",
+            [*indexes, *obsolete]
+        )
+        existing = {row["relname"]: row["indisvalid"] for row in rows}
+        valid = set()
+        for name, definition in indexes.items():
+            if existing.get(name):
+                valid.add(name)
+                continue
+            try:
+                if name in existing:
+                    logger.warning("Rebuilding invalid index %s", name)
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                await conn.execute(f"CREATE INDEX CONCURRENTLY {name} {definition}")
+                valid.add(name)
+            except asyncpg.PostgresError:
+                logger.exception("Could not build index %s, will retry on next startup", name)
+        for name in obsolete:
+            if name in existing:
+                try:
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                except asyncpg.PostgresError:
+                    logger.exception("Could not drop index %s, will retry on next startup", name)
+        return valid
+    
+    @asynccontextmanager
+    async def _acquire(self, pool: Optional[asyncpg.Pool] = None):
+        """Connection from pool (the main pool by default), within the current request's connection cap"""
+        slots = request_connection_slots.get()
+        if slots is None:
+            async with (pool or self.pool).acquire() as conn:
+                yield conn
+            return
+        async with slots:
+            async with (pool or self.pool).acquire() as conn:
+                yield conn
+    
+    async def _fetchrow_prepared(self, name: str, *args):
+        """Run one of PREPARED_QUERIES using the connection's prepared statement"""
+        async with self._acquire() as conn:
+            return await (await self._prepared(conn, name)).fetchrow(*args)
+    
+    async def _fetch_prepared(self, name: str, *args, pool: Optional[asyncpg.Pool] = None):
+        """Like _fetchrow_prepared, returning every row"""
+        async with self._acquire(pool) as conn:
+            return await (await self._prepared(conn, name)).fetch(*args)
+    
+    @staticmethod
+    async def _prepared(conn: PreparedConnection, name: str):
+        stmt = conn.prepared.get(name)
+        if stmt is None:
+            stmt = conn.prepared[name] = await conn.prepare(PREPARED_QUERIES[name])
+        return stmt
+    
+    async def create_patient_returning(self, patient_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert a patient and return the stored row; None if the email is already registered"""
         try:
-            patient_id = str(uuid.uuid4())
             now = datetime.now()
             
-            async with self.pool.acquire() as conn:
-                await conn.execute("""
+            # Uniqueness is enforced by the insert itself, so there is no separate lookup to race with
+            async with self._acquire() as conn:
+                row = await conn.fetchrow("""
                     INSERT INTO patients (
                         id, email, name, phone, date_of_birth, gender, 
                         address, emergency_contact, blood_type, allergies, 
                         created_at, updated_at
                     ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                """, (
-                    patient_id,
+                    ON CONFLICT (email) DO NOTHING
+                    RETURNING *
+                """,
+                    str(uuid.uuid4()),
                     patient_data.get('email'),
                     patient_data.get('name'),
                     patient_data.get('phone'),
@@ -131,61 +309,107 @@ class PostgresManager(DatabaseManager):
                     patient_data.get('address'),
                     patient_data.get('emergency_contact'),
                     patient_data.get('blood_type'),
-                    json.dumps(patient_data.get('allergies', [])),
+                    patient_data.get('allergies', []),
                     now, now
-                ))
-                
-            return patient_id
+                )
+            
+            if row:
+                patient = dict(row)
+                patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+                return patient
+            return None
             
-        except Exception as e:
-            print(f"Patient creation failed: {e}")
+        except Exception:
+            logger.exception("Patient creation failed")
             raise
     
     async def get_patient(self, patient_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve patient by ID"""
         try:
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow("SELECT * FROM patients WHERE id = $1", patient_id)
-                
-                if row:
-                    patient = dict(row)
-                    patient['allergies'] = patient['allergies'] if patient['allergies'] else []
-                    return patient
-                return None
+            row = await self._fetchrow_prepared("get_patient", patient_id)
+            
+            if row:
+                patient = dict(row)
+                patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+                return patient
+            return None
                 
-        except Exception as e:
-            print(f"Patient retrieval failed: {e}")
+        except Exception:
+            logger.exception("Patient retrieval failed")
             return None
     
     async def get_patient_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Retrieve patient by email"""
         try:
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow("SELECT * FROM patients WHERE email = $1", email)
-                
-                if row:
-                    patient = dict(row)
-                    patient['allergies'] = patient['allergies'] if patient['allergies'] else []
-                    return patient
-                return None
+            row = await self._fetchrow_prepared("get_patient_by_email", email)
+            
+            if row:
+                patient = dict(row)
+                patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+                return patient
+            return None
                 
-        except Exception as e:
-            print(f"Patient retrieval by email failed: {e}")
+        except Exception:
+            logger.exception("Patient retrieval by email failed")
             return None
     
-    async def update_patient(self, patient_id: str, patient_data: Dict[str, Any]) -> bool:
-        """Update patient information"""
+    async def get_patients_by_ids(self, patient_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several patients in one query, keyed by ID; unknown IDs are omitted"""
+        # A malformed ID would fail the whole ANY($1::uuid[]) cast, so drop it up front
+        patient_ids = [patient_id for patient_id in patient_ids if _is_uuid(patient_id)]
+        patients = await self._get_patients_where("get_patients_by_ids", patient_ids)
+        return {str(patient['id']): patient for patient in patients}
+    
+    async def get_patients_by_emails(self, emails: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several patients in one query, keyed by email; unknown emails are omitted"""
+        patients = await self._get_patients_where("get_patients_by_emails", emails)
+        return {patient['email']: patient for patient in patients}
+    
+    async def _get_patients_where(self, query_name: str, values: Sequence[str]) -> List[Dict[str, Any]]:
+        if not values:
+            return []
         try:
-            now = datetime.now()
+            rows = await self._fetch_prepared(query_name, list(values))
             
-            async with self.pool.acquire() as conn:
-                result = await conn.execute("""
+            patients = []
+            for row in rows:
+                patient = dict(row)
+                patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+                patients.append(patient)
+            return patients
+            
+        except Exception:
+            logger.exception("Patient batch retrieval failed")
+            return []
+    
+    async def delete_patient(self, patient_id: str) -> bool:
+        """Delete patient record"""
+        try:
+            async with self._acquire() as conn:
+                result = await conn.execute("DELETE FROM patients WHERE id = $1", patient_id)
+            return result != "DELETE 0"
+            
+        except Exception:
+            logger.exception("Patient deletion failed")
+            return False
+    
+    async def update_patient_returning(self, patient_id: str, patient_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update the fields present in patient_data and return the new row; None if not found"""
+        try:
+            allergies = patient_data.get('allergies')
+            
+            # Fields missing from patient_data keep their current value
+            async with self._acquire() as conn:
+                row = await conn.fetchrow("""
                     UPDATE patients SET
-                        name = $1, phone = $2, date_of_birth = $3, gender = $4,
-                        address = $5, emergency_contact = $6, blood_type = $7, 
-                        allergies = $8, updated_at = $9
+                        name = COALESCE($1, name), phone = COALESCE($2, phone),
+                        date_of_birth = COALESCE($3, date_of_birth), gender = COALESCE($4, gender),
+                        address = COALESCE($5, address), emergency_contact = COALESCE($6, emergency_contact),
+                        blood_type = COALESCE($7, blood_type), allergies = COALESCE($8::jsonb, allergies),
+                        updated_at = $9
                     WHERE id = $10
-                """, (
+                    RETURNING *
+                """,
                     patient_data.get('name'),
                     patient_data.get('phone'),
                     patient_data.get('date_of_birth'),
@@ -193,71 +417,107 @@ class PostgresManager(DatabaseManager):
                     patient_data.get('address'),
                     patient_data.get('emergency_contact'),
                     patient_data.get('blood_type'),
-                    json.dumps(patient_data.get('allergies', [])),
-                    now, patient_id
-                ))
-                
-            return result != "UPDATE 0"
+                    allergies,
+                    datetime.now(), patient_id
+                )
             
-        except Exception as e:
-            print(f"Patient update failed: {e}")
-            return False
+            if row:
+                patient = dict(row)
+                patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+                return patient
+            return None
+            
+        except Exception:
+            logger.exception("Patient update failed")
+            raise
     
-    async def delete_patient(self, patient_id: str) -> bool:
-        """Delete patient record"""
+    async def delete_patient_returning(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a patient with its medical records; returns id, email and the deleted record_ids, None if not found"""
         try:
-            async with self.pool.acquire() as conn:
-                result = await conn.execute("DELETE FROM patients WHERE id = $1", patient_id)
-            return result != "DELETE 0"
+            # Records are deleted explicitly so their ids come back from the same statement;
+            # the ON DELETE CASCADE then finds nothing left to remove
+            async with self._acquire() as conn:
+                row = await conn.fetchrow("""
+                    WITH records AS (DELETE FROM medical_records WHERE patient_id = $1 RETURNING id),
+                         patient AS (DELETE FROM patients WHERE id = $1 RETURNING id, email)
+                    SELECT patient.id, patient.email, ARRAY(SELECT id FROM records) AS record_ids
+                    FROM patient
+                """, patient_id)
+            return dict(row) if row else None
             
-        except Exception as e:
-            print(f"Patient deletion failed: {e}")
-            return False
+        except Exception:
+            logger.exception("Patient deletion failed")
+            raise
     
-    async def add_medical_record(self, patient_id: str, record_data: Dict[str, Any]) -> str:
-        """Add a new medical record"""
+    async def add_medical_record(self, patient_id: str, record_data: Dict[str, Any]) -> Optional[str]:
+        """Add a new medical record; returns None if the patient does not exist"""
         try:
             record_id = str(uuid.uuid4())
             now = datetime.now()
             
-            async with self.pool.acquire() as conn:
-                await conn.execute("""
+            # Patient existence check and insert in one round-trip
+            async with self._acquire() as conn:
+                inserted_id = await conn.fetchval("""
+                    WITH p AS (SELECT id FROM patients WHERE id = $2)
                     INSERT INTO medical_records (
                         id, patient_id, record_type, modality, diagnosis,
                         symptoms, findings, recommendations, suggested_tests,
                         image_path, confidence_score, doctor_notes, created_at, updated_at
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
-                """, (
+                    )
+                    SELECT $1::uuid, p.id, $3::varchar, $4::varchar, $5::text, $6::jsonb, $7::text,
+                           $8::jsonb, $9::jsonb, $10::text, $11::numeric, $12::text,
+                           $13::timestamptz, $14::timestamptz
+                    FROM p
+                    RETURNING id
+                """,
                     record_id, patient_id,
                     record_data.get('record_type'),
                     record_data.get('modality'),
                     record_data.get('diagnosis'),
-                    json.dumps(record_data.get('symptoms', [])),
+                    record_data.get('symptoms', []),
                     record_data.get('findings'),
-                    json.dumps(record_data.get('recommendations', [])),
-                    json.dumps(record_data.get('suggested_tests', [])),
+                    record_data.get('recommendations', []),
+                    record_data.get('suggested_tests', []),
                     record_data.get('image_path'),
                     record_data.get('confidence_score'),
                     record_data.get('doctor_notes'),
                     now, now
-                ))
+                )
                 
-            return record_id
+            return str(inserted_id) if inserted_id else None
             
-        except Exception as e:
-            print(f"Medical record creation failed: {e}")
+        except Exception:
+            logger.exception("Medical record creation failed")
             raise
     
-    async def get_medical_history(self, patient_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Retrieve patient's medical history"""
+    async def get_medical_history(self, patient_id: str, limit: int = 50, record_type: Optional[str] = None,
+                                  modality: Optional[str] = None, start: Optional[datetime] = None,
+                                  end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Retrieve patient's medical history, optionally filtered by record type, modality and creation time"""
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
+            conditions = ["patient_id = $1"]
+            params = [patient_id]
+            if record_type:
+                params.append(record_type)
+                conditions.append(f"record_type = ${len(params)}")
+            if modality:
+                params.append(modality)
+                conditions.append(f"modality = ${len(params)}")
+            if start:
+                params.append(start)
+                conditions.append(f"created_at >= ${len(params)}")
+            if end:
+                params.append(end)
+                conditions.append(f"created_at <= ${len(params)}")
+            params.append(limit)
+            
+            async with self._acquire() as conn:
+                rows = await conn.fetch(f"""
                     SELECT * FROM medical_records 
-                    WHERE patient_id = $1 
+                    WHERE {' AND '.join(conditions)} 
                     ORDER BY created_at DESC 
-                    LIMIT $2
-                """, patient_id, limit)
+                    LIMIT ${len(params)}
+                """, *params)
                 
                 records = []
                 for row in rows:
@@ -269,129 +529,273 @@ class PostgresManager(DatabaseManager):
                 
                 return records
                 
-        except Exception as e:
-            print(f"Medical history retrieval failed: {e}")
+        except Exception:
+            logger.exception("Medical history retrieval failed")
+            return []
+    
+    async def get_medical_history_columns(self, patient_id: str, columns: Sequence[str],
+                                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retrieve only the given columns of a patient's records, newest first"""
+        invalid = [column for column in columns if column not in PROJECTABLE_RECORD_COLUMNS]
+        if invalid or not columns:
+            raise ValueError(f"Cannot project medical records onto {invalid or columns}")
+        try:
+            async with self._acquire() as conn:
+                rows = await conn.fetch(f"""
+                    SELECT {', '.join(columns)} FROM medical_records 
+                    WHERE patient_id = $1 
+                    ORDER BY created_at DESC 
+                    LIMIT $2
+                """, patient_id, limit)
+            return [dict(row) for row in rows]
+            
+        except Exception:
+            logger.exception("Medical history projection failed")
             return []
     
     async def get_medical_record(self, record_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve specific medical record"""
         try:
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow("SELECT * FROM medical_records WHERE id = $1", record_id)
-                
-                if row:
-                    record = dict(row)
-                    record['symptoms'] = record['symptoms'] if record['symptoms'] else []
-                    record['recommendations'] = record['recommendations'] if record['recommendations'] else []
-                    record['suggested_tests'] = record['suggested_tests'] if record['suggested_tests'] else []
-                    return record
-                return None
+            row = await self._fetchrow_prepared("get_medical_record", record_id)
+            
+            if row:
+                record = dict(row)
+                record['symptoms'] = record['symptoms'] if record['symptoms'] else []
+                record['recommendations'] = record['recommendations'] if record['recommendations'] else []
+                record['suggested_tests'] = record['suggested_tests'] if record['suggested_tests'] else []
+                return record
+            return None
                 
-        except Exception as e:
-            print(f"Medical record retrieval failed: {e}")
+        except Exception:
+            logger.exception("Medical record retrieval failed")
             return None
     
-    async def update_medical_record(self, record_id: str, record_data: Dict[str, Any]) -> bool:
-        """Update medical record"""
+    async def delete_medical_record(self, record_id: str) -> bool:
+        """Delete medical record"""
         try:
-            now = datetime.now()
+            async with self._acquire() as conn:
+                result = await conn.execute("DELETE FROM medical_records WHERE id = $1", record_id)
+            return result != "DELETE 0"
             
-            async with self.pool.acquire() as conn:
-                result = await conn.execute("""
+        except Exception:
+            logger.exception("Medical record deletion failed")
+            return False
+    
+    async def update_medical_record_returning(self, record_id: str, record_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update the fields present in record_data and return the new row; None if not found"""
+        try:
+            # Fields missing from record_data keep their current value
+            async with self._acquire() as conn:
+                row = await conn.fetchrow("""
                     UPDATE medical_records SET
-                        diagnosis = $1, symptoms = $2, findings = $3,
-                        recommendations = $4, suggested_tests = $5, 
-                        doctor_notes = $6, updated_at = $7
-                    WHERE id = $8
-                """, (
+                        diagnosis = COALESCE($1, diagnosis), symptoms = COALESCE($2::jsonb, symptoms),
+                        findings = COALESCE($3, findings), recommendations = COALESCE($4::jsonb, recommendations),
+                        suggested_tests = COALESCE($5::jsonb, suggested_tests),
+                        confidence_score = COALESCE($6, confidence_score),
+                        doctor_notes = COALESCE($7, doctor_notes), updated_at = $8
+                    WHERE id = $9
+                    RETURNING *
+                """,
                     record_data.get('diagnosis'),
-                    json.dumps(record_data.get('symptoms', [])),
+                    record_data.get('symptoms'),
                     record_data.get('findings'),
-                    json.dumps(record_data.get('recommendations', [])),
-                    json.dumps(record_data.get('suggested_tests', [])),
+                    record_data.get('recommendations'),
+                    record_data.get('suggested_tests'),
+                    record_data.get('confidence_score'),
                     record_data.get('doctor_notes'),
-                    now, record_id
-                ))
-                
-            return result != "UPDATE 0"
+                    datetime.now(), record_id
+                )
             
-        except Exception as e:
-            print(f"Medical record update failed: {e}")
-            return False
+            if row:
+                record = dict(row)
+                record['symptoms'] = record['symptoms'] if record['symptoms'] else []
+                record['recommendations'] = record['recommendations'] if record['recommendations'] else []
+                record['suggested_tests'] = record['suggested_tests'] if record['suggested_tests'] else []
+                return record
+            return None
+            
+        except Exception:
+            logger.exception("Medical record update failed")
+            raise
     
-    async def delete_medical_record(self, record_id: str) -> bool:
-        """Delete medical record"""
+    async def delete_medical_record_returning(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a medical record and return its id, patient_id and image_path; None if not found"""
         try:
-            async with self.pool.acquire() as conn:
-                result = await conn.execute("DELETE FROM medical_records WHERE id = $1", record_id)
-            return result != "DELETE 0"
+            async with self._acquire() as conn:
+                row = await conn.fetchrow(
+                    "DELETE FROM medical_records WHERE id = $1 RETURNING id, patient_id, image_path", record_id
+                )
+            return dict(row) if row else None
             
-        except Exception as e:
-            print(f"Medical record deletion failed: {e}")
-            return False
+        except Exception:
+            logger.exception("Medical record deletion failed")
+            raise
     
     async def search_patients(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Search patients by name, email, or phone"""
         try:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch("""
-                    SELECT * FROM patients 
-                    WHERE name ILIKE $1 OR email ILIKE $2 OR phone ILIKE $3
-                    LIMIT $4
-                """, f"%{query}%", f"%{query}%", f"%{query}%", limit)
-                
-                patients = []
-                for row in rows:
-                    patient = dict(row)
-                    patient['allergies'] = patient['allergies'] if patient['allergies'] else []
-                    patients.append(patient)
-                
-                return patients
+            query_name = "search_patients" if self.has_trigram else "search_patients_plain"
+            rows = await self._fetch_prepared(query_name, query, limit, pool=self.bulk_pool)
+            
+            patients = []
+            for row in rows:
+                patient = dict(row)
+                patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+                patients.append(patient)
+            
+            return patients
                 
-        except Exception as e:
-            print(f"Patient search failed: {e}")
+        except Exception:
+            logger.exception("Patient search failed")
             return []
     
     async def get_patient_statistics(self, patient_id: str) -> Dict[str, Any]:
         """Get patient health statistics and trends"""
         try:
-            async with self.pool.acquire() as conn:
-                # Get total records
-                total_records = await conn.fetchval(
-                    "SELECT COUNT(*) FROM medical_records WHERE patient_id = $1", 
-                    patient_id
-                )
-                
-                # Get records by type
-                records_by_type_rows = await conn.fetch("""
-                    SELECT record_type, COUNT(*) 
+            # Per-type totals and last-30-day counts in one pass
+            async with self._acquire(self.bulk_pool) as conn:
+                rows = await conn.fetch("""
+                    SELECT record_type, COUNT(*),
+                           COUNT(*) FILTER (WHERE created_at >= NOW() - INTERVAL '30 days')
                     FROM medical_records 
                     WHERE patient_id = $1 
                     GROUP BY record_type
                 """, patient_id)
-                records_by_type = {row[0]: row[1] for row in records_by_type_rows}
-                
-                # Get recent activity
-                recent_records = await conn.fetchval("""
-                    SELECT COUNT(*) FROM medical_records 
-                    WHERE patient_id = $1 AND created_at >= NOW() - INTERVAL '30 days'
+            
+            records_by_type = {row[0]: row[1] for row in rows}
+            
+            return {
+                "total_records": sum(records_by_type.values()),
+                "records_by_type": records_by_type,
+                "recent_records": sum(row[2] for row in rows),
+                "last_updated": datetime.now().isoformat()
+            }
+            
+        except Exception:
+            logger.exception("Statistics retrieval failed")
+            return {}
+    
+    async def get_patient_stats_bundle(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Patient profile fields and record statistics together; None if the patient does not exist"""
+        try:
+            # One round trip: the per-type counts are aggregated next to the patient row
+            async with self._acquire(self.bulk_pool) as conn:
+                row = await conn.fetchrow("""
+                    SELECT p.name, p.email, p.date_of_birth, p.blood_type, p.allergies,
+                           s.records_by_type, s.recent_records
+                    FROM patients p
+                    LEFT JOIN LATERAL (
+                        SELECT json_object_agg(t.record_type, t.total) AS records_by_type,
+                               SUM(t.recent)::bigint AS recent_records
+                        FROM (
+                            SELECT record_type, COUNT(*) AS total,
+                                   COUNT(*) FILTER (WHERE created_at >= NOW() - INTERVAL '30 days') AS recent
+                            FROM medical_records WHERE patient_id = p.id
+                            GROUP BY record_type
+                        ) t
+                    ) s ON true
+                    WHERE p.id = $1
                 """, patient_id)
-                
-                return {
-                    "total_records": total_records,
+            
+            if row is None:
+                return None
+            
+            records_by_type = row['records_by_type'] or {}
+            return {
+                "patient": {
+                    "name": row['name'],
+                    "email": row['email'],
+                    "date_of_birth": row['date_of_birth'],
+                    "blood_type": row['blood_type'],
+                    "allergies": row['allergies'] if row['allergies'] else []
+                },
+                "statistics": {
+                    "total_records": sum(records_by_type.values()),
                     "records_by_type": records_by_type,
-                    "recent_records": recent_records,
+                    "recent_records": row['recent_records'] or 0,
                     "last_updated": datetime.now().isoformat()
                 }
-                
-        except Exception as e:
-            print(f"Statistics retrieval failed: {e}")
+            }
+            
+        except Exception:
+            logger.exception("Statistics retrieval failed")
+            return None
+    
+    async def get_patient_summary_bundle(self, patient_id: str, recent_limit: int = 5) -> Optional[Dict[str, Any]]:
+        """Patient row, most recent records and statistics together; None if the patient does not exist"""
+        try:
+            # One round trip: each part is aggregated to JSON server-side
+            async with self._acquire(self.bulk_pool) as conn:
+                row = await conn.fetchrow("""
+                    WITH p AS (
+                        SELECT * FROM patients WHERE id = $1
+                    ), r AS (
+                        SELECT * FROM medical_records WHERE patient_id = $1
+                        ORDER BY created_at DESC LIMIT $2
+                    ), s AS (
+                        SELECT record_type, COUNT(*) AS total,
+                               COUNT(*) FILTER (WHERE created_at >= NOW() - INTERVAL '30 days') AS recent
+                        FROM medical_records WHERE patient_id = $1
+                        GROUP BY record_type
+                    )
+                    SELECT (SELECT row_to_json(p) FROM p) AS patient,
+                           (SELECT COALESCE(json_agg(r ORDER BY r.created_at DESC), '[]') FROM r) AS recent_records,
+                           (SELECT COALESCE(json_agg(s), '[]') FROM s) AS stats
+                """, patient_id, recent_limit)
+            
+            if row is None or row['patient'] is None:
+                return None
+            
+            patient = row['patient']
+            patient['allergies'] = patient['allergies'] if patient['allergies'] else []
+            recent_records = row['recent_records']
+            for record in recent_records:
+                record['symptoms'] = record['symptoms'] if record['symptoms'] else []
+                record['recommendations'] = record['recommendations'] if record['recommendations'] else []
+                record['suggested_tests'] = record['suggested_tests'] if record['suggested_tests'] else []
+            stats = row['stats']
+            records_by_type = {stat['record_type']: stat['total'] for stat in stats}
+            
+            return {
+                "patient": patient,
+                "recent_records": recent_records,
+                "statistics": {
+                    "total_records": sum(records_by_type.values()),
+                    "records_by_type": records_by_type,
+                    "recent_records": sum(stat['recent'] for stat in stats),
+                    "last_updated": datetime.now().isoformat()
+                }
+            }
+            
+        except Exception:
+            logger.exception("Patient summary retrieval failed")
+            return None
+    
+    async def get_records_group_counts(self, patient_id: str, column: str,
+                                       limit: Optional[int] = None) -> Dict[Any, int]:
+        """Count a patient's records per value of column, most frequent first"""
+        if column not in GROUPABLE_RECORD_COLUMNS:
+            raise ValueError(f"Cannot group medical records by {column}")
+        try:
+            async with self._acquire(self.bulk_pool) as conn:
+                rows = await conn.fetch(f"""
+                    SELECT {column}, COUNT(*) AS n
+                    FROM medical_records 
+                    WHERE patient_id = $1 
+                    GROUP BY {column}
+                    ORDER BY n DESC
+                    LIMIT $2
+                """, patient_id, limit)
+            return {row[0]: row[1] for row in rows}
+            
+        except Exception:
+            logger.exception("Record group counts failed")
             return {}
     
     async def get_condition_history(self, patient_id: str, condition: str) -> List[Dict[str, Any]]:
         """Get history of specific condition"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire(self.bulk_pool) as conn:
                 rows = await conn.fetch("""
                     SELECT * FROM medical_records 
                     WHERE patient_id = $1 AND diagnosis ILIKE $2
@@ -408,6 +812,6 @@ class PostgresManager(DatabaseManager):
                 
                 return records
                 
-        except Exception as e:
-            print(f"Condition history retrieval failed: {e}")
+        except Exception:
+            logger.exception("Condition history retrieval failed")
             return [] 
\ No newline at end of file
@@ -1,10 +1,16 @@
+import logging
 import sqlite3
 import asyncio
 import json
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence
 from datetime import datetime
 import uuid
-from .base import DatabaseManager
+from .base import DatabaseManager, GROUPABLE_RECORD_COLUMNS, PROJECTABLE_RECORD_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# RETURNING and ON CONFLICT DO NOTHING in the *_returning methods need SQLite 3.35+
+MIN_SQLITE_VERSION = (3, 35, 0)
 
 class SQLiteManager(DatabaseManager):
     """SQLite implementation of DatabaseManager"""
@@ -15,13 +21,23 @@ class SQLiteManager(DatabaseManager):
     
     async def connect(self) -> bool:
         """Establish SQLite connection"""
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(
+                f"SQLite {sqlite3.sqlite_version} is too old; "
+                f"{'.'.join(map(str, MIN_SQLITE_VERSION))} or newer is required"
+            )
         try:
+            if self.connection is not None:
+                return True
             self.connection = sqlite3.connect(self.db_path)
             self.connection.row_factory = sqlite3.Row  # Enable dict-like access
+            # WAL lets readers run during writes; NORMAL only fsyncs at checkpoints
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
             await self.create_tables()
             return True
-        except Exception as e:
-            print(f"SQLite connection failed: {e}")
+        except Exception:
+            logger.exception("SQLite connection failed")
             return False
     
     async def disconnect(self) -> bool:
@@ -31,8 +47,8 @@ class SQLiteManager(DatabaseManager):
                 self.connection.close()
                 self.connection = None
             return True
-        except Exception as e:
-            print(f"SQLite disconnection failed: {e}")
+        except Exception:
+            logger.exception("SQLite disconnection failed")
             return False
     
     async def create_tables(self) -> bool:
@@ -102,22 +118,38 @@ class SQLiteManager(DatabaseManager):
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_patients_email ON patients(email)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_medical_records_patient ON medical_records(patient_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_medical_records_type ON medical_records(record_type)")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_mr_patient_type_created
+                ON medical_records(patient_id, record_type, created_at DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_mr_patient_modality_created
+                ON medical_records(patient_id, modality, created_at DESC)
+                WHERE modality IS NOT NULL
+            """)
+            # Same covering index as PostgreSQL's idx_mr_patient_created_incl; SQLite has no
+            # INCLUDE, so the covered columns trail the key
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_mr_patient_created_incl
+                ON medical_records(patient_id, created_at DESC, id, modality, diagnosis)
+            """)
+            cursor.execute("DROP INDEX IF EXISTS idx_mr_patient_created")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appointment_date)")
             
             self.connection.commit()
             return True
             
-        except Exception as e:
-            print(f"Table creation failed: {e}")
+        except Exception:
+            logger.exception("Table creation failed")
             return False
     
-    async def create_patient(self, patient_data: Dict[str, Any]) -> str:
-        """Create a new patient record"""
+    async def create_patient_returning(self, patient_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert a patient and return the stored row; None if the email is already registered"""
         try:
-            patient_id = str(uuid.uuid4())
             now = datetime.now().isoformat()
             
+            # Uniqueness is enforced by the insert itself, so there is no separate lookup to race with
             cursor = self.connection.cursor()
             cursor.execute("""
                 INSERT INTO patients (
@@ -125,8 +157,10 @@ class SQLiteManager(DatabaseManager):
                     address, emergency_contact, blood_type, allergies, 
                     created_at, updated_at
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (email) DO NOTHING
+                RETURNING *
             """, (
-                patient_id,
+                str(uuid.uuid4()),
                 patient_data.get('email'),
                 patient_data.get('name'),
                 patient_data.get('phone'),
@@ -138,12 +172,17 @@ class SQLiteManager(DatabaseManager):
                 json.dumps(patient_data.get('allergies', [])),
                 now, now
             ))
-            
+            row = cursor.fetchone()
             self.connection.commit()
-            return patient_id
             
-        except Exception as e:
-            print(f"Patient creation failed: {e}")
+            if row:
+                patient = dict(row)
+                patient['allergies'] = json.loads(patient['allergies']) if patient['allergies'] else []
+                return patient
+            return None
+            
+        except Exception:
+            logger.exception("Patient creation failed")
             raise
     
     async def get_patient(self, patient_id: str) -> Optional[Dict[str, Any]]:
@@ -159,8 +198,8 @@ class SQLiteManager(DatabaseManager):
                 return patient
             return None
             
-        except Exception as e:
-            print(f"Patient retrieval failed: {e}")
+        except Exception:
+            logger.exception("Patient retrieval failed")
             return None
     
     async def get_patient_by_email(self, email: str) -> Optional[Dict[str, Any]]:
@@ -176,22 +215,67 @@ class SQLiteManager(DatabaseManager):
                 return patient
             return None
             
-        except Exception as e:
-            print(f"Patient retrieval by email failed: {e}")
+        except Exception:
+            logger.exception("Patient retrieval by email failed")
             return None
     
-    async def update_patient(self, patient_id: str, patient_data: Dict[str, Any]) -> bool:
-        """Update patient information"""
+    async def get_patients_by_ids(self, patient_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several patients in one query, keyed by ID; unknown IDs are omitted"""
+        return {patient['id']: patient for patient in self._get_patients_where("id", patient_ids)}
+    
+    async def get_patients_by_emails(self, emails: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieve several patients in one query, keyed by email; unknown emails are omitted"""
+        return {patient['email']: patient for patient in self._get_patients_where("email", emails)}
+    
+    def _get_patients_where(self, column: str, values: Sequence[str]) -> List[Dict[str, Any]]:
+        if not values:
+            return []
         try:
-            now = datetime.now().isoformat()
+            # The values travel as one JSON array parameter, so there is no bound-variable limit
+            cursor = self.connection.cursor()
+            cursor.execute(
+                f"SELECT * FROM patients WHERE {column} IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(values)),)
+            )
+            patients = []
+            for row in cursor.fetchall():
+                patient = dict(row)
+                patient['allergies'] = json.loads(patient['allergies']) if patient['allergies'] else []
+                patients.append(patient)
+            return patients
+            
+        except Exception:
+            logger.exception("Patient batch retrieval failed")
+            return []
+    
+    async def delete_patient(self, patient_id: str) -> bool:
+        """Delete patient record"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+            self.connection.commit()
+            return cursor.rowcount > 0
+            
+        except Exception:
+            logger.exception("Patient deletion failed")
+            return False
+    
+    async def update_patient_returning(self, patient_id: str, patient_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update the fields present in patient_data and return the new row; None if not found"""
+        try:
+            allergies = patient_data.get('allergies')
             
+            # Fields missing from patient_data keep their current value
             cursor = self.connection.cursor()
             cursor.execute("""
                 UPDATE patients SET
-                    name = ?, phone = ?, date_of_birth = ?, gender = ?,
-                    address = ?, emergency_contact = ?, blood_type = ?, 
-                    allergies = ?, updated_at = ?
+                    name = COALESCE(?, name), phone = COALESCE(?, phone),
+                    date_of_birth = COALESCE(?, date_of_birth), gender = COALESCE(?, gender),
+                    address = COALESCE(?, address), emergency_contact = COALESCE(?, emergency_contact),
+                    blood_type = COALESCE(?, blood_type), allergies = COALESCE(?, allergies),
+                    updated_at = ?
                 WHERE id = ?
+                RETURNING *
             """, (
                 patient_data.get('name'),
                 patient_data.get('phone'),
@@ -200,44 +284,57 @@ class SQLiteManager(DatabaseManager):
                 patient_data.get('address'),
                 patient_data.get('emergency_contact'),
                 patient_data.get('blood_type'),
-                json.dumps(patient_data.get('allergies', [])),
-                now, patient_id
+                json.dumps(allergies) if allergies is not None else None,
+                datetime.now().isoformat(), patient_id
             ))
-            
+            row = cursor.fetchone()
             self.connection.commit()
-            return cursor.rowcount > 0
             
-        except Exception as e:
-            print(f"Patient update failed: {e}")
-            return False
+            if row:
+                patient = dict(row)
+                patient['allergies'] = json.loads(patient['allergies']) if patient['allergies'] else []
+                return patient
+            return None
+            
+        except Exception:
+            logger.exception("Patient update failed")
+            raise
     
-    async def delete_patient(self, patient_id: str) -> bool:
-        """Delete patient record"""
+    async def delete_patient_returning(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a patient with its medical records; returns id, email and the deleted record_ids, None if not found"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
-            self.connection.commit()
-            return cursor.rowcount > 0
-            
-        except Exception as e:
-            print(f"Patient deletion failed: {e}")
-            return False
+            # SQLite has no cascade here, so the records go in the same transaction;
+            # the connection context manager commits both deletes or rolls both back
+            with self.connection:
+                cursor = self.connection.cursor()
+                cursor.execute("DELETE FROM medical_records WHERE patient_id = ? RETURNING id", (patient_id,))
+                record_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute("DELETE FROM patients WHERE id = ? RETURNING id, email", (patient_id,))
+                row = cursor.fetchone()
+            return {**dict(row), "record_ids": record_ids} if row else None
+            
+        except Exception:
+            logger.exception("Patient deletion failed")
+            raise
     
-    async def add_medical_record(self, patient_id: str, record_data: Dict[str, Any]) -> str:
-        """Add a new medical record"""
+    async def add_medical_record(self, patient_id: str, record_data: Dict[str, Any]) -> Optional[str]:
+        """Add a new medical record; returns None if the patient does not exist"""
         try:
             record_id = str(uuid.uuid4())
             now = datetime.now().isoformat()
             
+            # Insert only if the patient exists, without a separate lookup
             cursor = self.connection.cursor()
             cursor.execute("""
                 INSERT INTO medical_records (
                     id, patient_id, record_type, modality, diagnosis,
                     symptoms, findings, recommendations, suggested_tests,
                     image_path, confidence_score, doctor_notes, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                )
+                SELECT ?, id, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                FROM patients WHERE id = ?
             """, (
-                record_id, patient_id,
+                record_id,
                 record_data.get('record_type'),
                 record_data.get('modality'),
                 record_data.get('diagnosis'),
@@ -248,26 +345,45 @@ class SQLiteManager(DatabaseManager):
                 record_data.get('image_path'),
                 record_data.get('confidence_score'),
                 record_data.get('doctor_notes'),
-                now, now
+                now, now, patient_id
             ))
             
             self.connection.commit()
-            return record_id
+            return record_id if cursor.rowcount > 0 else None
             
-        except Exception as e:
-            print(f"Medical record creation failed: {e}")
+        except Exception:
+            logger.exception("Medical record creation failed")
             raise
     
-    async def get_medical_history(self, patient_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Retrieve patient's medical history"""
+    async def get_medical_history(self, patient_id: str, limit: int = 50, record_type: Optional[str] = None,
+                                  modality: Optional[str] = None, start: Optional[datetime] = None,
+                                  end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Retrieve patient's medical history, optionally filtered by record type, modality and creation time"""
         try:
+            conditions = ["patient_id = ?"]
+            params = [patient_id]
+            if record_type:
+                conditions.append("record_type = ?")
+                params.append(record_type)
+            if modality:
+                conditions.append("modality = ?")
+                params.append(modality)
+            # created_at is stored as ISO text, which orders the same as the timestamps
+            if start:
+                conditions.append("created_at >= ?")
+                params.append(start.isoformat())
+            if end:
+                conditions.append("created_at <= ?")
+                params.append(end.isoformat())
+            params.append(limit)
+            
             cursor = self.connection.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT * FROM medical_records 
-                WHERE patient_id = ? 
+                WHERE {' AND '.join(conditions)} 
                 ORDER BY created_at DESC 
                 LIMIT ?
-            """, (patient_id, limit))
+            """, params)
             
             records = []
             for row in cursor.fetchall():
@@ -279,8 +395,28 @@ class SQLiteManager(DatabaseManager):
             
             return records
             
-        except Exception as e:
-            print(f"Medical history retrieval failed: {e}")
+        except Exception:
+            logger.exception("Medical history retrieval failed")
+            return []
+    
+    async def get_medical_history_columns(self, patient_id: str, columns: Sequence[str],
+                                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retrieve only the given columns of a patient's records, newest first"""
+        invalid = [column for column in columns if column not in PROJECTABLE_RECORD_COLUMNS]
+        if invalid or not columns:
+            raise ValueError(f"Cannot project medical records onto {invalid or columns}")
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                SELECT {', '.join(columns)} FROM medical_records 
+                WHERE patient_id = ? 
+                ORDER BY created_at DESC 
+                LIMIT ?
+            """, (patient_id, -1 if limit is None else limit))
+            return [dict(row) for row in cursor.fetchall()]
+            
+        except Exception:
+            logger.exception("Medical history projection failed")
             return []
     
     async def get_medical_record(self, record_id: str) -> Optional[Dict[str, Any]]:
@@ -298,50 +434,79 @@ class SQLiteManager(DatabaseManager):
                 return record
             return None
             
-        except Exception as e:
-            print(f"Medical record retrieval failed: {e}")
+        except Exception:
+            logger.exception("Medical record retrieval failed")
             return None
     
-    async def update_medical_record(self, record_id: str, record_data: Dict[str, Any]) -> bool:
-        """Update medical record"""
+    async def delete_medical_record(self, record_id: str) -> bool:
+        """Delete medical record"""
         try:
-            now = datetime.now().isoformat()
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM medical_records WHERE id = ?", (record_id,))
+            self.connection.commit()
+            return cursor.rowcount > 0
+            
+        except Exception:
+            logger.exception("Medical record deletion failed")
+            return False
+    
+    async def update_medical_record_returning(self, record_id: str, record_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update the fields present in record_data and return the new row; None if not found"""
+        try:
+            lists = {
+                field: json.dumps(record_data[field]) if record_data.get(field) is not None else None
+                for field in ('symptoms', 'recommendations', 'suggested_tests')
+            }
             
+            # Fields missing from record_data keep their current value
             cursor = self.connection.cursor()
             cursor.execute("""
                 UPDATE medical_records SET
-                    diagnosis = ?, symptoms = ?, findings = ?,
-                    recommendations = ?, suggested_tests = ?, 
-                    doctor_notes = ?, updated_at = ?
+                    diagnosis = COALESCE(?, diagnosis), symptoms = COALESCE(?, symptoms),
+                    findings = COALESCE(?, findings), recommendations = COALESCE(?, recommendations),
+                    suggested_tests = COALESCE(?, suggested_tests), confidence_score = COALESCE(?, confidence_score),
+                    doctor_notes = COALESCE(?, doctor_notes), updated_at = ?
                 WHERE id = ?
+                RETURNING *
             """, (
                 record_data.get('diagnosis'),
-                json.dumps(record_data.get('symptoms', [])),
+                lists['symptoms'],
                 record_data.get('findings'),
-                json.dumps(record_data.get('recommendations', [])),
-                json.dumps(record_data.get('suggested_tests', [])),
+                lists['recommendations'],
+                lists['suggested_tests'],
+                record_data.get('confidence_score'),
                 record_data.get('doctor_notes'),
-                now, record_id
+                datetime.now().isoformat(), record_id
             ))
-            
+            row = cursor.fetchone()
             self.connection.commit()
-            return cursor.rowcount > 0
             
-        except Exception as e:
-            print(f"Medical record update failed: {e}")
-            return False
+            if row:
+                record = dict(row)
+                record['symptoms'] = json.loads(record['symptoms']) if record['symptoms'] else []
+                record['recommendations'] = json.loads(record['recommendations']) if record['recommendations'] else []
+                record['suggested_tests'] = json.loads(record['suggested_tests']) if record['suggested_tests'] else []
+                return record
+            return None
+            
+        except Exception:
+            logger.exception("Medical record update failed")
+            raise
     
-    async def delete_medical_record(self, record_id: str) -> bool:
-        """Delete medical record"""
+    async def delete_medical_record_returning(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a medical record and return its id, patient_id and image_path; None if not found"""
         try:
             cursor = self.connection.cursor()
-            cursor.execute("DELETE FROM medical_records WHERE id = ?", (record_id,))
+            cursor.execute(
+                "DELETE FROM medical_records WHERE id = ? RETURNING id, patient_id, image_path", (record_id,)
+            )
+            row = cursor.fetchone()
             self.connection.commit()
-            return cursor.rowcount > 0
+            return dict(row) if row else None
             
-        except Exception as e:
-            print(f"Medical record deletion failed: {e}")
-            return False
+        except Exception:
+            logger.exception("Medical record deletion failed")
+            raise
     
     async def search_patients(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Search patients by name, email, or phone"""
@@ -361,34 +526,27 @@ class SQLiteManager(DatabaseManager):
             
             return patients
             
-        except Exception as e:
-            print(f"Patient search failed: {e}")
+        except Exception:
+            logger.exception("Patient search failed")
             return []
     
     async def get_patient_statistics(self, patient_id: str) -> Dict[str, Any]:
         """Get patient health statistics and trends"""
         try:
+            # Per-type totals and last-30-day counts in one pass
             cursor = self.connection.cursor()
-            
-            # Get total records
-            cursor.execute("SELECT COUNT(*) FROM medical_records WHERE patient_id = ?", (patient_id,))
-            total_records = cursor.fetchone()[0]
-            
-            # Get records by type
             cursor.execute("""
-                SELECT record_type, COUNT(*) 
+                SELECT record_type, COUNT(*),
+                       SUM(CASE WHEN created_at >= date('now', '-30 days') THEN 1 ELSE 0 END)
                 FROM medical_records 
                 WHERE patient_id = ? 
                 GROUP BY record_type
             """, (patient_id,))
-            records_by_type = dict(cursor.fetchall())
+            rows = cursor.fetchall()
             
-            # Get recent activity
-            cursor.execute("""
-                SELECT COUNT(*) FROM medical_records 
-                WHERE patient_id = ? AND created_at >= date('now', '-30 days')
-            """, (patient_id,))
-            recent_records = cursor.fetchone()[0]
+            records_by_type = {row[0]: row[1] for row in rows}
+            total_records = sum(records_by_type.values())
+            recent_records = sum(row[2] for row in rows)
             
             return {
                 "total_records": total_records,
@@ -397,8 +555,49 @@ class SQLiteManager(DatabaseManager):
                 "last_updated": datetime.now().isoformat()
             }
             
-        except Exception as e:
-            print(f"Statistics retrieval failed: {e}")
+        except Exception:
+            logger.exception("Statistics retrieval failed")
+            return {}
+    
+    async def get_patient_stats_bundle(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """Patient profile fields and record statistics together; None if the patient does not exist"""
+        # In-process database: reuse the single-purpose queries as get_patient_summary_bundle does
+        patient = await self.get_patient(patient_id)
+        if not patient:
+            return None
+        return {"patient": patient, "statistics": await self.get_patient_statistics(patient_id)}
+    
+    async def get_patient_summary_bundle(self, patient_id: str, recent_limit: int = 5) -> Optional[Dict[str, Any]]:
+        """Patient row, most recent records and statistics together; None if the patient does not exist"""
+        # In-process database: the three reads cost no round trips, so reuse the single-purpose queries
+        patient = await self.get_patient(patient_id)
+        if not patient:
+            return None
+        return {
+            "patient": patient,
+            "recent_records": await self.get_medical_history(patient_id, limit=recent_limit),
+            "statistics": await self.get_patient_statistics(patient_id)
+        }
+    
+    async def get_records_group_counts(self, patient_id: str, column: str,
+                                       limit: Optional[int] = None) -> Dict[Any, int]:
+        """Count a patient's records per value of column, most frequent first"""
+        if column not in GROUPABLE_RECORD_COLUMNS:
+            raise ValueError(f"Cannot group medical records by {column}")
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                SELECT {column}, COUNT(*) AS n
+                FROM medical_records 
+                WHERE patient_id = ? 
+                GROUP BY {column}
+                ORDER BY n DESC
+                LIMIT ?
+            """, (patient_id, -1 if limit is None else limit))
+            return {row[0]: row[1] for row in cursor.fetchall()}
+            
+        except Exception:
+            logger.exception("Record group counts failed")
             return {}
     
     async def get_condition_history(self, patient_id: str, condition: str) -> List[Dict[str, Any]]:
@@ -421,6 +620,6 @@ class SQLiteManager(DatabaseManager):
             
             return records
             
-        except Exception as e:
-            print(f"Condition history retrieval failed: {e}")
+        except Exception:
+            logger.exception("Condition history retrieval failed")
             return [] 
\ No newline at end of file
@@ -1,11 +1,15 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException ,Path
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi import Request
+from fastapi.responses import JSONResponse, ORJSONResponse
 import shutil
+import sys
+import asyncio
 from contextlib import asynccontextmanager
 import os
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from fastapi import FastAPI, Query
 import httpx
 from dotenv import load_dotenv
@@ -13,12 +17,17 @@ import re
 from geopy.geocoders import Nominatim
 from datetime import datetime, timedelta
 import json
+import logging
 
 
 
 # Load environment variables
 load_dotenv()
 
+# Log records are written by a background thread, never on the event loop
+from services.log_queue import start_log_listener, stop_log_listener
+start_log_listener()
+
 # No ML model imports needed - using Gemini API only
 # from services.xray_service import process_xray, init_xray_model
 # from services.ct_service import process_ct, init_ct_models
@@ -26,13 +35,16 @@ load_dotenv()
 # from services.mri_service import process_mri, init_mri_models
 
 # Import patient management modules
-from routers.patient_router import router as patient_router
-from services.medical_records_service import MedicalRecordsService
+from routers.patient_router import (
+    router as patient_router, get_medical_records_service, shutdown_patient_services
+)
 
 # Import admin dashboard modules
-from routers.admin_router import router as admin_router
-from services.admin_service import AdminService
+from routers.admin_router import router as admin_router, get_admin_service, shutdown_admin_service
 from models.admin_models import ActivityType, LogLevel
+from services.exceptions import NotFoundError, ValidationError
+from database.config import DatabaseConfig
+from database.postgres_manager import request_connection_slots
 
 # Initialize Google GenAI Client (multimodal)
 # pip install google-generativeai
@@ -48,7 +60,6 @@ client = genai.GenerativeModel('gemini-2.0-flash')
 
 # Global: store latest predictions for frontend polling
 latest_xray_results: dict = {}
-latest_reports = {}
 
 # Appointment management
 class Appointment(BaseModel):
@@ -65,15 +76,93 @@ class Appointment(BaseModel):
     status: str = "confirmed"
     created_at: Optional[str] = None
 
+class LatestReports:
+    """Latest generated report per modality.
+
+    Writes go through an asyncio.Lock and swap in a fresh dict, so readers
+    always see a complete snapshot without taking the lock.
+    """
+
+    def __init__(self):
+        self._reports: Dict[str, dict] = {}
+        self._lock = asyncio.Lock()
+
+    async def set(self, key: str, report: dict) -> None:
+        async with self._lock:
+            reports = dict(self._reports)
+            reports[key] = report
+            self._reports = reports
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._reports.get(key)
+
+
+class AppointmentStore:
+    """In-memory appointment store indexed by appointment ID.
+
+    Mutations are serialized with an asyncio.Lock; reads are plain dict
+    lookups and never await, so they cannot observe a half-applied write.
+    """
+
+    def __init__(self):
+        self._appointments: Dict[str, Appointment] = {}
+        self._next_id = 1
+        self._lock = asyncio.Lock()
+
+    async def add(self, appointment: Appointment) -> Appointment:
+        async with self._lock:
+            appointment.id = str(self._next_id)
+            self._next_id += 1
+            self._appointments[appointment.id] = appointment
+        return appointment
+
+    def get(self, appointment_id: str) -> Optional[Appointment]:
+        return self._appointments.get(appointment_id)
+
+    def list(self) -> List[Appointment]:
+        return list(self._appointments.values())
+
+    async def replace(self, appointment_id: str, appointment: Appointment) -> Optional[Appointment]:
+        async with self._lock:
+            existing = self._appointments.get(appointment_id)
+            if existing is None:
+                return None
+            appointment.id = appointment_id
+            appointment.created_at = existing.created_at
+            self._appointments[appointment_id] = appointment
+        return appointment
+
+    async def delete(self, appointment_id: str) -> bool:
+        async with self._lock:
+            return self._appointments.pop(appointment_id, None) is not None
+
+
+latest_reports = LatestReports()
+
 # In-memory storage for appointments (in production, use a database)
-appointments_db = []  
+appointments_db = AppointmentStore()
 
 # Startup: No ML models needed - using Gemini API only
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Starting Maruthuvam AI with Gemini API...")
+    start_log_listener()
+    logger.info("Starting Maruthuvam AI with Gemini API...")
+    # One connection/pool for the whole process; services only borrow it
+    await DatabaseConfig.open_shared_database()
+    # Started here rather than by the first admin request, so the log flusher and analytics
+    # refresher do not inherit that request's connection cap
+    await get_admin_service()
     yield
-    print("Shutting down...")
+    logger.info("Shutting down...")
+    await shutdown_patient_services()
+    await shutdown_admin_service()
+    # The MRI service is optional (see the commented model imports); importing it here would
+    # load its models, so its batchers are stopped only when something already loaded it
+    mri_service = sys.modules.get("services.mri_service")
+    if mri_service is not None:
+        await mri_service.shutdown_mri_batchers()
+    await DatabaseConfig.close_shared_database()
+    stop_log_listener()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -88,6 +177,45 @@ app.add_middleware(
     allow_headers=["*"],    # allow all headers
 )
 
+# Compress JSON/CSV responses (logs, analytics, medical history); small bodies are sent as-is
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Pooled PostgreSQL connections a single request may hold at the same time
+DB_CONNECTIONS_PER_REQUEST = int(os.getenv("DB_CONNECTIONS_PER_REQUEST", "2"))
+
+class RequestConnectionCap:
+    """ASGI middleware giving each HTTP request its own database connection semaphore"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = request_connection_slots.set(asyncio.Semaphore(DB_CONNECTIONS_PER_REQUEST))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_connection_slots.reset(token)
+
+app.add_middleware(RequestConnectionCap)
+
+logger = logging.getLogger(__name__)
+
+# Map service-layer errors to HTTP responses
+@app.exception_handler(NotFoundError)
+async def not_found_handler(request: Request, exc: NotFoundError):
+    return ORJSONResponse(status_code=404, content={"detail": exc.detail})
+
+@app.exception_handler(ValidationError)
+async def validation_error_handler(request: Request, exc: ValidationError):
+    return ORJSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(Exception)
+async def unhandled_error_handler(request: Request, exc: Exception):
+    logger.exception("Unhandled error on %s %s", request.method, request.url.path)
+    return ORJSONResponse(status_code=500, content={"detail": "Internal server error"})
+
 # Include patient management router
 app.include_router(patient_router)
 
@@ -105,9 +233,8 @@ app.include_router(admin_router)
 
 @app.post("/predict/xray/")
 async def predict_xray(file: UploadFile = File(...)):
-    # Initialize admin service for logging
-    admin_service = AdminService()
-    await admin_service.initialize()
+    # Shared admin service for logging
+    admin_service = await get_admin_service()
     
     # Log user activity
     await admin_service.log_user_activity(
@@ -123,7 +250,6 @@ async def predict_xray(file: UploadFile = File(...)):
             f"Invalid file type uploaded: {file.content_type}",
             metadata={"file_name": file.filename}
         )
-        await admin_service.cleanup()
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
     temp_path = f"temp_{file.filename}"
@@ -233,8 +359,7 @@ async def predict_xray(file: UploadFile = File(...)):
         medical_record = None
         if hasattr(file, 'patient_id') and file.patient_id:
             try:
-                medical_records_service = MedicalRecordsService()
-                await medical_records_service.initialize()
+                medical_records_service = await get_medical_records_service()
                 
                 medical_record_data = {
                     "record_type": "xray",
@@ -251,7 +376,6 @@ async def predict_xray(file: UploadFile = File(...)):
                 medical_record = await medical_records_service.create_medical_record(
                     file.patient_id, medical_record_data, file
                 )
-                await medical_records_service.cleanup()
                 
                 # Log medical record creation
                 await admin_service.log_user_activity(
@@ -261,7 +385,7 @@ async def predict_xray(file: UploadFile = File(...)):
                 )
                 
             except Exception as e:
-                print(f"Failed to create medical record: {e}")
+                logger.exception("Failed to create medical record")
                 await admin_service.log_system_event(
                     LogLevel.ERROR,
                     "medical_records",
@@ -276,8 +400,6 @@ async def predict_xray(file: UploadFile = File(...)):
             metadata={"conditions_found": len(predictions), "confidence": predictions[0][1] if predictions else 0.0}
         )
         
-        await admin_service.cleanup()
-        
         return JSONResponse(content={
             "predictions": predictions, 
             "gemini_analysis": analysis,
@@ -293,7 +415,6 @@ async def predict_xray(file: UploadFile = File(...)):
             f"Error in X-ray prediction: {str(e)}",
             metadata={"file_name": file.filename}
         )
-        await admin_service.cleanup()
         
         if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
@@ -378,7 +499,7 @@ async def generate_report(
             tests_raw = tests_response.text.strip()
             suggested_tests = [test.strip() for test in tests_raw.split('\n') if test.strip()]
             
-        except Exception as e:
+        except Exception:
             # Fallback to basic recommendations if Gemini fails
             recommendations = [
                 "Consult with a medical professional for further evaluation",
@@ -392,13 +513,13 @@ async def generate_report(
             ]
 
         # Store the complete report with recommendations and tests
-        latest_reports[modality] = {
+        await latest_reports.set(modality, {
             "disease": disease,
             "symptoms": symptoms,
             "report": report,
             "recommendations": recommendations,
             "suggested_tests": suggested_tests
-        }
+        })
 
         return JSONResponse(content={
             "symptoms": symptoms, 
@@ -419,9 +540,10 @@ async def generate_report(
 @app.get("/get-latest-report/{modality}/")
 async def get_latest_report(modality: str = Path(...)):
     modality = modality.lower()
-    if modality not in latest_reports:
+    report = latest_reports.get(modality)
+    if report is None:
         raise HTTPException(status_code=404, detail="No report available for this modality.")
-    return latest_reports[modality]
+    return report
 
 
 # CT 2D and 3D routes
@@ -511,13 +633,13 @@ async def generate_report_ct2d(file: UploadFile = File(...)):
             suggested_tests = ["Comprehensive metabolic panel", "Tumor markers if applicable"]
 
         # Store complete report with recommendations and tests  
-        latest_reports["ct2d"] = {
+        await latest_reports.set("ct2d", {
             "symptoms": symptoms,
             "disease": disease,
             "report": report,
             "recommendations": recommendations,
             "suggested_tests": suggested_tests
-        }
+        })
 
         return JSONResponse({
             "symptoms": symptoms,
@@ -582,7 +704,7 @@ async def generate_report_ct3d(file: UploadFile = File(...)):
         os.remove(temp_path)
 
         # Store the report
-        latest_reports["ct3d"] = {
+        report = {
             "symptoms": [
                 "3D volumetric analysis performed",
                 "Cross-sectional evaluation completed", 
@@ -591,8 +713,9 @@ async def generate_report_ct3d(file: UploadFile = File(...)):
             "disease": "3D CT Analysis Complete",
             "report": analysis
         }
+        await latest_reports.set("ct3d", report)
         
-        return JSONResponse(latest_reports["ct3d"])
+        return JSONResponse(report)
 
     except Exception as e:
         if os.path.exists(temp_path): os.remove(temp_path)
@@ -601,15 +724,17 @@ async def generate_report_ct3d(file: UploadFile = File(...)):
 
 @app.get("/predict/ct/2d/")
 async def get_latest_report_ct2d():
-    if "ct2d" not in latest_reports:
+    report = latest_reports.get("ct2d")
+    if report is None:
         raise HTTPException(status_code=404, detail="No 2D CT report available.")
-    return latest_reports["ct2d"]
+    return report
 
 @app.get("/predict/ct/3d/")
 async def get_latest_report_ct3d():
-    if "ct3d" not in latest_reports:
+    report = latest_reports.get("ct3d")
+    if report is None:
         raise HTTPException(status_code=404, detail="No 3D CT report available.")
-    return latest_reports["ct3d"]
+    return report
 
 @app.post("/predict/mri/3d/")
 async def generate_report_mri3d(file: UploadFile = File(...)):  
@@ -642,7 +767,7 @@ async def generate_report_mri3d(file: UploadFile = File(...)):
         os.remove(temp_path)
 
         # Store the report
-        latest_reports["mri3d"] = {
+        report = {
             "symptoms": [
                 "3D MRI analysis performed",
                 "Brain tissue evaluation completed",
@@ -651,16 +776,18 @@ async def generate_report_mri3d(file: UploadFile = File(...)):
             "disease": "MRI Analysis Complete",
             "report": analysis
         }
+        await latest_reports.set("mri3d", report)
         
-        return JSONResponse(latest_reports["mri3d"])
+        return JSONResponse(report)
     except Exception as e:
         if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 @app.get("/predict/mri/3d/")
 async def get_latest_report_mri3d():
-    if "mri3d" not in latest_reports:
+    report = latest_reports.get("mri3d")
+    if report is None:
         raise HTTPException(status_code=404, detail="No 3D MRI report available.")
-    return latest_reports["mri3d"]
+    return report
 
 @app.post("/predict/ultrasound/")
 async def generate_report_ultrasound(file: UploadFile = File(...)):
@@ -753,11 +880,11 @@ async def generate_report_ultrasound(file: UploadFile = File(...)):
 
         disease = extract_condition(report)
         # 7) Store in global for frontend polling if needed
-        latest_reports[modality] = {
+        await latest_reports.set(modality, {
             "disease":  disease,
             "symptoms": symptoms,
             "report":   report,
-        }
+        })
 
         # 8) Return JSON
         # Generate curated recommendations and suggested tests for ultrasound analysis
@@ -795,9 +922,10 @@ async def generate_report_ultrasound(file: UploadFile = File(...)):
         
 @app.get("/predict/ultrasound/")
 async def get_latest_report_ultrasound():   
-    if "ultrasound" not in latest_reports:
+    report = latest_reports.get("ultrasound")
+    if report is None:
         raise HTTPException(status_code=404, detail="No ultrasound report available.")
-    return latest_reports["ultrasound"]
+    return report
 
 # Mock database of doctors
 class Doctor(BaseModel):
@@ -853,7 +981,7 @@ async def search_doctors(location: str, specialty: str = ""):
     city_key = location.lower().strip()
     if city_key in fallback_coords:
         lat, lon = fallback_coords[city_key]
-        print(f"Using fallback coordinates for {city_key}: {lat}, {lon}")
+        logger.info("Using fallback coordinates for %s: %s, %s", city_key, lat, lon)
     else:
         # Try geocoding as fallback, but don't fail if it doesn't work
         try:
@@ -861,13 +989,13 @@ async def search_doctors(location: str, specialty: str = ""):
             location_obj = geolocator.geocode(location + ", India", timeout=10)
             if location_obj:
                 lat, lon = location_obj.latitude, location_obj.longitude
-                print(f"Geocoding successful for {location}: {lat}, {lon}")
+                logger.info("Geocoding successful for %s: %s, %s", location, lat, lon)
             else:
                 # Use Chennai as default if geocoding fails
                 lat, lon = fallback_coords['chennai']
-                print(f"Geocoding failed for {location}, using Chennai as default")
+                logger.warning("Geocoding failed for %s, using Chennai as default", location)
         except Exception as e:
-            print(f"Geocoding error for {location}: {e}, using Chennai as default")
+            logger.warning("Geocoding error for %s: %s, using Chennai as default", location, e)
             lat, lon = fallback_coords['chennai']
 
     # Try Overpass API but don't fail if it times out
@@ -886,9 +1014,9 @@ async def search_doctors(location: str, specialty: str = ""):
         async with httpx.AsyncClient(timeout=10.0) as client:  # Reduced timeout
             res = await client.post(overpass_url, data=query)
             data = res.json()
-            print(f"Overpass API successful for {location}")
+            logger.info("Overpass API successful for %s", location)
     except Exception as e:
-        print(f"Overpass API failed for {location}: {e}")
+        logger.warning("Overpass API failed for %s: %s", location, e)
         # Continue with empty data - we'll use mock data instead
 
 
@@ -919,12 +1047,12 @@ async def search_doctors(location: str, specialty: str = ""):
                 "lat": el.get("lat"),
                 "lng": el.get("lon")
             })
-    except Exception as e:
-        print(f"Error processing Overpass data: {e}")
+    except Exception:
+        logger.exception("Error processing Overpass data")
     
     # If no doctors found from API, provide mock data for demonstration
     if not doctors:
-        print(f"No doctors found from API for {location}, providing mock data")
+        logger.info("No doctors found from API for %s, providing mock data", location)
         mock_doctors = [
             {
                 "name": "Dr. Rajesh Kumar",
@@ -965,7 +1093,7 @@ async def search_doctors(location: str, specialty: str = ""):
         ]
         doctors = mock_doctors
     
-    print(f"Returning {len(doctors)} doctors for {location}")
+    logger.info("Returning %d doctors for %s", len(doctors), location)
     return doctors
 # @app.get("/api/get-doctor/{doctor_id}", response_model=Doctor)
 
@@ -1033,10 +1161,8 @@ async def chat_with_report(request: ChatRequest):
 @app.post("/appointments/", response_model=Appointment)
 async def create_appointment(appointment: Appointment):
     """Create a new appointment"""
-    appointment.id = str(len(appointments_db) + 1)
     appointment.created_at = datetime.now().isoformat()
-    appointments_db.append(appointment)
-    return appointment
+    return await appointments_db.add(appointment)
 
 @app.get("/appointments/", response_model=List[Appointment])
 async def get_appointments(
@@ -1045,7 +1171,7 @@ async def get_appointments(
     status: Optional[str] = None
 ):
     """Get appointments with optional filters"""
-    filtered_appointments = appointments_db
+    filtered_appointments = appointments_db.list()
     
     if doctor_id:
         filtered_appointments = [a for a in filtered_appointments if a.doctor_id == doctor_id]
@@ -1059,42 +1185,37 @@ async def get_appointments(
 @app.get("/appointments/{appointment_id}", response_model=Appointment)
 async def get_appointment(appointment_id: str):
     """Get a specific appointment by ID"""
-    for appointment in appointments_db:
-        if appointment.id == appointment_id:
-            return appointment
-    raise HTTPException(status_code=404, detail="Appointment not found")
+    appointment = appointments_db.get(appointment_id)
+    if appointment is None:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    return appointment
 
 @app.put("/appointments/{appointment_id}", response_model=Appointment)
 async def update_appointment(appointment_id: str, appointment_update: Appointment):
     """Update an appointment"""
-    for i, appointment in enumerate(appointments_db):
-        if appointment.id == appointment_id:
-            appointment_update.id = appointment_id
-            appointment_update.created_at = appointment.created_at
-            appointments_db[i] = appointment_update
-            return appointment_update
-    raise HTTPException(status_code=404, detail="Appointment not found")
+    appointment = await appointments_db.replace(appointment_id, appointment_update)
+    if appointment is None:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    return appointment
 
 @app.delete("/appointments/{appointment_id}")
 async def delete_appointment(appointment_id: str):
     """Delete an appointment"""
-    for i, appointment in enumerate(appointments_db):
-        if appointment.id == appointment_id:
-            del appointments_db[i]
-            return {"message": "Appointment deleted successfully"}
-    raise HTTPException(status_code=404, detail="Appointment not found")
+    if not await appointments_db.delete(appointment_id):
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    return {"message": "Appointment deleted successfully"}
 
 @app.get("/appointments/doctor/{doctor_id}/availability")
 async def get_doctor_availability(doctor_id: str, date: str):
     """Get doctor's available time slots for a specific date"""
     try:
         requested_date = datetime.strptime(date, "%Y-%m-%d")
-        if requested_date < datetime.now().date():
+        if requested_date.date() < datetime.now().date():
             return {"available_slots": []}
         
         # Get existing appointments for this doctor on this date
         existing_appointments = [
-            a for a in appointments_db 
+            a for a in appointments_db.list()
             if a.doctor_id == doctor_id 
             and a.appointment_date == date
             and a.status == "confirmed"
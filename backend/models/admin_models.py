@@ -104,8 +104,8 @@ class DashboardStats(BaseModel):
     pending_moderations: List[ModerationAction] = Field(..., description="Pending moderation actions")
 
 class LogFilter(BaseModel):
-    start_date: Optional[datetime] = Field(None, description="Start date for filtering")
-    end_date: Optional[datetime] = Field(None, description="End date for filtering")
+    start_date: Optional[datetime] = Field(None, description="Start date for filtering (inclusive, UTC)")
+    end_date: Optional[datetime] = Field(None, description="End date for filtering (exclusive, UTC)")
     level: Optional[LogLevel] = Field(None, description="Log level filter")
     component: Optional[str] = Field(None, description="Component filter")
     user_id: Optional[str] = Field(None, description="User ID filter")
@@ -1,16 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import asyncio
+import csv
+import io
 import uuid
 
-from services.admin_service import AdminService
+from database.clock import utc_now
+from services.admin_service import (
+    AdminService, DASHBOARD_CACHE_KEY, DASHBOARD_CACHE_TTL, HEALTH_CACHE_KEY,
+    HEALTH_CACHE_TTL, REALTIME_CACHE_KEY, REALTIME_CACHE_TTL
+)
 from models.admin_models import (
     LogFilter, AnalyticsFilter, ContentFlag, ModerationAction,
-    ActivityType, LogLevel, ModerationStatus
+    ActivityType, LogLevel, ModerationStatus, UserActivityLog, SystemLog
 )
 
-router = APIRouter(prefix="/api/admin", tags=["Admin Dashboard"])
+router = APIRouter(prefix="/api/admin", tags=["Admin Dashboard"], default_response_class=ORJSONResponse)
 
 # Global admin service instance
 _admin_service = None
@@ -23,6 +30,13 @@ async def get_admin_service():
         await _admin_service.initialize()
     return _admin_service
 
+async def shutdown_admin_service():
+    """Close the shared admin service connection"""
+    global _admin_service
+    if _admin_service is not None:
+        await _admin_service.cleanup()
+        _admin_service = None
+
 # Dependency to check admin authentication (placeholder for now)
 async def verify_admin_access(request: Request):
     # In production, implement proper admin authentication
@@ -35,11 +49,10 @@ async def get_dashboard_stats(
     _: bool = Depends(verify_admin_access)
 ):
     """Get comprehensive dashboard statistics"""
-    try:
-        stats = await service.get_dashboard_stats()
-        return JSONResponse(content=stats)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching dashboard stats: {str(e)}")
+    payload = await service.get_cached_payload(
+        DASHBOARD_CACHE_KEY, DASHBOARD_CACHE_TTL, service.get_dashboard_stats
+    )
+    return Response(content=payload, media_type="application/json")
 
 @router.get("/analytics")
 async def get_analytics(
@@ -50,18 +63,15 @@ async def get_analytics(
     _: bool = Depends(verify_admin_access)
 ):
     """Get system analytics data"""
-    try:
-        filter_params = AnalyticsFilter(
-            start_date=start_date,
-            end_date=end_date,
-            group_by=group_by
-        )
-        analytics = await service.get_analytics(filter_params)
-        return JSONResponse(content=analytics.dict())
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching analytics: {str(e)}")
+    filter_params = AnalyticsFilter(
+        start_date=start_date,
+        end_date=end_date,
+        group_by=group_by
+    )
+    payload = await service.get_analytics_payload(filter_params)
+    return Response(content=payload, media_type="application/json")
 
-@router.get("/logs/user-activities")
+@router.get("/logs/user-activities", response_model=List[UserActivityLog], response_model_exclude_none=True)
 async def get_user_activities(
     start_date: Optional[datetime] = Query(None, description="Start date for filtering"),
     end_date: Optional[datetime] = Query(None, description="End date for filtering"),
@@ -74,22 +84,19 @@ async def get_user_activities(
     _: bool = Depends(verify_admin_access)
 ):
     """Get user activity logs with filtering"""
-    try:
-        filter_params = LogFilter(
-            start_date=start_date,
-            end_date=end_date,
-            level=level,
-            component=component,
-            user_id=user_id,
-            activity_type=activity_type,
-            limit=limit
-        )
-        activities = await service.get_user_activities(filter_params)
-        return JSONResponse(content=[activity.dict() for activity in activities])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching user activities: {str(e)}")
+    filter_params = LogFilter(
+        start_date=start_date,
+        end_date=end_date,
+        level=level,
+        component=component,
+        user_id=user_id,
+        activity_type=activity_type,
+        limit=limit
+    )
+    activities = await service.get_user_activities(filter_params)
+    return activities
 
-@router.get("/logs/system")
+@router.get("/logs/system", response_model=List[SystemLog], response_model_exclude_none=True)
 async def get_system_logs(
     start_date: Optional[datetime] = Query(None, description="Start date for filtering"),
     end_date: Optional[datetime] = Query(None, description="End date for filtering"),
@@ -100,30 +107,24 @@ async def get_system_logs(
     _: bool = Depends(verify_admin_access)
 ):
     """Get system logs with filtering"""
-    try:
-        filter_params = LogFilter(
-            start_date=start_date,
-            end_date=end_date,
-            level=level,
-            component=component,
-            limit=limit
-        )
-        logs = await service.get_system_logs(filter_params)
-        return JSONResponse(content=[log.dict() for log in logs])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching system logs: {str(e)}")
+    filter_params = LogFilter(
+        start_date=start_date,
+        end_date=end_date,
+        level=level,
+        component=component,
+        limit=limit
+    )
+    logs = await service.get_system_logs(filter_params)
+    return logs
 
-@router.get("/moderation/flags")
+@router.get("/moderation/flags", response_model=List[ContentFlag], response_model_exclude_none=True)
 async def get_pending_flags(
     service: AdminService = Depends(get_admin_service),
     _: bool = Depends(verify_admin_access)
 ):
     """Get pending content flags for moderation"""
-    try:
-        flags = await service.get_pending_content_flags()
-        return JSONResponse(content=[flag.dict() for flag in flags])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching pending flags: {str(e)}")
+    flags = await service.get_pending_content_flags()
+    return flags
 
 @router.post("/moderation/flags")
 async def create_content_flag(
@@ -136,21 +137,18 @@ async def create_content_flag(
     service: AdminService = Depends(get_admin_service)
 ):
     """Create a new content flag"""
-    try:
-        flag = await service.create_content_flag(
-            content_type=content_type,
-            content_id=content_id,
-            reason=reason,
-            reporter_id=reporter_id,
-            reporter_email=reporter_email,
-            description=description
-        )
-        if flag:
-            return JSONResponse(content=flag.dict(), status_code=201)
-        else:
-            raise HTTPException(status_code=400, detail="Failed to create content flag")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating content flag: {str(e)}")
+    flag = await service.create_content_flag(
+        content_type=content_type,
+        content_id=content_id,
+        reason=reason,
+        reporter_id=reporter_id,
+        reporter_email=reporter_email,
+        description=description
+    )
+    if flag:
+        return ORJSONResponse(content=flag.dict(), status_code=201)
+    else:
+        raise HTTPException(status_code=400, detail="Failed to create content flag")
 
 @router.put("/moderation/flags/{flag_id}")
 async def moderate_content(
@@ -165,22 +163,19 @@ async def moderate_content(
     _: bool = Depends(verify_admin_access)
 ):
     """Moderate flagged content"""
-    try:
-        success = await service.moderate_content(
-            flag_id=flag_id,
-            admin_id=admin_id,
-            admin_email=admin_email,
-            action=action,
-            status=status,
-            reason=reason,
-            admin_notes=admin_notes
-        )
-        if success:
-            return JSONResponse(content={"message": "Content moderated successfully"})
-        else:
-            raise HTTPException(status_code=400, detail="Failed to moderate content")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error moderating content: {str(e)}")
+    success = await service.moderate_content(
+        flag_id=flag_id,
+        admin_id=admin_id,
+        admin_email=admin_email,
+        action=action,
+        status=status,
+        reason=reason,
+        admin_notes=admin_notes
+    )
+    if success:
+        return ORJSONResponse(content={"message": "Content moderated successfully"})
+    else:
+        raise HTTPException(status_code=400, detail="Failed to moderate content")
 
 @router.get("/health")
 async def get_system_health(
@@ -188,11 +183,10 @@ async def get_system_health(
     _: bool = Depends(verify_admin_access)
 ):
     """Get system health metrics"""
-    try:
-        health = await service.get_system_health()
-        return JSONResponse(content=health)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching system health: {str(e)}")
+    payload = await service.get_cached_payload(
+        HEALTH_CACHE_KEY, HEALTH_CACHE_TTL, service.get_system_health
+    )
+    return Response(content=payload, media_type="application/json")
 
 @router.post("/logs/activity")
 async def log_user_activity(
@@ -207,23 +201,20 @@ async def log_user_activity(
     service: AdminService = Depends(get_admin_service)
 ):
     """Log user activity (for internal use)"""
-    try:
-        success = await service.log_user_activity(
-            activity_type=activity_type,
-            description=description,
-            user_id=user_id,
-            user_email=user_email,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            metadata=metadata,
-            session_id=session_id
-        )
-        if success:
-            return JSONResponse(content={"message": "Activity logged successfully"})
-        else:
-            raise HTTPException(status_code=400, detail="Failed to log activity")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error logging activity: {str(e)}")
+    success = await service.log_user_activity(
+        activity_type=activity_type,
+        description=description,
+        user_id=user_id,
+        user_email=user_email,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        metadata=metadata,
+        session_id=session_id
+    )
+    if success:
+        return ORJSONResponse(content={"message": "Activity logged successfully"})
+    else:
+        raise HTTPException(status_code=400, detail="Failed to log activity")
 
 @router.post("/logs/system")
 async def log_system_event(
@@ -235,20 +226,17 @@ async def log_system_event(
     service: AdminService = Depends(get_admin_service)
 ):
     """Log system event (for internal use)"""
-    try:
-        success = await service.log_system_event(
-            level=level,
-            component=component,
-            message=message,
-            stack_trace=stack_trace,
-            metadata=metadata
-        )
-        if success:
-            return JSONResponse(content={"message": "System event logged successfully"})
-        else:
-            raise HTTPException(status_code=400, detail="Failed to log system event")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error logging system event: {str(e)}")
+    success = await service.log_system_event(
+        level=level,
+        component=component,
+        message=message,
+        stack_trace=stack_trace,
+        metadata=metadata
+    )
+    if success:
+        return ORJSONResponse(content={"message": "System event logged successfully"})
+    else:
+        raise HTTPException(status_code=400, detail="Failed to log system event")
 
 @router.get("/stats/realtime")
 async def get_realtime_stats(
@@ -256,72 +244,69 @@ async def get_realtime_stats(
     _: bool = Depends(verify_admin_access)
 ):
     """Get real-time system statistics"""
-    try:
-        # Get current analytics
-        analytics = await service.get_analytics()
-        
-        # Get recent activities (last 5 minutes)
-        recent_activities = await service.get_user_activities()
-        recent_activities = [a for a in recent_activities 
-                           if a.timestamp > datetime.now() - timedelta(minutes=5)]
+    async def compute_realtime_stats():
+        now = utc_now()
+        cutoff = now - timedelta(minutes=5)
         
-        # Get recent system logs (last 5 minutes)
-        recent_logs = await service.get_system_logs()
-        recent_logs = [l for l in recent_logs 
-                      if l.timestamp > datetime.now() - timedelta(minutes=5)]
+        # Current analytics plus activity/log counts for the last 5 minutes, fetched concurrently
+        analytics, counters = await asyncio.gather(
+            service.get_analytics(),
+            service.get_realtime_counters(cutoff)
+        )
         
-        return JSONResponse(content={
-            "timestamp": datetime.now().isoformat(),
+        return {
+            "timestamp": now.isoformat(),
             "analytics": analytics.dict(),
-            "recent_activities_count": len(recent_activities),
-            "recent_logs_count": len(recent_logs),
-            "error_logs_count": len([l for l in recent_logs if l.level == LogLevel.ERROR])
-        })
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching real-time stats: {str(e)}")
+            "recent_activities_count": counters["activities"],
+            "recent_logs_count": counters["logs"],
+            "error_logs_count": counters["error_logs"]
+        }
+    
+    payload = await service.get_cached_payload(
+        REALTIME_CACHE_KEY, REALTIME_CACHE_TTL, compute_realtime_stats
+    )
+    return Response(content=payload, media_type="application/json")
 
 @router.get("/export/logs")
 async def export_logs(
     log_type: str = Query(..., description="Type of logs to export (user_activities, system)"),
-    start_date: Optional[datetime] = Query(None, description="Start date for export"),
-    end_date: Optional[datetime] = Query(None, description="End date for export"),
+    start_date: Optional[datetime] = Query(None, description="Start of export range (inclusive, UTC)"),
+    end_date: Optional[datetime] = Query(None, description="End of export range (exclusive, UTC)"),
     format: str = Query("json", description="Export format (json, csv)"),
     service: AdminService = Depends(get_admin_service),
     _: bool = Depends(verify_admin_access)
 ):
     """Export logs in specified format"""
-    try:
+    filter_params = LogFilter(start_date=start_date, end_date=end_date)
+    if log_type not in ("user_activities", "system"):
+        raise HTTPException(status_code=400, detail="Invalid log type")
+    
+    if format.lower() == "json":
         if log_type == "user_activities":
-            logs = await service.get_user_activities()
-        elif log_type == "system":
-            logs = await service.get_system_logs()
+            logs = await service.get_user_activities(filter_params)
         else:
-            raise HTTPException(status_code=400, detail="Invalid log type")
-        
-        # Filter by date if provided
-        if start_date:
-            logs = [log for log in logs if log.timestamp >= start_date]
-        if end_date:
-            logs = [log for log in logs if log.timestamp <= end_date]
+            logs = await service.get_system_logs(filter_params)
+        return ORJSONResponse(content=[log.dict() for log in logs])
+    elif format.lower() == "csv":
+        columns, rows = service.iter_log_rows(log_type, filter_params)
+        return StreamingResponse(
+            _stream_csv(columns, rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{log_type}_logs.csv"'}
+        )
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
         
-        if format.lower() == "json":
-            return JSONResponse(content=[log.dict() for log in logs])
-        elif format.lower() == "csv":
-            # Convert to CSV format
-            if not logs:
-                return JSONResponse(content="No logs found")
-            
-            # Get headers from first log
-            headers = list(logs[0].dict().keys())
-            csv_content = ",".join(headers) + "\n"
-            
-            for log in logs:
-                values = [str(log.dict()[header]) for header in headers]
-                csv_content += ",".join(values) + "\n"
-            
-            return JSONResponse(content=csv_content)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported export format")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error exporting logs: {str(e)}") 
\ No newline at end of file
+
+async def _stream_csv(columns, rows, chunk_size: int = 64 * 1024):
+    """Encode rows as CSV, flushing roughly chunk_size characters at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
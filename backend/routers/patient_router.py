@@ -1,7 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from typing import List, Optional
+import asyncio
+import hashlib
+from datetime import date, datetime
+import mimetypes
 import os
+from urllib.parse import quote
 from services.patient_service import PatientService
 from services.medical_records_service import MedicalRecordsService
 from models.patient_models import (
@@ -11,24 +16,65 @@ from models.patient_models import (
     MedicalRecordListResponse, SuccessResponse, ErrorResponse
 )
 
-router = APIRouter(prefix="/api/patients", tags=["Patients"])
+# Internal nginx location mapped to the medical image upload directory (e.g. /protected/medical_images/).
+# When set, image downloads are handed to the proxy via X-Accel-Redirect instead of streamed by the worker.
+IMAGE_ACCEL_REDIRECT_PREFIX = os.getenv("IMAGE_ACCEL_REDIRECT_PREFIX")
+
+mimetypes.add_type("application/dicom", ".dcm")
+
+router = APIRouter(prefix="/api/patients", tags=["Patients"], default_response_class=ORJSONResponse)
+
+# Shared service instances, initialized once and closed on application shutdown
+_patient_service = None
+_medical_records_service = None
+_service_lock = asyncio.Lock()
 
 # Dependency to get services
 async def get_patient_service():
-    service = PatientService()
-    await service.initialize()
-    try:
-        yield service
-    finally:
-        await service.cleanup()
+    global _patient_service
+    if _patient_service is None:
+        async with _service_lock:
+            if _patient_service is None:
+                service = PatientService()
+                await service.initialize()
+                _patient_service = service
+    return _patient_service
 
 async def get_medical_records_service():
-    service = MedicalRecordsService()
-    await service.initialize()
-    try:
-        yield service
-    finally:
-        await service.cleanup()
+    global _medical_records_service
+    if _medical_records_service is None:
+        async with _service_lock:
+            if _medical_records_service is None:
+                service = MedicalRecordsService()
+                await service.initialize()
+                _medical_records_service = service
+    return _medical_records_service
+
+async def shutdown_patient_services():
+    """Close the shared service connections"""
+    global _patient_service, _medical_records_service
+    for service in (_patient_service, _medical_records_service):
+        if service is not None:
+            await service.cleanup()
+    _patient_service = None
+    _medical_records_service = None
+
+def _etag_part(part) -> str:
+    # Timestamps arrive as datetimes from the database and L1 but as ISO strings from Redis;
+    # both must hash alike or workers disagree on the ETag of one record
+    return part.isoformat() if isinstance(part, (datetime, date)) else str(part)
+
+def _etag(*parts) -> str:
+    """Strong ETag derived from the values that identify a representation"""
+    digest = hashlib.blake2b(":".join(_etag_part(part) for part in parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already covers etag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
 
 # Patient Management Endpoints
 @router.post("/", response_model=PatientResponse)
@@ -37,10 +83,18 @@ async def create_patient(
     service: PatientService = Depends(get_patient_service)
 ):
     """Create a new patient"""
-    try:
-        return await service.create_patient(patient.dict())
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await service.create_patient(patient.dict())
+
+# Registered before /{patient_id} so "search" is not taken as a patient ID
+@router.get("/search", response_model=List[PatientResponse])
+async def search_patients(
+    query: str = Query(..., min_length=2, description="Search query"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum results"),
+    service: PatientService = Depends(get_patient_service)
+):
+    """Search patients by name, email, or phone"""
+    patients = await service.search_patients(query, limit)
+    return patients
 
 @router.get("/{patient_id}", response_model=PatientResponse)
 async def get_patient(
@@ -71,12 +125,9 @@ async def update_patient(
     service: PatientService = Depends(get_patient_service)
 ):
     """Update patient information"""
-    try:
-        # Filter out None values
-        update_data = {k: v for k, v in patient_update.dict().items() if v is not None}
-        return await service.update_patient(patient_id, update_data)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    # Filter out None values
+    update_data = {k: v for k, v in patient_update.dict().items() if v is not None}
+    return await service.update_patient(patient_id, update_data)
 
 @router.delete("/{patient_id}", response_model=SuccessResponse)
 async def delete_patient(
@@ -84,24 +135,11 @@ async def delete_patient(
     service: PatientService = Depends(get_patient_service)
 ):
     """Delete patient and all associated records"""
-    try:
-        success = await service.delete_patient(patient_id)
-        if success:
-            return SuccessResponse(success=True, message="Patient deleted successfully")
-        else:
-            raise HTTPException(status_code=400, detail="Failed to delete patient")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@router.get("/search", response_model=List[PatientResponse])
-async def search_patients(
-    query: str = Query(..., min_length=2, description="Search query"),
-    limit: int = Query(20, ge=1, le=100, description="Maximum results"),
-    service: PatientService = Depends(get_patient_service)
-):
-    """Search patients by name, email, or phone"""
-    patients = await service.search_patients(query, limit)
-    return patients
+    success = await service.delete_patient(patient_id)
+    if success:
+        return SuccessResponse(success=True, message="Patient deleted successfully")
+    else:
+        raise HTTPException(status_code=400, detail="Failed to delete patient")
 
 @router.get("/{patient_id}/statistics")
 async def get_patient_statistics(
@@ -133,22 +171,11 @@ async def create_medical_record(
     service: MedicalRecordsService = Depends(get_medical_records_service)
 ):
     """Create a new medical record for a patient"""
-    try:
-        # Validate patient exists
-        patient_service = PatientService()
-        await patient_service.initialize()
-        patient = await patient_service.get_patient(patient_id)
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-        await patient_service.cleanup()
-        
-        # Create medical record
-        record_dict = record_data.dict()
-        record_dict['patient_id'] = patient_id
-        
-        return await service.create_medical_record(patient_id, record_dict, None)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    record_dict = record_data.dict()
+    record_dict['patient_id'] = patient_id
+    
+    # The insert itself checks that the patient exists
+    return await service.create_medical_record(patient_id, record_dict, None)
 
 @router.get("/{patient_id}/medical-records", response_model=MedicalRecordListResponse)
 async def get_medical_history(
@@ -159,30 +186,31 @@ async def get_medical_history(
     service: MedicalRecordsService = Depends(get_medical_records_service)
 ):
     """Get patient's medical history with optional filtering"""
-    try:
-        records = await service.get_medical_history(patient_id, limit, record_type)
-        
-        # Filter by modality if specified
-        if modality:
-            records = [r for r in records if r.get('modality') == modality]
-        
-        return MedicalRecordListResponse(
-            records=records,
-            total=len(records),
-            patient_id=patient_id
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    records = await service.get_medical_history(patient_id, limit, record_type, modality)
+    
+    return MedicalRecordListResponse(
+        records=records,
+        total=len(records),
+        patient_id=patient_id
+    )
 
 @router.get("/medical-records/{record_id}", response_model=MedicalRecordResponse)
 async def get_medical_record(
     record_id: str,
+    request: Request,
+    response: Response,
     service: MedicalRecordsService = Depends(get_medical_records_service)
 ):
     """Get specific medical record by ID"""
     record = await service.get_medical_record(record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Medical record not found")
+    
+    # Records can still be edited, so clients must revalidate on every use
+    headers = {"ETag": _etag(record['id'], record.get('updated_at')), "Cache-Control": "private, no-cache"}
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return record
 
 @router.put("/medical-records/{record_id}", response_model=MedicalRecordResponse)
@@ -192,12 +220,9 @@ async def update_medical_record(
     service: MedicalRecordsService = Depends(get_medical_records_service)
 ):
     """Update medical record"""
-    try:
-        # Filter out None values
-        update_data = {k: v for k, v in record_update.dict().items() if v is not None}
-        return await service.update_medical_record(record_id, update_data)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    # Filter out None values
+    update_data = {k: v for k, v in record_update.dict().items() if v is not None}
+    return await service.update_medical_record(record_id, update_data)
 
 @router.delete("/medical-records/{record_id}", response_model=SuccessResponse)
 async def delete_medical_record(
@@ -205,14 +230,11 @@ async def delete_medical_record(
     service: MedicalRecordsService = Depends(get_medical_records_service)
 ):
     """Delete medical record"""
-    try:
-        success = await service.delete_medical_record(record_id)
-        if success:
-            return SuccessResponse(success=True, message="Medical record deleted successfully")
-        else:
-            raise HTTPException(status_code=400, detail="Failed to delete medical record")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    success = await service.delete_medical_record(record_id)
+    if success:
+        return SuccessResponse(success=True, message="Medical record deleted successfully")
+    else:
+        raise HTTPException(status_code=400, detail="Failed to delete medical record")
 
 @router.get("/{patient_id}/medical-records/condition/{condition}")
 async def get_condition_history(
@@ -276,6 +298,7 @@ async def get_records_summary(
 @router.get("/medical-records/{record_id}/image")
 async def get_medical_image(
     record_id: str,
+    request: Request,
     service: MedicalRecordsService = Depends(get_medical_records_service)
 ):
     """Get medical image for a specific record"""
@@ -283,10 +306,28 @@ async def get_medical_image(
     if not image_path:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    if not os.path.exists(image_path):
+    try:
+        stat = os.stat(image_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Image file not found")
     
-    return FileResponse(image_path, media_type="image/*")
+    # Uploaded images are never rewritten in place
+    headers = {
+        "ETag": _etag(record_id, image_path, stat.st_mtime_ns, stat.st_size),
+        "Cache-Control": "private, max-age=86400, immutable"
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    media_type = mimetypes.guess_type(image_path)[0] or "application/octet-stream"
+    
+    # Let the reverse proxy stream the file when configured
+    relative_path = os.path.relpath(image_path, service.upload_dir).replace(os.sep, "/")
+    if IMAGE_ACCEL_REDIRECT_PREFIX and not relative_path.startswith(".."):
+        headers["X-Accel-Redirect"] = f"{IMAGE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(relative_path)}"
+        return Response(media_type=media_type, headers=headers)
+    
+    return FileResponse(image_path, media_type=media_type, headers=headers)
 
 # Health Check Endpoint
 @router.get("/health")
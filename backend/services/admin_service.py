@@ -1,21 +1,61 @@
-from typing import List, Optional, Dict, Any
+import logging
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 from datetime import datetime, timedelta
-import uuid
+import asyncio
+import os
 import json
+from database.clock import utc_now
 from database.config import DatabaseConfig
-from database.admin_manager import AdminDatabaseManager
+from database.ids import new_id
+from database.admin_manager import (
+    AdminDatabaseManager, UserActivityRow, SystemLogRow, USER_ACTIVITY_COLUMNS, SYSTEM_LOG_COLUMNS
+)
+from services.cache import LocalCache, RedisCache, dumps
 from models.admin_models import (
     UserActivityLog, SystemLog, AnalyticsData, ModerationAction, 
     ContentFlag, AdminUser, LogFilter, AnalyticsFilter, ActivityType, LogLevel
 )
 
+logger = logging.getLogger(__name__)
+
+# Cached admin read models and their TTLs (seconds)
+DASHBOARD_CACHE_KEY = "admin:dashboard:v1"
+DASHBOARD_CACHE_TTL = 60
+HEALTH_CACHE_KEY = "admin:health:v1"
+HEALTH_CACHE_TTL = 30
+REALTIME_CACHE_KEY = "admin:realtime:v1"
+REALTIME_CACHE_TTL = 5
+ANALYTICS_CACHE_PREFIX = "admin:analytics:v1"
+ANALYTICS_CACHE_TTL = 60
+PENDING_FLAGS_CACHE_KEY = "admin:flags:pending:v1"
+PENDING_FLAGS_CACHE_TTL = 5
+# Redis-backed payloads are kept in-process for at most this long, so a worker's copy
+# outlives the Redis entry it came from by no more than this
+LOCAL_COPY_TTL = 5
+
+# How often the dashboard counters snapshot is recomputed (seconds); 0 disables the
+# in-process refresher, e.g. when dashboard_stats_mv is refreshed by pg_cron instead
+ANALYTICS_REFRESH_INTERVAL = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+
+# Log writes are queued and inserted in batches by a background flusher
+LOG_QUEUE_MAXSIZE = 10_000
+LOG_BATCH_SIZE = 500
+LOG_DRAIN_TIMEOUT = 5.0
+
 class AdminService:
     """Service layer for admin operations"""
     
     def __init__(self):
-        self.base_db = DatabaseConfig.get_database_manager()
+        self.base_db = DatabaseConfig.get_shared_database_manager()
         self.admin_db = AdminDatabaseManager(self.base_db)
-        self.start_time = datetime.now()
+        self.cache = RedisCache()
+        # Per-process copy of the above, checked before Redis so polling hits never leave the worker;
+        # invalidations are broadcast so every worker drops its copy
+        self.local_cache = LocalCache("admin:local", maxsize=256)
+        self.start_time = utc_now()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+        self._flusher: Optional[asyncio.Task] = None
     
     async def initialize(self):
         """Initialize database connection and create admin tables"""
@@ -24,6 +64,8 @@ class AdminService:
             needs_connect = True
             if hasattr(self.base_db, 'connection'):
                 needs_connect = getattr(self.base_db, 'connection', None) is None
+            elif hasattr(self.base_db, 'pool'):
+                needs_connect = getattr(self.base_db, 'pool', None) is None
             elif hasattr(self.base_db, 'db'):
                 needs_connect = getattr(self.base_db, 'db', None) is None
             
@@ -37,6 +79,11 @@ class AdminService:
             self.admin_db = AdminDatabaseManager(self.base_db)
             await self.admin_db.create_admin_tables()
             
+            if self._flusher is None:
+                self._flusher = asyncio.create_task(self._flush_loop())
+            if ANALYTICS_REFRESH_INTERVAL > 0 and self._refresh_task is None:
+                self._refresh_task = asyncio.create_task(self._refresh_analytics_periodically())
+            
             # Log system startup
             await self.log_system_event(
                 LogLevel.INFO,
@@ -45,19 +92,32 @@ class AdminService:
                 metadata={"start_time": self.start_time.isoformat()}
             )
             return True
-        except Exception as e:
-            print(f"Error initializing admin service: {e}")
+        except Exception:
+            logger.exception("Error initializing admin service")
             return False
     
     async def cleanup(self):
-        """Cleanup database connection"""
+        """Flush pending logs and stop background tasks; the shared database is closed by the application lifespan"""
         try:
-            await self.base_db.disconnect()
+            if self._refresh_task is not None:
+                self._refresh_task.cancel()
+                self._refresh_task = None
+            await self._drain_log_queue()
+            await self.local_cache.close()
+            await self.cache.close()
             return True
-        except Exception as e:
-            print(f"Error cleaning up admin service: {e}")
+        except Exception:
+            logger.exception("Error cleaning up admin service")
             return False
     
+    async def _refresh_analytics_periodically(self):
+        """Keep the pre-aggregated dashboard counters fresh"""
+        # Snapshots outlive two intervals so a slow refresh never falls back to live counting
+        ttl = ANALYTICS_REFRESH_INTERVAL * 2
+        while True:
+            await self.admin_db.refresh_analytics_snapshot(ttl)
+            await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+    
     async def log_user_activity(
         self,
         activity_type: ActivityType,
@@ -71,8 +131,8 @@ class AdminService:
     ) -> bool:
         """Log user activity"""
         try:
-            activity = UserActivityLog(
-                id=str(uuid.uuid4()),
+            activity = UserActivityRow(
+                id=new_id(),
                 user_id=user_id,
                 user_email=user_email,
                 activity_type=activity_type,
@@ -80,12 +140,13 @@ class AdminService:
                 ip_address=ip_address,
                 user_agent=user_agent,
                 metadata=metadata,
-                timestamp=datetime.now(),
+                timestamp=utc_now(),
                 session_id=session_id
             )
-            return await self.admin_db.log_user_activity(activity)
-        except Exception as e:
-            print(f"Error logging user activity: {e}")
+            self._enqueue_log(activity)
+            return True
+        except Exception:
+            logger.exception("Error logging user activity")
             return False
     
     async def log_system_event(
@@ -98,27 +159,94 @@ class AdminService:
     ) -> bool:
         """Log system event"""
         try:
-            log = SystemLog(
-                id=str(uuid.uuid4()),
+            log = SystemLogRow(
+                id=new_id(),
                 level=level,
                 component=component,
                 message=message,
                 stack_trace=stack_trace,
                 metadata=metadata,
-                timestamp=datetime.now()
+                timestamp=utc_now()
             )
-            return await self.admin_db.log_system_event(log)
-        except Exception as e:
-            print(f"Error logging system event: {e}")
+            self._enqueue_log(log)
+            return True
+        except Exception:
+            logger.exception("Error logging system event")
             return False
     
+    def _enqueue_log(self, entry: Any):
+        """Queue a log row for the flusher, dropping the oldest entry when the queue is full"""
+        if self._log_queue.full():
+            self._log_queue.get_nowait()
+            self._log_queue.task_done()
+        self._log_queue.put_nowait(entry)
+    
+    async def _flush_loop(self):
+        """Write queued log rows, one multi-row insert per table per batch"""
+        while True:
+            batch = [await self._log_queue.get()]
+            while len(batch) < LOG_BATCH_SIZE and not self._log_queue.empty():
+                batch.append(self._log_queue.get_nowait())
+            try:
+                activities = [entry for entry in batch if isinstance(entry, UserActivityRow)]
+                logs = [entry for entry in batch if isinstance(entry, SystemLogRow)]
+                if activities:
+                    await self.admin_db.log_user_activities(activities)
+                if logs:
+                    await self.admin_db.log_system_events(logs)
+            finally:
+                for _ in batch:
+                    self._log_queue.task_done()
+    
+    async def _drain_log_queue(self):
+        """Flush pending log rows and stop the flusher"""
+        if self._flusher is None:
+            return
+        try:
+            await asyncio.wait_for(self._log_queue.join(), LOG_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d unwritten log entries on shutdown", self._log_queue.qsize())
+        self._flusher.cancel()
+        self._flusher = None
+    
+    async def invalidate_cached_stats(self):
+        """Drop cached dashboard/health/realtime/analytics payloads and pending flags after a moderation write"""
+        await self.cache.delete(DASHBOARD_CACHE_KEY, HEALTH_CACHE_KEY, REALTIME_CACHE_KEY)
+        await self.local_cache.invalidate(
+            DASHBOARD_CACHE_KEY, HEALTH_CACHE_KEY, REALTIME_CACHE_KEY, PENDING_FLAGS_CACHE_KEY, ANALYTICS_CACHE_PREFIX
+        )
+    
+    async def _cached(self, key: str, ttl: float, factory) -> Any:
+        """Return the in-process cached value for key, computing it on a miss"""
+        value = self.local_cache.get(key)
+        if value is None:
+            value = await factory()
+            self.local_cache.set(key, value, ttl)
+        return value
+    
+    async def get_cached_payload(self, key: str, ttl: int, factory) -> bytes:
+        """Serialized JSON payload from the process cache, then Redis, then factory"""
+        return await self._cached(key, min(ttl, LOCAL_COPY_TTL), lambda: self.cache.get_or_set(key, ttl, factory))
+    
+    async def get_analytics_payload(self, filter_params: AnalyticsFilter) -> bytes:
+        """Serialized analytics for the given filter, cached per filter"""
+        key = f"{ANALYTICS_CACHE_PREFIX}:{filter_params.start_date}:{filter_params.end_date}:{filter_params.group_by}"
+        
+        async def build():
+            return dumps((await self.get_analytics(filter_params)).dict())
+        
+        return await self._cached(key, ANALYTICS_CACHE_TTL, build)
+    
     async def get_dashboard_stats(self) -> Dict[str, Any]:
         """Get comprehensive dashboard statistics"""
         try:
-            analytics = await self.admin_db.get_analytics_data()
-            recent_activities = await self.admin_db.get_recent_activities(10)
-            recent_logs = await self.admin_db.get_recent_logs(10)
-            pending_flags = await self.admin_db.get_pending_flags(10)
+            # Independent reads; on PostgreSQL each runs on its own pooled connection
+            analytics, recent_activities, recent_logs, pending_flags = await asyncio.gather(
+                self.admin_db.get_analytics_data(),
+                self.admin_db.get_recent_activities(10),
+                self.admin_db.get_recent_logs(10),
+                self.admin_db.get_pending_flags(10)
+            )
             
             return {
                 "analytics": analytics.dict(),
@@ -128,11 +256,11 @@ class AdminService:
                 "system_info": {
                     "uptime_hours": analytics.system_uptime,
                     "start_time": self.start_time.isoformat(),
-                    "current_time": datetime.now().isoformat()
+                    "current_time": utc_now().isoformat()
                 }
             }
-        except Exception as e:
-            print(f"Error getting dashboard stats: {e}")
+        except Exception:
+            logger.exception("Error getting dashboard stats")
             return {
                 "analytics": {},
                 "recent_activities": [],
@@ -145,8 +273,8 @@ class AdminService:
         """Get analytics data with optional filtering"""
         try:
             return await self.admin_db.get_analytics_data(filter_params)
-        except Exception as e:
-            print(f"Error getting analytics: {e}")
+        except Exception:
+            logger.exception("Error getting analytics")
             return AnalyticsData(
                 total_users=0, active_users_today=0, total_analyses=0, analyses_today=0,
                 total_appointments=0, appointments_today=0, total_patients=0, patients_today=0,
@@ -157,29 +285,39 @@ class AdminService:
     async def get_user_activities(self, filter_params: LogFilter = None) -> List[UserActivityLog]:
         """Get user activities with optional filtering"""
         try:
-            # For now, return recent activities. In production, implement proper filtering
-            limit = filter_params.limit if filter_params else 100
-            return await self.admin_db.get_recent_activities(limit)
-        except Exception as e:
-            print(f"Error getting user activities: {e}")
+            return await self.admin_db.get_user_activities(filter_params)
+        except Exception:
+            logger.exception("Error getting user activities")
             return []
     
     async def get_system_logs(self, filter_params: LogFilter = None) -> List[SystemLog]:
         """Get system logs with optional filtering"""
         try:
-            # For now, return recent logs. In production, implement proper filtering
-            limit = filter_params.limit if filter_params else 100
-            return await self.admin_db.get_recent_logs(limit)
-        except Exception as e:
-            print(f"Error getting system logs: {e}")
+            return await self.admin_db.get_system_logs(filter_params)
+        except Exception:
+            logger.exception("Error getting system logs")
             return []
     
+    def iter_log_rows(self, log_type: str, filter_params: LogFilter) -> Tuple[Tuple[str, ...], AsyncIterator[Any]]:
+        """Column names and a streaming row iterator for a log export"""
+        if log_type == "user_activities":
+            return USER_ACTIVITY_COLUMNS, self.admin_db.iter_user_activities(filter_params)
+        if log_type == "system":
+            return SYSTEM_LOG_COLUMNS, self.admin_db.iter_system_logs(filter_params)
+        raise ValueError(f"Invalid log type: {log_type}")
+    
+    async def get_realtime_counters(self, cutoff: datetime) -> Dict[str, int]:
+        """Activity, log and error-log counts since cutoff"""
+        return await self.admin_db.get_realtime_counters(cutoff)
+    
     async def get_pending_content_flags(self) -> List[ContentFlag]:
         """Get pending content flags for moderation"""
         try:
-            return await self.admin_db.get_pending_flags(50)
-        except Exception as e:
-            print(f"Error getting pending flags: {e}")
+            return await self._cached(
+                PENDING_FLAGS_CACHE_KEY, PENDING_FLAGS_CACHE_TTL, lambda: self.admin_db.get_pending_flags(50)
+            )
+        except Exception:
+            logger.exception("Error getting pending flags")
             return []
     
     async def create_content_flag(
@@ -194,7 +332,7 @@ class AdminService:
         """Create a new content flag"""
         try:
             flag = ContentFlag(
-                id=str(uuid.uuid4()),
+                id=new_id(),
                 content_type=content_type,
                 content_id=content_id,
                 reporter_id=reporter_id,
@@ -202,12 +340,13 @@ class AdminService:
                 reason=reason,
                 description=description,
                 status="pending",
-                timestamp=datetime.now()
+                timestamp=utc_now()
             )
             
             # Store in database
             success = await self._store_content_flag(flag)
             if success:
+                await self.invalidate_cached_stats()
                 # Log the flag creation
                 await self.log_system_event(
                     LogLevel.INFO,
@@ -217,41 +356,13 @@ class AdminService:
                 )
                 return flag
             return None
-        except Exception as e:
-            print(f"Error creating content flag: {e}")
+        except Exception:
+            logger.exception("Error creating content flag")
             return None
     
     async def _store_content_flag(self, flag: ContentFlag) -> bool:
         """Store content flag in database"""
-        try:
-            if hasattr(self.admin_db.base_manager, 'db'):
-                db = self.admin_db.base_manager.db
-                if hasattr(db, 'cursor'):  # SQLite
-                    cursor = db.cursor()
-                    cursor.execute('''
-                        INSERT INTO content_flags 
-                        (id, content_type, content_id, reporter_id, reporter_email, reason, description, status, timestamp)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        flag.id, flag.content_type, flag.content_id, flag.reporter_id,
-                        flag.reporter_email, flag.reason, flag.description, flag.status,
-                        flag.timestamp.isoformat()
-                    ))
-                    db.commit()
-                else:  # PostgreSQL
-                    await db.execute('''
-                        INSERT INTO content_flags 
-                        (id, content_type, content_id, reporter_id, reporter_email, reason, description, status, timestamp)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                    ''', (
-                        flag.id, flag.content_type, flag.content_id, flag.reporter_id,
-                        flag.reporter_email, flag.reason, flag.description, flag.status,
-                        flag.timestamp
-                    ))
-                return True
-        except Exception as e:
-            print(f"Error storing content flag: {e}")
-            return False
+        return await self.admin_db.store_content_flags([flag])
     
     async def moderate_content(
         self,
@@ -265,14 +376,8 @@ class AdminService:
     ) -> bool:
         """Moderate flagged content"""
         try:
-            # Update flag status
-            success = await self._update_flag_status(flag_id, status, admin_notes)
-            if not success:
-                return False
-            
-            # Create moderation action record
             action_record = ModerationAction(
-                id=str(uuid.uuid4()),
+                id=new_id(),
                 admin_id=admin_id,
                 admin_email=admin_email,
                 target_type="content_flag",
@@ -280,11 +385,13 @@ class AdminService:
                 action_type=action,
                 reason=reason,
                 status=status,
-                timestamp=datetime.now()
+                timestamp=utc_now()
             )
             
-            success = await self._store_moderation_action(action_record)
+            # Flag update and action record share one transaction (a single commit)
+            success = await self.admin_db.moderate_flag(flag_id, status, admin_notes, action_record)
             if success:
+                await self.invalidate_cached_stats()
                 # Log the moderation action
                 await self.log_system_event(
                     LogLevel.INFO,
@@ -299,64 +406,8 @@ class AdminService:
                 )
                 return True
             return False
-        except Exception as e:
-            print(f"Error moderating content: {e}")
-            return False
-    
-    async def _update_flag_status(self, flag_id: str, status: str, admin_notes: Optional[str] = None) -> bool:
-        """Update flag status in database"""
-        try:
-            if hasattr(self.admin_db.base_manager, 'db'):
-                db = self.admin_db.base_manager.db
-                if hasattr(db, 'cursor'):  # SQLite
-                    cursor = db.cursor()
-                    cursor.execute('''
-                        UPDATE content_flags 
-                        SET status = ?, admin_notes = ?
-                        WHERE id = ?
-                    ''', (status, admin_notes, flag_id))
-                    db.commit()
-                else:  # PostgreSQL
-                    await db.execute('''
-                        UPDATE content_flags 
-                        SET status = $1, admin_notes = $2
-                        WHERE id = $3
-                    ''', (status, admin_notes, flag_id))
-                return True
-        except Exception as e:
-            print(f"Error updating flag status: {e}")
-            return False
-    
-    async def _store_moderation_action(self, action: ModerationAction) -> bool:
-        """Store moderation action in database"""
-        try:
-            if hasattr(self.admin_db.base_manager, 'db'):
-                db = self.admin_db.base_manager.db
-                if hasattr(db, 'cursor'):  # SQLite
-                    cursor = db.cursor()
-                    cursor.execute('''
-                        INSERT INTO moderation_actions 
-                        (id, admin_id, admin_email, target_type, target_id, action_type, reason, status, timestamp)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        action.id, action.admin_id, action.admin_email, action.target_type,
-                        action.target_id, action.action_type, action.reason, action.status,
-                        action.timestamp.isoformat()
-                    ))
-                    db.commit()
-                else:  # PostgreSQL
-                    await db.execute('''
-                        INSERT INTO moderation_actions 
-                        (id, admin_id, admin_email, target_type, target_id, action_type, reason, status, timestamp)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                    ''', (
-                        action.id, action.admin_id, action.admin_email, action.target_type,
-                        action.target_id, action.action_type, action.reason, action.status,
-                        action.timestamp
-                    ))
-                return True
-        except Exception as e:
-            print(f"Error storing moderation action: {e}")
+        except Exception:
+            logger.exception("Error moderating content")
             return False
     
     async def get_system_health(self) -> Dict[str, Any]:
@@ -390,13 +441,13 @@ class AdminService:
                     "uptime": analytics.system_uptime,
                     "active_users": analytics.active_users_today
                 },
-                "last_updated": datetime.now().isoformat()
+                "last_updated": utc_now().isoformat()
             }
-        except Exception as e:
-            print(f"Error getting system health: {e}")
+        except Exception:
+            logger.exception("Error getting system health")
             return {
                 "health_score": 0.0,
                 "status": "unknown",
                 "metrics": {},
-                "last_updated": datetime.now().isoformat()
+                "last_updated": utc_now().isoformat()
             } 
\ No newline at end of file
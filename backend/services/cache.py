@@ -0,0 +1,448 @@
+import logging
+import asyncio
+from abc import ABC, abstractmethod
+import os
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+import orjson
+
+logger = logging.getLogger(__name__)
+
+def _default(obj: Any) -> Any:
+    """orjson fallback for types it does not encode natively"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(value: Any) -> bytes:
+    """Encode a cache payload"""
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class RedisCache:
+    """Look-aside JSON cache backed by Redis.
+
+    Values are stored as orjson-encoded bytes. When REDIS_URL is not set (or the
+    redis package is missing) every lookup falls through to the factory, so callers
+    never need to special-case a cache-less deployment.
+    """
+
+    def __init__(self, url: Optional[str] = None, lock_ttl: float = 5.0):
+        self.url = url or os.getenv("REDIS_URL")
+        self.lock_ttl = lock_ttl
+        self._client = None
+
+    def _get_client(self):
+        """Lazily create the Redis client"""
+        if self._client is None and self.url:
+            try:
+                import redis.asyncio as redis
+                self._client = redis.from_url(self.url)
+            except ImportError:
+                logger.warning("redis package not installed, response caching disabled")
+                self.url = None
+        return self._client
+
+    async def get_or_set(self, key: str, ttl: int, factory: Callable[[], Awaitable[Any]]) -> bytes:
+        """Return the cached JSON payload for key, computing and storing it on a miss.
+
+        Only one caller fills a missing key: it takes a short SET NX lease while the
+        others poll for the value instead of all hitting the database at once.
+        """
+        client = self._get_client()
+        if client is None:
+            return dumps(await factory())
+
+        lock_key = f"{key}:lock"
+        try:
+            cached = await client.get(key)
+            if cached is not None:
+                return cached
+            acquired = await client.set(lock_key, b"1", nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.warning("Cache unavailable for %s: %s", key, e)
+            return dumps(await factory())
+
+        if acquired:
+            try:
+                payload = dumps(await factory())
+                await self._quietly(client.set(key, payload, ex=ttl))
+                return payload
+            finally:
+                await self._quietly(client.delete(lock_key))
+
+        # Another worker holds the lease; wait for it to publish the value
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        while loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            cached = await self._quietly(client.get(key))
+            if cached is not None:
+                return cached
+        return dumps(await factory())
+
+    @property
+    def enabled(self) -> bool:
+        return self._get_client() is not None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Raw cached payload, or None on a miss"""
+        client = self._get_client()
+        if client is None:
+            return None
+        return await self._quietly(client.get(key))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Raw cached payloads for keys in one MGET, None for each miss"""
+        client = self._get_client()
+        if client is None or not keys:
+            return [None] * len(keys)
+        payloads = await self._quietly(client.mget(keys))
+        return payloads if payloads is not None else [None] * len(keys)
+
+    async def set_many(self, payloads: Dict[str, bytes], ttl: int) -> None:
+        """Store several raw payloads with a TTL in one pipelined round trip"""
+        client = self._get_client()
+        if client is None or not payloads:
+            return
+        pipe = client.pipeline(transaction=False)
+        for key, payload in payloads.items():
+            pipe.set(key, payload, ex=ttl)
+        await self._quietly(pipe.execute())
+
+    async def set(self, key: str, payload: bytes, ttl: int) -> None:
+        """Store a raw payload with a TTL in seconds"""
+        client = self._get_client()
+        if client is not None:
+            await self._quietly(client.set(key, payload, ex=ttl))
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        """Publish a message to other workers"""
+        client = self._get_client()
+        if client is not None:
+            await self._quietly(client.publish(channel, payload))
+
+    async def delete(self, *keys: str) -> None:
+        """Invalidate cached entries"""
+        client = self._get_client()
+        if client is not None and keys:
+            await self._quietly(client.delete(*keys))
+
+    async def close(self) -> None:
+        """Close the Redis connection pool"""
+        if self._client is not None:
+            await self._quietly(self._client.aclose())
+            self._client = None
+
+    async def _quietly(self, coro: Awaitable[Any]) -> Any:
+        """Await a Redis call, treating connection errors as a cache miss"""
+        try:
+            return await coro
+        except Exception as e:
+            logger.warning("Cache error: %s", e)
+            return None
+
+
+class TTLCache:
+    """Bounded in-process LRU whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def pop_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._entries if isinstance(key, str) and key.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class _BroadcastInvalidation(ABC):
+    """Redis pub/sub plumbing shared by the in-process caches.
+
+    Invalidated keys are published on a per-namespace channel so every worker
+    evicts its local copy; subclasses implement _evict_local.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.l2 = RedisCache()
+        self.channel = f"{namespace}:invalidate"
+        self._listener: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    def _evict_local(self, key: str) -> None:
+        """Drop key from this worker's in-process tier"""
+
+    async def _broadcast(self, keys) -> None:
+        await self.l2.publish(self.channel, orjson.dumps(list(keys)))
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self.l2.close()
+
+    def _ensure_listener(self) -> None:
+        """Start (or restart) the pub/sub listener once Redis is in use"""
+        if (self._listener is None or self._listener.done()) and self.l2.enabled:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        try:
+            pubsub = self.l2._get_client().pubsub()
+            await pubsub.subscribe(self.channel)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    for key in orjson.loads(message["data"]):
+                        self._evict_local(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener stopped")
+
+
+class TieredCache(_BroadcastInvalidation):
+    """In-process TTLCache (L1) in front of Redis (L2) for point lookups.
+
+    Invalidations drop the local entry, delete the Redis key and are published
+    on a per-namespace channel so other workers evict their L1 copy as well.
+    Missing values (None) are never cached. Concurrent misses on one key share a
+    single load. decode rebuilds a value from its JSON form when it is read back
+    from Redis, so both tiers hand out the same type.
+    """
+
+    def __init__(self, namespace: str, l1_maxsize: int = 10_000, l1_ttl: float = 30.0, l2_ttl: int = 300,
+                 decode: Optional[Callable[[Any], Any]] = None):
+        super().__init__(namespace)
+        self.l1 = TTLCache(l1_maxsize, l1_ttl)
+        self.l2_ttl = l2_ttl
+        self.decode = decode
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Keys of get_many_or_load batches still loading; invalidation drops keys from them
+        self._pending_batches: List[Set[str]] = []
+
+    def _decode(self, payload: bytes) -> Any:
+        value = orjson.loads(payload)
+        return self.decode(value) if self.decode else value
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _evict_local(self, key: str) -> None:
+        self.l1.pop(key)
+        # A load already under way may have read the old row; it must not be cached
+        self._inflight.pop(key, None)
+        for pending in self._pending_batches:
+            pending.discard(key)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, loading it from the database on a miss"""
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+
+        # Single-flight: later callers wait on the first caller's load instead of repeating it
+        load = self._inflight.get(key)
+        if load is None:
+            load = self._inflight[key] = asyncio.ensure_future(self._load(key, loader))
+            load.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(load)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        self._ensure_listener()
+        payload = await self.l2.get(self._key(key))
+        if payload is not None:
+            value = self._decode(payload)
+            self._store_l1(key, value)
+            return value
+
+        value = await loader()
+        if value is None or not self._is_current(key):
+            return value
+        # Redis first, then re-check: an invalidation that landed during the write may
+        # have deleted the key before our set reached Redis, so take the stale copy back out
+        await self.l2.set(self._key(key), dumps(value), self.l2_ttl)
+        if not self._is_current(key):
+            await self.l2.delete(self._key(key))
+            return value
+        self.l1.set(key, value)
+        return value
+
+    def _forget(self, key: str, load: asyncio.Future) -> None:
+        if self._inflight.get(key) is load:
+            del self._inflight[key]
+
+    def _is_current(self, key: str) -> bool:
+        """False once the key was invalidated while this load was running"""
+        return self._inflight.get(key) is asyncio.current_task()
+
+    def _store_l1(self, key: str, value: Any) -> bool:
+        """Cache a loaded value unless the key was invalidated while it loaded"""
+        if not self._is_current(key):
+            return False
+        self.l1.set(key, value)
+        return True
+
+    async def get_many_or_load(self, keys: List[str],
+                               loader: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Values for keys that exist, with all misses loaded by one loader(missing) call"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.l1.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        self._ensure_listener()
+        pending = set(missing)
+        self._pending_batches.append(pending)
+        try:
+            payloads = await self.l2.get_many([self._key(key) for key in missing])
+            still_missing = []
+            for key, payload in zip(missing, payloads):
+                if payload is not None:
+                    found[key] = self._decode(payload)
+                    if key in pending:
+                        self.l1.set(key, found[key])
+                else:
+                    still_missing.append(key)
+            if not still_missing:
+                return found
+
+            loaded = await loader(still_missing)
+            found.update(loaded)
+            # Only keys nobody invalidated while the batch loaded are cached; same
+            # Redis-then-recheck order as _load
+            fresh = [key for key in loaded if key in pending]
+            await self.l2.set_many({self._key(key): dumps(loaded[key]) for key in fresh}, self.l2_ttl)
+            stale = [key for key in fresh if key not in pending]
+            if stale:
+                await self.l2.delete(*(self._key(key) for key in stale))
+            for key in fresh:
+                if key in pending:
+                    self.l1.set(key, loaded[key])
+            return found
+        finally:
+            # By identity: two batches over the same keys hold equal sets
+            self._pending_batches = [batch for batch in self._pending_batches if batch is not pending]
+
+    async def invalidate(self, *keys: str) -> None:
+        """Evict keys from every tier and every worker"""
+        if not keys:
+            return
+        for key in keys:
+            self._evict_local(key)
+        await self.l2.delete(*(self._key(key) for key in keys))
+        await self._broadcast(keys)
+
+    async def close(self) -> None:
+        self.l1.clear()
+        await super().close()
+
+
+class ScopedCache(_BroadcastInvalidation):
+    """In-process cache of derived values grouped under a scope (e.g. one patient).
+
+    Each scope holds a bucket of results keyed by query arguments; invalidate(scope)
+    drops the whole bucket here and, via pub/sub, in every other worker. Empty
+    results are not cached, since the database layer also returns them on errors.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 10_000, ttl: float = 300.0):
+        super().__init__(namespace)
+        self.buckets = TTLCache(maxsize, ttl)
+
+    def _evict_local(self, scope: str) -> None:
+        self.buckets.pop(scope)
+
+    async def get_or_load(self, scope: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key within scope, loading it on a miss"""
+        bucket = self.buckets.get(scope)
+        if bucket is None:
+            self._ensure_listener()
+            bucket = {}
+            self.buckets.set(scope, bucket)
+        elif key in bucket:
+            return bucket[key]
+
+        value = await loader()
+        if value:
+            # A concurrent invalidation detaches this bucket, so a stale value is never served
+            bucket[key] = value
+        return value
+
+    async def invalidate(self, *scopes: str) -> None:
+        """Drop every cached value for scopes in every worker"""
+        if not scopes:
+            return
+        for scope in scopes:
+            self.buckets.pop(scope)
+        await self._broadcast(scopes)
+
+    async def close(self) -> None:
+        self.buckets.clear()
+        await super().close()
+
+
+class LocalCache(_BroadcastInvalidation):
+    """In-process TTLCache whose invalidations reach every worker.
+
+    Suits small read models every worker computes or copies for itself. invalidate(key)
+    drops key and every key under "key:" here and, via pub/sub, in every other
+    worker, so one prefix covers a family such as per-filter results.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 256, ttl: float = 30.0):
+        super().__init__(namespace)
+        self.entries = TTLCache(maxsize, ttl)
+
+    def _evict_local(self, key: str) -> None:
+        self.entries.pop(key)
+        self.entries.pop_prefix(f"{key}:")
+
+    def get(self, key: str) -> Any:
+        return self.entries.get(key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._ensure_listener()
+        self.entries.set(key, value, ttl)
+
+    async def invalidate(self, *keys: str) -> None:
+        """Drop keys (and the keys under them) in every worker"""
+        if not keys:
+            return
+        for key in keys:
+            self._evict_local(key)
+        await self._broadcast(keys)
+
+    async def close(self) -> None:
+        self.entries.clear()
+        await super().close()
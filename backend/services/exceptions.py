@@ -0,0 +1,23 @@
+class ServiceError(Exception):
+    """Base class for errors raised by the service layer"""
+
+
+class NotFoundError(ServiceError):
+    """Requested entity does not exist (HTTP 404)"""
+    detail = "Not found"
+
+
+class PatientNotFound(NotFoundError):
+    detail = "Patient not found"
+
+
+class MedicalRecordNotFound(NotFoundError):
+    detail = "Medical record not found"
+
+
+class ValidationError(ServiceError, ValueError):
+    """Request data was rejected by the service layer (HTTP 400)"""
+
+
+class PatientAlreadyExists(ValidationError):
+    """A patient with the same email is already registered"""
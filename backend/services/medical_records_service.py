@@ -1,14 +1,58 @@
+import logging
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import asyncio
+import shutil
 import uuid
 import os
+from database.clock import now_iso
 from database.config import DatabaseConfig
+from database.ids import parse_id
+from services.cache import ScopedCache, TieredCache
+from services.exceptions import MedicalRecordNotFound, PatientNotFound, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Uploads are copied to disk in chunks of this size, so memory use does not grow with the image
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Chunks handed to the kernel per writev() call where vectored writes are available
+UPLOAD_WRITEV_CHUNKS = 8
+# fsync saved images before the record is created; bulk imports can turn this off
+FSYNC_MEDICAL_IMAGES = os.getenv("FSYNC_MEDICAL_IMAGES", "true").lower() == "true"
+
+# Medical records by ID, shared by every service instance in the process
+record_cache = TieredCache("medical_record")
+# Per-patient history, timeline and summary reads, keyed by (kind, args); a write to any of
+# the patient's records drops all of them
+patient_records_cache = ScopedCache("patient_records", ttl=300.0)
+
+REQUIRED_RECORD_FIELDS = ('record_type', 'modality')
+
+def _write_vectored(source, fd: int):
+    """Copy source to fd, submitting up to UPLOAD_WRITEV_CHUNKS chunks per write syscall"""
+    while True:
+        chunks = []
+        while len(chunks) < UPLOAD_WRITEV_CHUNKS:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        if not chunks:
+            return
+        
+        written = os.writev(fd, chunks)
+        total = sum(len(chunk) for chunk in chunks)
+        if written < total:
+            # Short write: finish the remainder of this batch before reading more
+            remaining = memoryview(b"".join(chunks))[written:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining):]
 
 class MedicalRecordsService:
     """Service layer for medical records management"""
     
     def __init__(self):
-        self.db = DatabaseConfig.get_database_manager()
+        self.db = DatabaseConfig.get_shared_database_manager()
         self.upload_dir = "uploads/medical_images"
         self._ensure_upload_dir()
     
@@ -21,223 +65,226 @@ class MedicalRecordsService:
         return await self.db.connect()
     
     async def cleanup(self):
-        """Cleanup database connection"""
-        return await self.db.disconnect()
+        """Release caches; the shared database is closed by the application lifespan"""
+        await record_cache.close()
+        await patient_records_cache.close()
+        return True
     
     async def create_medical_record(self, patient_id: str, record_data: Dict[str, Any], image_file=None) -> Dict[str, Any]:
         """Create a new medical record with optional image"""
+        # Cache keys and invalidations use the canonical id, however the URL spelled it
+        canonical_id = parse_id(patient_id)
+        if canonical_id is None:
+            raise PatientNotFound(patient_id)
+        patient_id = canonical_id
+        image_path = None
         try:
             # Validate required fields
-            required_fields = ['record_type', 'modality']
-            for field in required_fields:
-                if not record_data.get(field):
-                    raise ValueError(f"Missing required field: {field}")
+            missing = [field for field in REQUIRED_RECORD_FIELDS if not record_data.get(field)]
+            if missing:
+                raise ValidationError(f"Missing required field: {missing[0]}")
             
             # Handle image upload if provided
-            image_path = None
             if image_file:
                 image_path = await self._save_medical_image(patient_id, image_file, record_data['modality'])
                 record_data['image_path'] = image_path
             
-            # Add metadata
-            record_data['created_at'] = datetime.now().isoformat()
-            record_data['updated_at'] = datetime.now().isoformat()
-            
             # Create record in database
             record_id = await self.db.add_medical_record(patient_id, record_data)
+            if record_id is None:
+                if image_path and os.path.exists(image_path):
+                    os.remove(image_path)
+                raise PatientNotFound(patient_id)
+            
+            await patient_records_cache.invalidate(patient_id)
             
             # Return created record
             return await self.db.get_medical_record(record_id)
             
-        except Exception as e:
+        except Exception:
             # Cleanup image if record creation failed
             if image_path and os.path.exists(image_path):
                 os.remove(image_path)
-            raise Exception(f"Failed to create medical record: {str(e)}")
+            raise
     
     async def get_medical_record(self, record_id: str) -> Optional[Dict[str, Any]]:
         """Get medical record by ID"""
+        record_id = parse_id(record_id)
+        if record_id is None:
+            return None
         try:
-            return await self.db.get_medical_record(record_id)
-        except Exception as e:
-            print(f"Error retrieving medical record: {e}")
+            return await record_cache.get_or_load(record_id, lambda: self.db.get_medical_record(record_id))
+        except Exception:
+            logger.exception("Error retrieving medical record")
             return None
     
-    async def get_medical_history(self, patient_id: str, limit: int = 50, record_type: str = None) -> List[Dict[str, Any]]:
+    async def get_medical_history(self, patient_id: str, limit: int = 50, record_type: str = None,
+                                  modality: str = None) -> List[Dict[str, Any]]:
         """Get patient's medical history with optional filtering"""
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return []
         try:
-            records = await self.db.get_medical_history(patient_id, limit)
-            
-            # Filter by record type if specified
-            if record_type:
-                records = [r for r in records if r.get('record_type') == record_type]
+            return await patient_records_cache.get_or_load(
+                patient_id, ("history", limit, record_type, modality),
+                lambda: self.db.get_medical_history(patient_id, limit, record_type, modality)
+            )
             
-            return records
-            
-        except Exception as e:
-            print(f"Error retrieving medical history: {e}")
+        except Exception:
+            logger.exception("Error retrieving medical history")
             return []
     
     async def update_medical_record(self, record_id: str, record_data: Dict[str, Any]) -> Dict[str, Any]:
         """Update medical record"""
-        try:
-            # Check if record exists
-            existing_record = await self.db.get_medical_record(record_id)
-            if not existing_record:
-                raise ValueError(f"Medical record with ID {record_id} not found")
-            
-            # Add update timestamp
-            record_data['updated_at'] = datetime.now().isoformat()
-            
-            # Update record
-            success = await self.db.update_medical_record(record_id, record_data)
-            if not success:
-                raise Exception("Failed to update medical record")
-            
-            # Return updated record
-            return await self.db.get_medical_record(record_id)
-            
-        except Exception as e:
-            raise Exception(f"Failed to update medical record: {str(e)}")
+        canonical_id = parse_id(record_id)
+        if canonical_id is None:
+            raise MedicalRecordNotFound(record_id)
+        record_id = canonical_id
+        
+        # Existence check, update and read-back in one statement
+        record = await self.db.update_medical_record_returning(record_id, record_data)
+        if record is None:
+            raise MedicalRecordNotFound(record_id)
+        
+        await record_cache.invalidate(record_id)
+        await patient_records_cache.invalidate(str(record['patient_id']))
+        return record
     
     async def delete_medical_record(self, record_id: str) -> bool:
         """Delete medical record and associated image"""
-        try:
-            # Get record to find image path
-            record = await self.db.get_medical_record(record_id)
-            if not record:
-                raise ValueError(f"Medical record with ID {record_id} not found")
-            
-            # Delete associated image if exists
-            if record.get('image_path') and os.path.exists(record['image_path']):
-                os.remove(record['image_path'])
-            
-            # Delete record from database
-            return await self.db.delete_medical_record(record_id)
-            
-        except Exception as e:
-            raise Exception(f"Failed to delete medical record: {str(e)}")
+        canonical_id = parse_id(record_id)
+        if canonical_id is None:
+            raise MedicalRecordNotFound(record_id)
+        record_id = canonical_id
+        
+        # The deleted row names the image to remove; no read beforehand
+        record = await self.db.delete_medical_record_returning(record_id)
+        if record is None:
+            raise MedicalRecordNotFound(record_id)
+        
+        # Delete associated image if exists
+        if record.get('image_path') and os.path.exists(record['image_path']):
+            os.remove(record['image_path'])
+        
+        await record_cache.invalidate(record_id)
+        await patient_records_cache.invalidate(str(record['patient_id']))
+        return True
     
     async def get_records_by_condition(self, patient_id: str, condition: str) -> List[Dict[str, Any]]:
         """Get all records for a specific condition"""
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return []
         try:
-            return await self.db.get_condition_history(patient_id, condition)
-        except Exception as e:
-            print(f"Error getting condition history: {e}")
+            return await patient_records_cache.get_or_load(
+                patient_id, ("condition", condition),
+                lambda: self.db.get_condition_history(patient_id, condition)
+            )
+        except Exception:
+            logger.exception("Error getting condition history")
             return []
     
     async def get_records_by_modality(self, patient_id: str, modality: str) -> List[Dict[str, Any]]:
         """Get all records for a specific imaging modality"""
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return []
         try:
-            records = await self.db.get_medical_history(patient_id, limit=100)
-            return [r for r in records if r.get('modality') == modality]
-        except Exception as e:
-            print(f"Error getting records by modality: {e}")
+            return await patient_records_cache.get_or_load(
+                patient_id, ("modality", modality),
+                lambda: self.db.get_medical_history(patient_id, limit=100, modality=modality)
+            )
+        except Exception:
+            logger.exception("Error getting records by modality")
             return []
     
     async def get_records_timeline(self, patient_id: str, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
         """Get medical records within a date range"""
         try:
-            records = await self.db.get_medical_history(patient_id, limit=100)
-            
-            # Filter by date range if provided
-            if start_date or end_date:
-                filtered_records = []
-                for record in records:
-                    record_date = datetime.fromisoformat(record['created_at'].replace('Z', '+00:00'))
-                    
-                    if start_date:
-                        start = datetime.fromisoformat(start_date)
-                        if record_date < start:
-                            continue
-                    
-                    if end_date:
-                        end = datetime.fromisoformat(end_date)
-                        if record_date > end:
-                            continue
-                    
-                    filtered_records.append(record)
-                
-                return filtered_records
-            
-            return records
-            
-        except Exception as e:
-            print(f"Error getting records timeline: {e}")
+            start = datetime.fromisoformat(start_date) if start_date else None
+            end = datetime.fromisoformat(end_date) if end_date else None
+        except ValueError:
+            raise ValidationError("Dates must be in ISO format (YYYY-MM-DD)")
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return []
+        
+        try:
+            return await patient_records_cache.get_or_load(
+                patient_id, ("timeline", start, end),
+                lambda: self.db.get_medical_history(patient_id, limit=100, start=start, end=end)
+            )
+        except Exception:
+            logger.exception("Error getting records timeline")
             return []
     
     async def _save_medical_image(self, patient_id: str, image_file, modality: str) -> str:
         """Save medical image to disk"""
-        try:
-            # Create patient-specific directory
-            patient_dir = os.path.join(self.upload_dir, patient_id)
-            os.makedirs(patient_dir, exist_ok=True)
-            
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_extension = os.path.splitext(image_file.filename)[1] if hasattr(image_file, 'filename') else '.jpg'
-            filename = f"{modality}_{timestamp}{file_extension}"
-            
-            file_path = os.path.join(patient_dir, filename)
-            
-            # Save file
-            with open(file_path, "wb") as buffer:
-                if hasattr(image_file, 'file'):
-                    # FastAPI UploadFile
-                    buffer.write(image_file.file.read())
-                else:
-                    # Direct file object
-                    buffer.write(image_file.read())
-            
-            return file_path
-            
-        except Exception as e:
-            raise Exception(f"Failed to save medical image: {str(e)}")
+        # Create patient-specific directory
+        patient_dir = os.path.join(self.upload_dir, patient_id)
+        os.makedirs(patient_dir, exist_ok=True)
+        
+        # Generate unique filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_extension = os.path.splitext(image_file.filename)[1] if hasattr(image_file, 'filename') else '.jpg'
+        filename = f"{modality}_{timestamp}{file_extension}"
+        
+        file_path = os.path.join(patient_dir, filename)
+        
+        # FastAPI UploadFile wraps a spooled temp file; direct file objects are copied as-is
+        source = image_file.file if hasattr(image_file, 'file') else image_file
+        await asyncio.to_thread(self._copy_to_disk, source, file_path)
+        
+        return file_path
+    
+    @staticmethod
+    def _copy_to_disk(source, file_path: str):
+        """Blocking chunked copy, run off the event loop"""
+        with open(file_path, "wb") as buffer:
+            if hasattr(os, "writev"):
+                _write_vectored(source, buffer.fileno())
+            else:
+                shutil.copyfileobj(source, buffer, UPLOAD_CHUNK_SIZE)
+            if FSYNC_MEDICAL_IMAGES:
+                buffer.flush()
+                os.fsync(buffer.fileno())
     
     async def get_image_path(self, record_id: str) -> Optional[str]:
         """Get the file path for a medical image"""
         try:
-            record = await self.db.get_medical_record(record_id)
+            record = await self.get_medical_record(record_id)
             if record and record.get('image_path'):
                 return record['image_path'] if os.path.exists(record['image_path']) else None
             return None
-        except Exception as e:
-            print(f"Error getting image path: {e}")
+        except Exception:
+            logger.exception("Error getting image path")
             return None
     
     async def get_records_summary(self, patient_id: str) -> Dict[str, Any]:
         """Get a summary of all medical records for a patient"""
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return {}
         try:
-            # Get all records
-            all_records = await self.db.get_medical_history(patient_id, limit=1000)
-            
-            # Group by modality
-            records_by_modality = {}
-            for record in all_records:
-                modality = record.get('modality', 'Unknown')
-                if modality not in records_by_modality:
-                    records_by_modality[modality] = []
-                records_by_modality[modality].append(record)
-            
-            # Get recent activity
-            recent_records = all_records[:10] if all_records else []
-            
-            # Get conditions summary
-            conditions = {}
-            for record in all_records:
-                diagnosis = record.get('diagnosis', 'Unknown')
-                if diagnosis not in conditions:
-                    conditions[diagnosis] = 0
-                conditions[diagnosis] += 1
-            
-            return {
-                "total_records": len(all_records),
-                "records_by_modality": {k: len(v) for k, v in records_by_modality.items()},
-                "recent_records": recent_records,
-                "common_conditions": dict(sorted(conditions.items(), key=lambda x: x[1], reverse=True)[:5]),
-                "summary_generated_at": datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            print(f"Error getting records summary: {e}")
-            return {} 
\ No newline at end of file
+            return await patient_records_cache.get_or_load(
+                patient_id, ("summary",), lambda: self._build_records_summary(patient_id)
+            )
+        except Exception:
+            logger.exception("Error getting records summary")
+            return {}
+    
+    async def _build_records_summary(self, patient_id: str) -> Dict[str, Any]:
+        """Aggregate the summary in SQL: per-modality and per-diagnosis counts plus the latest records"""
+        records_by_modality, common_conditions, recent_records = await asyncio.gather(
+            self.db.get_records_group_counts(patient_id, "modality"),
+            self.db.get_records_group_counts(patient_id, "diagnosis", limit=5),
+            self.db.get_medical_history(patient_id, limit=10)
+        )
+        
+        return {
+            "total_records": sum(records_by_modality.values()),
+            "records_by_modality": records_by_modality,
+            "recent_records": recent_records,
+            "common_conditions": common_conditions,
+            "summary_generated_at": now_iso()
+        }
@@ -1,27 +1,183 @@
+import logging
+import asyncio
+import hashlib
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from models.mri_model import load_mri_model, predict_mri
+import torch
+from models.mri_model import load_mri_model, optimize_mri_model, preprocess_mri, predict_mri_batch, top_mri_predictions, warmup_mri_model
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 # Resolve backend root (one level up from services/)
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
 
+# Comma-separated MRI models to preload; only 3D by default, add 2d if needed
+MRI_MODEL_MODES = [m.strip() for m in os.getenv("MRI_MODEL_MODES", "3d").split(",") if m.strip()]
+
+# Serving precision: auto (FP16 on CUDA, FP32 on CPU), fp32, fp16 or int8 (dynamic, Linear layers only)
+MRI_PRECISION = os.getenv("MRI_PRECISION", "auto").lower()
+
+# Files larger than this are keyed by path, size and mtime instead of a content hash
+MRI_HASH_MAX_BYTES = int(os.getenv("MRI_HASH_MAX_BYTES", str(256 << 20)))
+
+# Concurrent requests are coalesced into one forward pass of up to this many scans,
+# waiting at most MRI_BATCH_WINDOW_MS for the batch to fill
+MRI_BATCH_SIZE = int(os.getenv("MRI_BATCH_SIZE", "4"))
+MRI_BATCH_WINDOW_MS = float(os.getenv("MRI_BATCH_WINDOW_MS", "10"))
+# Threads for hashing and decoding uploaded scans (NIfTI/DICOM/PNG)
+MRI_IO_WORKERS = int(os.getenv("MRI_IO_WORKERS", "4"))
+
 # Cache
 _cache_mri = {}
+_init_lock = threading.Lock()
+
+# Predictions are deterministic for a given input, so repeat analyses of a file skip inference
+_pred_cache = TTLCache(maxsize=128, ttl=math.inf)
+_pred_lock = threading.Lock()
+
+# Scan I/O runs on its own pool so it neither blocks the event loop nor queues behind
+# the default executor; forward passes are serialized on one dedicated thread
+_io_pool = ThreadPoolExecutor(max_workers=MRI_IO_WORKERS, thread_name_prefix="mri-io")
+_infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mri-infer")
+
+def _load_warm(mode, device):
+    model = optimize_mri_model(load_mri_model(mode, device), device, MRI_PRECISION)
+    warmup_mri_model(model, mode, device)
+    return model
+
+def init_mri_models(device='cpu', modes=None):
+    """Load and warm up the MRI models in parallel, so startup takes as long as the slowest one"""
+    with _init_lock:
+        # Re-checked under the lock so concurrent callers never load a model twice
+        modes = [m for m in (modes or MRI_MODEL_MODES) if m not in _cache_mri]
+        if not modes:
+            return
+        with ThreadPoolExecutor(max_workers=len(modes)) as ex:
+            futs = {m: ex.submit(_load_warm, m, device) for m in modes}
+        for mode, fut in futs.items():
+            try:
+                _cache_mri[mode] = fut.result()
+            except Exception as e:
+                # Warn but allow app to continue with the models that did load
+                logger.warning("Could not initialize MRI %s model: %s", mode, e)
 
-def init_mri_models(device='cpu'):
-    # Load only 3D by default; uncomment 2D if needed
-    _cache_mri['3d'] = load_mri_model('3d', device)
+init_mri_models()
 
-try:
-    init_mri_models()
-except Exception as e:
-    # Print a clear warning but allow app to continue
-    print(f"Warning: Could not initialize MRI models: {e}")
-    _cache_mri = {}  # Ensure cache is empty if initialization fails
+def _file_key(path: str):
+    """Content hash of the file, or its identity on disk when it is too large to hash cheaply"""
+    stat = os.stat(path)
+    if stat.st_size > MRI_HASH_MAX_BYTES:
+        return ("stat", os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return ("sha256", digest.hexdigest())
 
-def process_mri(path: str, mode: str = '3d', device: str = 'cpu', top_k: int = 2):
+class MRIBatcher:
+    """Micro-batches concurrent inference requests for one MRI model"""
+
+    def __init__(self, mode: str, device: str, max_batch: int = MRI_BATCH_SIZE,
+                 window: float = MRI_BATCH_WINDOW_MS / 1000):
+        self.mode = mode
+        self.device = device
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, tensor):
+        """Queue one preprocessed scan and wait for its row of class probabilities"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((tensor, future))
+        return await future
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = asyncio.get_running_loop().time() + self.window
+                while len(batch) < self.max_batch:
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                
+                futures = [future for _, future in batch]
+                try:
+                    stacked = torch.stack([tensor for tensor, _ in batch])
+                    probs = await asyncio.get_running_loop().run_in_executor(
+                        _infer_pool, predict_mri_batch, _cache_mri[self.mode], stacked, self.mode, self.device
+                    )
+                    for future, row in zip(futures, probs):
+                        if not future.done():
+                            future.set_result(row)
+                except Exception as e:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                batch = []
+        except asyncio.CancelledError:
+            # Scans already taken off the queue would otherwise wait forever
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("MRI batcher shut down"))
+            raise
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        # Scans still queued would otherwise wait forever
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("MRI batcher shut down"))
+
+_batchers = {}
+
+def _get_batcher(mode: str, device: str) -> MRIBatcher:
+    batcher = _batchers.get((mode, device))
+    if batcher is None:
+        batcher = _batchers[(mode, device)] = MRIBatcher(mode, device)
+    return batcher
+
+async def process_mri(path: str, mode: str = '3d', device: str = 'cpu', top_k: int = 2):
+    loop = asyncio.get_running_loop()
+    key = (await loop.run_in_executor(_io_pool, _file_key, path), mode, top_k)
+    with _pred_lock:
+        cached = _pred_cache.get(key)
+    if cached is not None:
+        return list(cached)
+    
+    if mode not in _cache_mri:
+        # Models not preloaded at startup (e.g. 2D) are loaded on first use
+        await loop.run_in_executor(_infer_pool, init_mri_models, device, [mode])
     if mode not in _cache_mri or not _cache_mri[mode]:
         raise RuntimeError(f"MRI model for mode '{mode}' not initialized. Please check model files.")
-    return predict_mri(_cache_mri[mode], path, mode, device, top_k)
+    tensor = await loop.run_in_executor(_io_pool, preprocess_mri, path, mode)
+    probs = await _get_batcher(mode, device).submit(tensor)
+    preds = top_mri_predictions(probs, top_k)
+    with _pred_lock:
+        _pred_cache.set(key, preds)
+    return preds
+
+async def shutdown_mri_batchers():
+    """Stop the batching workers"""
+    for batcher in _batchers.values():
+        await batcher.close()
+    _batchers.clear()
 
 def is_supported_mri_file(filename: str, mode: str) -> bool:
     ext = Path(filename).suffix.lower()
@@ -1,170 +1,221 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+import logging
+from typing import List, Optional, Dict, Any, Union
+from datetime import date
+from functools import lru_cache
 import uuid
+from database.base import Patient
+from database.clock import now_iso
 from database.config import DatabaseConfig
+from database.ids import parse_id
+from services.cache import TieredCache
+from services.dataloader import DataLoader
+from services.exceptions import PatientAlreadyExists, PatientNotFound, ValidationError
+from services.medical_records_service import patient_records_cache, record_cache
+
+logger = logging.getLogger(__name__)
+
+# Patients by ID, and by email; shared by every service instance in the process
+patient_cache = TieredCache("patient", decode=Patient.from_row)
+patient_email_cache = TieredCache("patient_email", decode=Patient.from_row)
+
+REQUIRED_PATIENT_FIELDS = ('email', 'name')
+
+@lru_cache(maxsize=4096)
+def _parse_date_of_birth(date_of_birth: str) -> date:
+    # Only the calendar date matters, so any time or offset suffix is ignored
+    return date.fromisoformat(date_of_birth[:10])
 
 class PatientService:
     """Service layer for patient management operations"""
     
     def __init__(self):
-        self.db = DatabaseConfig.get_database_manager()
+        self.db = DatabaseConfig.get_shared_database_manager()
+        # Cache misses from concurrent requests are fetched together in one query
+        self._patient_loader = DataLoader(self._load_patients_by_ids)
+        self._patient_email_loader = DataLoader(self._load_patients_by_emails)
     
     async def initialize(self):
         """Initialize database connection"""
         return await self.db.connect()
     
     async def cleanup(self):
-        """Cleanup database connection"""
-        return await self.db.disconnect()
+        """Release caches; the shared database is closed by the application lifespan"""
+        await patient_cache.close()
+        await patient_email_cache.close()
+        return True
+    
+    async def _load_patients_by_ids(self, patient_ids: List[str]) -> Dict[str, Patient]:
+        rows = await self.db.get_patients_by_ids(patient_ids)
+        return {key: Patient.from_row(row) for key, row in rows.items()}
     
-    async def create_patient(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _load_patients_by_emails(self, emails: List[str]) -> Dict[str, Patient]:
+        rows = await self.db.get_patients_by_emails(emails)
+        return {key: Patient.from_row(row) for key, row in rows.items()}
+    
+    async def create_patient(self, patient_data: Dict[str, Any]) -> Patient:
         """Create a new patient with validation"""
-        try:
-            # Validate required fields
-            required_fields = ['email', 'name']
-            for field in required_fields:
-                if not patient_data.get(field):
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Check if patient already exists
-            existing_patient = await self.db.get_patient_by_email(patient_data['email'])
-            if existing_patient:
-                raise ValueError(f"Patient with email {patient_data['email']} already exists")
-            
-            # Create patient
-            patient_id = await self.db.create_patient(patient_data)
-            
-            # Return created patient
-            return await self.db.get_patient(patient_id)
-            
-        except Exception as e:
-            raise Exception(f"Failed to create patient: {str(e)}")
+        # Validate required fields
+        missing = [field for field in REQUIRED_PATIENT_FIELDS if not patient_data.get(field)]
+        if missing:
+            raise ValidationError(f"Missing required field: {missing[0]}")
+        
+        # Insert and read back in one statement; a duplicate email inserts nothing
+        patient = await self.db.create_patient_returning(patient_data)
+        if patient is None:
+            raise PatientAlreadyExists(f"Patient with email {patient_data['email']} already exists")
+        
+        return Patient.from_row(patient)
     
-    async def get_patient(self, patient_id: str) -> Optional[Dict[str, Any]]:
+    async def get_patient(self, patient_id: str) -> Optional[Patient]:
         """Get patient by ID"""
+        # Malformed IDs cannot match a row; reject them without a cache or database lookup
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return None
         try:
-            return await self.db.get_patient(patient_id)
-        except Exception as e:
-            print(f"Error retrieving patient: {e}")
+            return await patient_cache.get_or_load(patient_id, lambda: self._patient_loader.load(patient_id))
+        except Exception:
+            logger.exception("Error retrieving patient")
             return None
     
-    async def get_patient_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+    async def get_patient_by_email(self, email: str) -> Optional[Patient]:
         """Get patient by email"""
         try:
-            return await self.db.get_patient_by_email(email)
-        except Exception as e:
-            print(f"Error retrieving patient by email: {e}")
+            return await patient_email_cache.get_or_load(email, lambda: self._patient_email_loader.load(email))
+        except Exception:
+            logger.exception("Error retrieving patient by email")
             return None
     
-    async def update_patient(self, patient_id: str, patient_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Update patient information"""
+    async def get_patients_by_ids(self, patient_ids: List[str]) -> Dict[str, Patient]:
+        """Get several patients by ID, loading every cache miss in one query"""
+        patient_ids = [pid for pid in map(parse_id, patient_ids) if pid is not None]
         try:
-            # Check if patient exists
-            existing_patient = await self.db.get_patient(patient_id)
-            if not existing_patient:
-                raise ValueError(f"Patient with ID {patient_id} not found")
-            
-            # Update patient
-            success = await self.db.update_patient(patient_id, patient_data)
-            if not success:
-                raise Exception("Failed to update patient")
-            
-            # Return updated patient
-            return await self.db.get_patient(patient_id)
-            
-        except Exception as e:
-            raise Exception(f"Failed to update patient: {str(e)}")
+            return await patient_cache.get_many_or_load(patient_ids, self._load_patients_by_ids)
+        except Exception:
+            logger.exception("Error retrieving patients")
+            return {}
+    
+    async def get_patients_by_emails(self, emails: List[str]) -> Dict[str, Patient]:
+        """Get several patients by email, loading every cache miss in one query"""
+        try:
+            return await patient_email_cache.get_many_or_load(emails, self._load_patients_by_emails)
+        except Exception:
+            logger.exception("Error retrieving patients by email")
+            return {}
+    
+    async def update_patient(self, patient_id: str, patient_data: Dict[str, Any]) -> Patient:
+        """Update patient information"""
+        canonical_id = parse_id(patient_id)
+        if canonical_id is None:
+            raise PatientNotFound(patient_id)
+        patient_id = canonical_id
+        
+        # Existence check, update and read-back in one statement
+        patient = await self.db.update_patient_returning(patient_id, patient_data)
+        if patient is None:
+            raise PatientNotFound(patient_id)
+        
+        # email is not updatable, so the returned row names the cached email key
+        await self._invalidate_patient(str(patient['id']), patient['email'])
+        return Patient.from_row(patient)
     
     async def delete_patient(self, patient_id: str) -> bool:
         """Delete patient and all associated records"""
-        try:
-            # Check if patient exists
-            existing_patient = await self.db.get_patient(patient_id)
-            if not existing_patient:
-                raise ValueError(f"Patient with ID {patient_id} not found")
-            
-            # Delete patient (this will cascade to medical records and appointments)
-            return await self.db.delete_patient(patient_id)
-            
-        except Exception as e:
-            raise Exception(f"Failed to delete patient: {str(e)}")
+        canonical_id = parse_id(patient_id)
+        if canonical_id is None:
+            raise PatientNotFound(patient_id)
+        patient_id = canonical_id
+        
+        # Delete patient with its medical records; the deleted record ids come back for cache eviction
+        deleted_patient = await self.db.delete_patient_returning(patient_id)
+        if deleted_patient is None:
+            raise PatientNotFound(patient_id)
+        
+        await self._invalidate_patient(str(deleted_patient['id']), deleted_patient['email'])
+        await record_cache.invalidate(*(str(record_id) for record_id in deleted_patient['record_ids']))
+        await patient_records_cache.invalidate(patient_id)
+        return True
     
-    async def search_patients(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    async def _invalidate_patient(self, patient_id: str, email: str):
+        """Evict a patient from the ID and email caches"""
+        await patient_cache.invalidate(patient_id)
+        await patient_email_cache.invalidate(email)
+    
+    async def search_patients(self, query: str, limit: int = 20) -> List[Patient]:
         """Search patients by name, email, or phone"""
         try:
-            if not query or len(query.strip()) < 2:
+            query = query.strip() if query else ''
+            if len(query) < 2:
                 return []
             
-            return await self.db.search_patients(query.strip(), limit)
+            return [Patient.from_row(row) for row in await self.db.search_patients(query, limit)]
             
-        except Exception as e:
-            print(f"Error searching patients: {e}")
+        except Exception:
+            logger.exception("Error searching patients")
             return []
     
     async def get_patient_statistics(self, patient_id: str) -> Dict[str, Any]:
         """Get comprehensive patient health statistics"""
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return {}
         try:
-            # Get basic statistics
-            stats = await self.db.get_patient_statistics(patient_id)
-            
-            # Get patient info
-            patient = await self.db.get_patient(patient_id)
-            if patient:
-                stats['patient_info'] = {
-                    'name': patient['name'],
-                    'email': patient['email'],
-                    'age': self._calculate_age(patient.get('date_of_birth')),
-                    'blood_type': patient.get('blood_type'),
-                    'allergies': patient.get('allergies', [])
-                }
+            # Statistics and the patient's profile fields in a single database call
+            bundle = await self.db.get_patient_stats_bundle(patient_id)
+            if not bundle:
+                return {}
             
+            patient = bundle['patient']
+            stats = bundle['statistics']
+            stats['patient_info'] = {
+                'name': patient['name'],
+                'email': patient['email'],
+                'age': self._calculate_age(patient.get('date_of_birth')),
+                'blood_type': patient.get('blood_type'),
+                'allergies': patient.get('allergies') or []
+            }
             return stats
             
-        except Exception as e:
-            print(f"Error getting patient statistics: {e}")
+        except Exception:
+            logger.exception("Error getting patient statistics")
             return {}
     
     async def get_condition_history(self, patient_id: str, condition: str) -> List[Dict[str, Any]]:
         """Get history of specific condition for a patient"""
         try:
             return await self.db.get_condition_history(patient_id, condition)
-        except Exception as e:
-            print(f"Error getting condition history: {e}")
+        except Exception:
+            logger.exception("Error getting condition history")
             return []
     
-    def _calculate_age(self, date_of_birth: str) -> Optional[int]:
+    @staticmethod
+    def _calculate_age(date_of_birth: Union[str, date, None]) -> Optional[int]:
         """Calculate age from date of birth"""
+        if not date_of_birth:
+            return None
         try:
-            if not date_of_birth:
-                return None
-            
-            dob = datetime.fromisoformat(date_of_birth.replace('Z', '+00:00'))
-            today = datetime.now()
-            age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-            return age
-        except:
+            # PostgreSQL returns a date, SQLite an ISO string
+            dob = date_of_birth if isinstance(date_of_birth, date) else _parse_date_of_birth(date_of_birth)
+        except (TypeError, ValueError):
             return None
+        
+        today = date.today()
+        return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
     
     async def get_patient_summary(self, patient_id: str) -> Dict[str, Any]:
         """Get a comprehensive patient summary"""
+        patient_id = parse_id(patient_id)
+        if patient_id is None:
+            return {}
         try:
-            patient = await self.db.get_patient(patient_id)
-            if not patient:
+            # Patient, recent medical records and statistics in a single database call
+            summary = await self.db.get_patient_summary_bundle(patient_id, recent_limit=5)
+            if not summary:
                 return {}
             
-            # Get recent medical records
-            recent_records = await self.db.get_medical_history(patient_id, limit=5)
-            
-            # Get statistics
-            stats = await self.db.get_patient_statistics(patient_id)
-            
-            return {
-                "patient": patient,
-                "recent_records": recent_records,
-                "statistics": stats,
-                "summary_generated_at": datetime.now().isoformat()
-            }
+            summary["summary_generated_at"] = now_iso()
+            return summary
             
-        except Exception as e:
-            print(f"Error getting patient summary: {e}")
+        except Exception:
+            logger.exception("Error getting patient summary")
             return {} 
\ No newline at end of file
@@ -1,7 +1,10 @@
+import logging
 from pathlib import Path
 import torch
 from models.ultrasound_model import load_ultrasound_model, predict_ultrasound
 
+logger = logging.getLogger(__name__)
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_ULTRASOUND_CHECKPOINT = PROJECT_ROOT / 'model_assests' / 'ultrasound' / 'USFM_latest.pth'
 
@@ -16,7 +19,7 @@ def init_ultrasound_model(device: str = 'cpu', checkpoint_path: Path = DEFAULT_U
 try:
     init_ultrasound_model()
 except Exception as e:
-    print(f"Warning: could not load ultrasound model: {e}")
+    logger.warning("Could not load ultrasound model: %s", e)
 
 def process_ultrasound(image_path: str, device: str = 'cpu', top_k: int = 2):
     if _ultrasound_model is None:
@@ -1,10 +1,13 @@
 # backend/services/xray_service.py
 
+import logging
 import os
 from pathlib import Path
 import torch
 from models.xray_model import load_chexnet_model, predict_xray
 
+logger = logging.getLogger(__name__)
+
 # Resolve project root and weight path
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_WEIGHT_PATH = PROJECT_ROOT / 'model_assests' / 'xray' / 'xray.pth.tar'
@@ -27,7 +30,7 @@ def init_xray_model(weight_path: Path = DEFAULT_WEIGHT_PATH, device: str = 'cpu'
 try:
     init_xray_model()
 except Exception as e:
-    print(f"Warning: could not load X-ray model: {e}")
+    logger.warning("Could not load X-ray model: %s", e)
 
 
 def process_xray(image_path: str, device: str = 'cpu', top_k: int = 3) -> list:
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from database.admin_manager import AdminDatabaseManager
+from database.clock import utc_now
+from database.ids import new_id
+from models.admin_models import ContentFlag, ModerationAction, ModerationStatus
+
+
+@pytest.fixture
+def admin_db(sqlite_db):
+    manager = AdminDatabaseManager(sqlite_db)
+    asyncio.run(manager.create_admin_tables())
+    return manager
+
+
+def _stored_flag(admin_db):
+    flag = ContentFlag(id=new_id(), content_type="record", content_id=new_id(), reason="spam", timestamp=utc_now())
+    assert asyncio.run(admin_db.store_content_flags([flag]))
+    return flag
+
+
+def _action(flag_id):
+    return ModerationAction(
+        id=new_id(), admin_id="admin-1", admin_email="admin@example.com", target_type="content_flag",
+        target_id=flag_id, action_type="remove", status=ModerationStatus.REJECTED, timestamp=utc_now()
+    )
+
+
+def _flag_row(admin_db, flag_id):
+    return admin_db.db.execute("SELECT status, admin_notes FROM content_flags WHERE id = ?", (flag_id,)).fetchone()
+
+
+def _action_count(admin_db):
+    return admin_db.db.execute("SELECT COUNT(*) FROM moderation_actions").fetchone()[0]
+
+
+def test_moderate_flag_updates_flag_and_records_action(admin_db):
+    flag = _stored_flag(admin_db)
+
+    assert asyncio.run(admin_db.moderate_flag(flag.id, ModerationStatus.REJECTED, "spam", _action(flag.id)))
+
+    assert tuple(_flag_row(admin_db, flag.id)) == ("rejected", "spam")
+    assert _action_count(admin_db) == 1
+
+
+def test_moderate_missing_flag_records_nothing(admin_db):
+    missing_id = new_id()
+
+    assert not asyncio.run(admin_db.moderate_flag(missing_id, ModerationStatus.REJECTED, None, _action(missing_id)))
+
+    assert _action_count(admin_db) == 0
+
+
+def test_failed_action_insert_leaves_flag_pending(admin_db):
+    flag = _stored_flag(admin_db)
+    admin_db.db.execute(
+        "CREATE TRIGGER block_actions BEFORE INSERT ON moderation_actions BEGIN SELECT RAISE(ABORT, 'blocked'); END"
+    )
+
+    assert not asyncio.run(admin_db.moderate_flag(flag.id, ModerationStatus.REJECTED, "spam", _action(flag.id)))
+    # A later commit from another method must not commit the flag update on its own
+    admin_db.db.commit()
+
+    assert tuple(_flag_row(admin_db, flag.id)) == ("pending", None)
+    assert _action_count(admin_db) == 0
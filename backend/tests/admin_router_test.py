@@ -0,0 +1,86 @@
+import asyncio
+import csv
+import io
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database.admin_manager import USER_ACTIVITY_COLUMNS, UserActivityRow
+from database.clock import utc_now
+from database.config import DatabaseConfig
+from database.ids import new_id
+from database.sqlite_manager import SQLiteManager
+from models.admin_models import ActivityType
+from routers import admin_router
+from services import admin_service
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The TestClient serves from its own thread; the SQLite connection must be opened there
+    await DatabaseConfig.open_shared_database()
+    await admin_router.get_admin_service()
+    yield
+    await admin_router.shutdown_admin_service()
+    await DatabaseConfig.close_shared_database()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(admin_service, "ANALYTICS_REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(DatabaseConfig, "_shared_manager", SQLiteManager(str(tmp_path / "test.db")))
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(admin_router.router)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+async def _store_activities(count):
+    service = await admin_router.get_admin_service()
+    start = utc_now()
+    await service.admin_db.log_user_activities([
+        UserActivityRow(
+            id=new_id(), activity_type=ActivityType.LOGIN, description=f"login {i}",
+            timestamp=start + timedelta(seconds=i), user_id="user-1"
+        )
+        for i in range(count)
+    ])
+
+
+def test_csv_export_streams_header_and_rows(client):
+    client.portal.call(_store_activities, 3)
+
+    response = client.get("/api/admin/export/logs", params={"log_type": "user_activities", "format": "csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="user_activities_logs.csv"' in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert tuple(rows[0]) == USER_ACTIVITY_COLUMNS
+    # Newest first
+    assert [row[USER_ACTIVITY_COLUMNS.index("description")] for row in rows[1:]] == ["login 2", "login 1", "login 0"]
+
+
+def test_csv_export_rejects_unknown_log_type(client):
+    response = client.get("/api/admin/export/logs", params={"log_type": "audit", "format": "csv"})
+
+    assert response.status_code == 400
+
+
+def test_stream_csv_flushes_in_chunks():
+    async def rows():
+        for i in range(50):
+            yield (i, f"row {i}")
+
+    async def collect():
+        return [chunk async for chunk in admin_router._stream_csv(("id", "name"), rows(), chunk_size=64)]
+
+    chunks = asyncio.run(collect())
+
+    assert len(chunks) > 1
+    parsed = list(csv.reader(io.StringIO("".join(chunks))))
+    assert parsed[0] == ["id", "name"]
+    assert parsed[1:] == [[str(i), f"row {i}"] for i in range(50)]
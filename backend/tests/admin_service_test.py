@@ -0,0 +1,47 @@
+import asyncio
+
+from models.admin_models import ActivityType
+from services import admin_service
+from services.admin_service import AdminService
+
+
+def test_queued_logs_are_flushed_in_batches_and_drained_on_cleanup(sqlite_db, monkeypatch):
+    monkeypatch.setattr(admin_service, "LOG_BATCH_SIZE", 3)
+    monkeypatch.setattr(admin_service, "ANALYTICS_REFRESH_INTERVAL", 0)
+
+    async def scenario():
+        service = AdminService()
+        assert await service.initialize()
+        batch_sizes = []
+        write = service.admin_db.log_user_activities
+
+        async def recording_write(activities):
+            batch_sizes.append(len(activities))
+            return await write(activities)
+
+        service.admin_db.log_user_activities = recording_write
+        for i in range(7):
+            await service.log_user_activity(ActivityType.LOGIN, f"login {i}", user_id="user-1")
+
+        assert await service.cleanup()
+        assert service._flusher is None
+        return batch_sizes
+
+    batch_sizes = asyncio.run(scenario())
+
+    assert sum(batch_sizes) == 7
+    assert max(batch_sizes) <= 3
+    count = sqlite_db.connection.execute("SELECT COUNT(*) FROM user_activity_logs").fetchone()[0]
+    assert count == 7
+
+
+def test_full_log_queue_drops_the_oldest_entry(sqlite_db, monkeypatch):
+    monkeypatch.setattr(admin_service, "LOG_QUEUE_MAXSIZE", 2)
+
+    async def scenario():
+        service = AdminService()
+        for entry in ("first", "second", "third"):
+            service._enqueue_log(entry)
+        return [service._log_queue.get_nowait() for _ in range(service._log_queue.qsize())]
+
+    assert asyncio.run(scenario()) == ["second", "third"]
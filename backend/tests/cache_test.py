@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from services.cache import TieredCache, _BroadcastInvalidation
+
+
+class InMemoryRedis:
+    """Stand-in for RedisCache whose writes yield to the event loop like a network call"""
+
+    enabled = False
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def get_many(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, payload, ttl):
+        await asyncio.sleep(0)
+        self.data[key] = payload
+
+    async def set_many(self, payloads, ttl):
+        await asyncio.sleep(0)
+        self.data.update(payloads)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def publish(self, channel, payload):
+        pass
+
+    async def close(self):
+        pass
+
+
+def _cache():
+    cache = TieredCache("test")
+    cache.l2 = InMemoryRedis()
+    return cache
+
+
+def test_invalidate_during_load_is_not_cached():
+    async def scenario():
+        cache = _cache()
+        loaded = asyncio.Event()
+        release = asyncio.Event()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            loaded.set()
+            await release.wait()
+            return {"name": "old"}
+
+        load = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await loaded.wait()
+        await cache.invalidate("k")
+        release.set()
+
+        assert await load == {"name": "old"}
+        assert cache.l1.get("k") is None
+        assert cache.l2.data == {}
+
+        async def fresh():
+            calls.append(1)
+            return {"name": "new"}
+
+        assert await cache.get_or_load("k", fresh) == {"name": "new"}
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_during_redis_write_removes_stale_copy():
+    async def scenario():
+        cache = _cache()
+        write_started = asyncio.Event()
+        release = asyncio.Event()
+        store = cache.l2.set
+
+        async def slow_set(key, payload, ttl):
+            write_started.set()
+            await release.wait()
+            await store(key, payload, ttl)
+
+        cache.l2.set = slow_set
+
+        async def loader():
+            return {"name": "old"}
+
+        load = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await write_started.wait()
+        # The invalidation's Redis delete lands before the load's write does
+        await cache.invalidate("k")
+        release.set()
+        await load
+
+        assert cache.l1.get("k") is None
+        assert cache.l2.data == {}
+
+    asyncio.run(scenario())
+
+
+def test_batch_load_skips_keys_invalidated_meanwhile():
+    async def scenario():
+        cache = _cache()
+        release = asyncio.Event()
+
+        async def loader(keys):
+            await release.wait()
+            return {key: f"old-{key}" for key in keys}
+
+        load = asyncio.ensure_future(cache.get_many_or_load(["a", "b"], loader))
+        await asyncio.sleep(0)
+        await cache.invalidate("a")
+        release.set()
+
+        assert await load == {"a": "old-a", "b": "old-b"}
+        assert cache.l1.get("a") is None
+        assert cache.l1.get("b") == "old-b"
+        assert "test:a" not in cache.l2.data
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_cache_without_local_eviction_fails_at_construction():
+    class Incomplete(_BroadcastInvalidation):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete")
@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+
+from database import clock
+
+
+def test_now_iso_is_utc_and_formatted_once_per_second(monkeypatch):
+    monkeypatch.setattr(clock, "_now_iso_cache", (0, ""))
+    monkeypatch.setattr(clock.time, "time", lambda: 1_700_000_000.25)
+    first = clock.now_iso()
+
+    monkeypatch.setattr(clock.time, "time", lambda: 1_700_000_000.75)
+    assert clock.now_iso() is first
+    assert datetime.fromisoformat(first) == datetime.fromtimestamp(1_700_000_000, timezone.utc)
+
+    monkeypatch.setattr(clock.time, "time", lambda: 1_700_000_001.0)
+    assert clock.now_iso() == "2023-11-14T22:13:21+00:00"
@@ -0,0 +1,24 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Tests import backend modules the way main.py does (services.*, database.*)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.config import DatabaseConfig
+from database.sqlite_manager import SQLiteManager
+
+# Manual model scripts: they need the weights and an image path, so pytest skips them
+collect_ignore = ["ct_model_test.py", "mri_inspect.py", "ultrasound_model_test.py", "xray_model_test.py"]
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Connected SQLiteManager on a fresh database file, installed as the shared manager"""
+    manager = SQLiteManager(str(tmp_path / "test.db"))
+    asyncio.run(manager.connect())
+    monkeypatch.setattr(DatabaseConfig, "_shared_manager", manager)
+    yield manager
+    asyncio.run(manager.disconnect())
@@ -0,0 +1,34 @@
+import asyncio
+
+from services.dataloader import DataLoader
+
+
+def test_batched_results_come_back_to_each_caller_in_order():
+    async def scenario():
+        batches = []
+
+        async def batch_fn(keys):
+            batches.append(keys)
+            return {key: key * 10 for key in keys if key != 3}
+
+        loader = DataLoader(batch_fn)
+        keys = [5, 1, 3, 1, 4]
+        results = await asyncio.gather(*(loader.load(key) for key in keys))
+
+        assert results == [50, 10, None, 10, 40]
+        assert batches == [[5, 1, 3, 4]]
+
+    asyncio.run(scenario())
+
+
+def test_batch_failure_reaches_every_caller():
+    async def scenario():
+        async def batch_fn(keys):
+            raise RuntimeError("database down")
+
+        loader = DataLoader(batch_fn)
+        results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+        assert [str(result) for result in results] == ["database down", "database down"]
+
+    asyncio.run(scenario())
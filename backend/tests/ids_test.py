@@ -0,0 +1,20 @@
+import uuid
+
+from database import ids
+
+
+def test_new_id_is_monotonic_within_one_millisecond(monkeypatch):
+    monkeypatch.setattr(ids.time, "time_ns", lambda: 1_700_000_000_000_000_000)
+
+    generated = [ids.new_id() for _ in range(5000)]
+
+    assert generated == sorted(generated)
+    assert len(set(generated)) == len(generated)
+    assert all(uuid.UUID(value).version == 7 for value in generated)
+
+
+def test_parse_id_canonicalizes_and_rejects():
+    value = ids.new_id()
+
+    assert ids.parse_id(value.upper()) == value
+    assert ids.parse_id("not-a-uuid") is None
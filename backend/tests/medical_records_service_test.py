@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from services.medical_records_service import MedicalRecordsService, patient_records_cache, record_cache
+from services.patient_service import PatientService, patient_cache, patient_email_cache
+
+
+@pytest.fixture
+def services(sqlite_db, tmp_path, monkeypatch):
+    for cache in (patient_cache, patient_email_cache, record_cache):
+        cache.l1.clear()
+    patient_records_cache.buckets.clear()
+    monkeypatch.chdir(tmp_path)
+    return PatientService(), MedicalRecordsService()
+
+
+def _diagnoses(records):
+    return sorted(record["diagnosis"] for record in records)
+
+
+def test_record_writes_invalidate_cached_history(services):
+    patients, records = services
+
+    async def scenario():
+        patient = await patients.create_patient({"name": "Alice A", "email": "alice@example.com"})
+        first = await records.create_medical_record(patient.id, {"record_type": "xray", "modality": "xray", "diagnosis": "Flu"})
+        assert _diagnoses(await records.get_medical_history(patient.id)) == ["Flu"]
+        assert (await records.get_records_summary(patient.id))["total_records"] == 1
+
+        await records.create_medical_record(patient.id, {"record_type": "ct", "modality": "ct", "diagnosis": "Cold"})
+        assert _diagnoses(await records.get_medical_history(patient.id)) == ["Cold", "Flu"]
+        assert (await records.get_records_summary(patient.id))["total_records"] == 2
+
+        await records.update_medical_record(first["id"], {"diagnosis": "Asthma"})
+        assert _diagnoses(await records.get_medical_history(patient.id)) == ["Asthma", "Cold"]
+        assert (await records.get_medical_record(first["id"]))["diagnosis"] == "Asthma"
+
+        await records.delete_medical_record(first["id"])
+        assert _diagnoses(await records.get_medical_history(patient.id)) == ["Cold"]
+        assert await records.get_medical_record(first["id"]) is None
+
+    asyncio.run(scenario())
+
+
+def test_uppercase_ids_share_the_canonical_cache_entries(services):
+    patients, records = services
+
+    async def scenario():
+        patient = await patients.create_patient({"name": "Alice A", "email": "alice@example.com"})
+        record = await records.create_medical_record(
+            patient.id.upper(), {"record_type": "xray", "modality": "xray", "diagnosis": "Flu"}
+        )
+        assert _diagnoses(await records.get_medical_history(patient.id.upper())) == ["Flu"]
+        assert (await records.get_medical_record(record["id"].upper()))["diagnosis"] == "Flu"
+
+        await records.update_medical_record(record["id"].upper(), {"diagnosis": "Cold"})
+
+        assert _diagnoses(await records.get_medical_history(patient.id.upper())) == ["Cold"]
+        assert (await records.get_medical_record(record["id"].upper()))["diagnosis"] == "Cold"
+        assert await records.get_medical_history("not-a-uuid") == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+mri_service = pytest.importorskip("services.mri_service")
+
+
+def test_mri_batcher_returns_rows_in_submission_order(monkeypatch):
+    def predict(model, batch, mode, device):
+        # Row i echoes the first value of scan i, so ordering mistakes show up
+        return [row.flatten()[:1].tolist() for row in batch]
+
+    monkeypatch.setattr(mri_service, "predict_mri_batch", predict)
+    monkeypatch.setitem(mri_service._cache_mri, "3d", object())
+
+    async def scenario():
+        batcher = mri_service.MRIBatcher("3d", "cpu", max_batch=4, window=0.05)
+        try:
+            scans = [torch.full((1, 2, 2), float(i)) for i in range(6)]
+            results = await asyncio.gather(*(batcher.submit(scan) for scan in scans))
+        finally:
+            await batcher.close()
+        assert results == [[float(i)] for i in range(6)]
+
+    asyncio.run(scenario())
+
+
+def test_close_during_inference_fails_the_running_batch(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def predict(model, batch, mode, device):
+        started.set()
+        release.wait(5)
+        return [[0.0] for _ in batch]
+
+    monkeypatch.setattr(mri_service, "predict_mri_batch", predict)
+    monkeypatch.setitem(mri_service._cache_mri, "3d", object())
+
+    async def scenario():
+        batcher = mri_service.MRIBatcher("3d", "cpu", max_batch=1, window=0)
+        pending = asyncio.ensure_future(batcher.submit(torch.zeros((1, 2, 2))))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        await batcher.close()
+        try:
+            with pytest.raises(RuntimeError, match="shut down"):
+                await asyncio.wait_for(pending, 1)
+        finally:
+            release.set()
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database.config import DatabaseConfig
+from database.sqlite_manager import SQLiteManager
+from routers import patient_router
+from services.medical_records_service import patient_records_cache, record_cache
+from services.patient_service import patient_cache, patient_email_cache
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The TestClient serves from its own thread; the SQLite connection must be opened there
+    await DatabaseConfig.open_shared_database()
+    yield
+    await patient_router.shutdown_patient_services()
+    await DatabaseConfig.close_shared_database()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for cache in (patient_cache, patient_email_cache, record_cache):
+        cache.l1.clear()
+    patient_records_cache.buckets.clear()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(DatabaseConfig, "_shared_manager", SQLiteManager(str(tmp_path / "test.db")))
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(patient_router.router)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _create_record(client, **fields):
+    patient = client.post("/api/patients/", json={"name": "Alice A", "email": "alice@example.com"}).json()
+    record = client.post(
+        f"/api/patients/{patient['id']}/medical-records",
+        json={"record_type": "xray", "modality": "xray", **fields}
+    ).json()
+    return patient, record
+
+
+async def _set_image_path(record_id, image_path):
+    connection = DatabaseConfig.get_shared_database_manager().connection
+    connection.execute("UPDATE medical_records SET image_path = ? WHERE id = ?", (image_path, record_id))
+    connection.commit()
+
+
+def test_etag_is_the_same_for_datetime_and_redis_string():
+    updated_at = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    from_redis = orjson.loads(orjson.dumps(updated_at))
+
+    assert patient_router._etag("r1", updated_at) == patient_router._etag("r1", from_redis)
+
+
+def test_record_revalidates_with_304_until_it_changes(client):
+    _, record = _create_record(client)
+    url = f"/api/patients/medical-records/{record['id']}"
+
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    client.put(url, json={"diagnosis": "Cold"})
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_record_etag_ignores_id_spelling(client):
+    _, record = _create_record(client)
+
+    lower = client.get(f"/api/patients/medical-records/{record['id']}")
+    upper = client.get(f"/api/patients/medical-records/{record['id'].upper()}")
+
+    assert lower.headers["etag"] == upper.headers["etag"]
+
+
+def test_image_is_immutable_and_revalidates_with_304(client, tmp_path):
+    image = tmp_path / "scan.png"
+    image.write_bytes(b"\x89PNG fake")
+    _, record = _create_record(client)
+    client.portal.call(_set_image_path, record["id"], str(image))
+    record_cache.l1.clear()
+    url = f"/api/patients/medical-records/{record['id']}/image"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.content == b"\x89PNG fake"
+    assert "immutable" in first.headers["cache-control"]
+
+    assert client.get(url, headers={"If-None-Match": first.headers["etag"]}).status_code == 304
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from services.exceptions import PatientAlreadyExists, PatientNotFound
+from services.medical_records_service import MedicalRecordsService, record_cache
+from services.patient_service import PatientService, patient_cache, patient_email_cache
+
+
+@pytest.fixture
+def service(sqlite_db, tmp_path, monkeypatch):
+    # Module-level caches outlive a test; start each one empty
+    for cache in (patient_cache, patient_email_cache, record_cache):
+        cache.l1.clear()
+    monkeypatch.chdir(tmp_path)
+    return PatientService()
+
+
+def test_duplicate_email_raises_patient_already_exists(service):
+    async def scenario():
+        await service.create_patient({"name": "Alice A", "email": "alice@example.com"})
+        with pytest.raises(PatientAlreadyExists):
+            await service.create_patient({"name": "Other", "email": "alice@example.com"})
+
+    asyncio.run(scenario())
+
+
+def test_partial_update_keeps_unmentioned_fields(service):
+    async def scenario():
+        created = await service.create_patient({
+            "name": "Alice A", "email": "alice@example.com", "phone": "111",
+            "blood_type": "O+", "allergies": ["penicillin"]
+        })
+
+        updated = await service.update_patient(created.id, {"phone": "222"})
+
+        assert updated.phone == "222"
+        assert updated.name == "Alice A"
+        assert updated.blood_type == "O+"
+        assert updated.allergies == ["penicillin"]
+        assert (await service.get_patient(created.id)).phone == "222"
+
+    asyncio.run(scenario())
+
+
+def test_update_missing_patient_raises(service):
+    async def scenario():
+        with pytest.raises(PatientNotFound):
+            await service.update_patient("00000000-0000-0000-0000-000000000000", {"phone": "1"})
+
+    asyncio.run(scenario())
+
+
+def test_delete_removes_patient_and_records(service):
+    async def scenario():
+        records = MedicalRecordsService()
+        patient = await service.create_patient({"name": "Alice A", "email": "alice@example.com"})
+        record = await records.create_medical_record(patient.id, {"record_type": "xray", "modality": "xray"})
+        assert await records.get_medical_record(record["id"]) is not None
+
+        assert await service.delete_patient(patient.id) is True
+
+        assert await service.get_patient(patient.id) is None
+        assert await records.get_medical_record(record["id"]) is None
+        with pytest.raises(PatientNotFound):
+            await service.delete_patient(patient.id)
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from database.postgres_manager import PostgresManager, request_connection_slots
+
+
+class CountingPool:
+    """Stand-in for an asyncpg pool that records how many connections are held at once"""
+
+    def __init__(self):
+        self.in_use = 0
+        self.peak = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        try:
+            yield object()
+        finally:
+            self.in_use -= 1
+
+
+async def _hold_connections(manager, count, pool=None):
+    async def hold():
+        async with manager._acquire(pool):
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(hold() for _ in range(count)))
+
+
+def test_request_holds_at_most_its_connection_slots():
+    manager = PostgresManager("postgresql://unused")
+    manager.pool = CountingPool()
+
+    async def scenario():
+        request_connection_slots.set(asyncio.Semaphore(2))
+        await _hold_connections(manager, 5)
+
+    asyncio.run(scenario())
+
+    assert manager.pool.peak == 2
+    assert manager.pool.in_use == 0
+
+
+def test_cap_also_covers_the_bulk_pool():
+    manager = PostgresManager("postgresql://unused")
+    manager.pool = CountingPool()
+    bulk_pool = CountingPool()
+
+    async def scenario():
+        request_connection_slots.set(asyncio.Semaphore(1))
+        await _hold_connections(manager, 3, pool=bulk_pool)
+
+    asyncio.run(scenario())
+
+    assert bulk_pool.peak == 1
+    assert manager.pool.peak == 0
+
+
+def test_work_outside_a_request_is_not_capped():
+    manager = PostgresManager("postgresql://unused")
+    manager.pool = CountingPool()
+
+    asyncio.run(_hold_connections(manager, 5))
+
+    assert manager.pool.peak == 5
+
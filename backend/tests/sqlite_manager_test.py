@@ -0,0 +1,60 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database.sqlite_manager import SQLiteManager
+
+MISSING_PATIENT_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def _patient_with_record(sqlite_db):
+    async def create():
+        patient = await sqlite_db.create_patient_returning({"name": "Alice A", "email": "alice@example.com"})
+        record_id = await sqlite_db.add_medical_record(patient["id"], {"record_type": "xray", "modality": "xray"})
+        return patient, record_id
+    return asyncio.run(create())
+
+
+def test_add_medical_record_for_missing_patient_returns_none(sqlite_db):
+    record_id = asyncio.run(sqlite_db.add_medical_record(MISSING_PATIENT_ID, {"record_type": "xray", "modality": "xray"}))
+
+    assert record_id is None
+    assert sqlite_db.connection.execute("SELECT COUNT(*) FROM medical_records").fetchone()[0] == 0
+
+
+def test_delete_patient_returning_reports_cascaded_records(sqlite_db):
+    patient, record_id = _patient_with_record(sqlite_db)
+
+    async def scenario():
+        deleted = await sqlite_db.delete_patient_returning(patient["id"])
+
+        assert deleted["email"] == "alice@example.com"
+        assert deleted["record_ids"] == [record_id]
+        assert await sqlite_db.get_medical_record(record_id) is None
+        assert await sqlite_db.delete_patient_returning(patient["id"]) is None
+
+    asyncio.run(scenario())
+
+
+def test_failed_patient_delete_keeps_its_records(sqlite_db):
+    patient, record_id = _patient_with_record(sqlite_db)
+    sqlite_db.connection.execute(
+        "CREATE TRIGGER block_patient_delete BEFORE DELETE ON patients BEGIN SELECT RAISE(ABORT, 'blocked'); END"
+    )
+
+    with pytest.raises(sqlite3.DatabaseError):
+        asyncio.run(sqlite_db.delete_patient_returning(patient["id"]))
+    # A later commit from another method must not commit half of the delete
+    sqlite_db.connection.commit()
+
+    assert asyncio.run(sqlite_db.get_medical_record(record_id)) is not None
+
+
+def test_connect_refuses_sqlite_without_returning(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, "sqlite_version_info", (3, 34, 1))
+    manager = SQLiteManager(str(tmp_path / "old.db"))
+
+    with pytest.raises(RuntimeError, match="3.35.0 or newer"):
+        asyncio.run(manager.connect())
+    assert manager.connection is None